@@ -1,13 +1,20 @@
 import os
-import json
-import requests
-import spacy
-import unicodedata
-import streamlit as st
-import rdflib
 import re
+import streamlit as st
 from dotenv import load_dotenv  
-from rdflib.plugins.sparql import prepareQuery
+from snapshot import load_or_build_snapshot
+from triple_store import TripleStore
+from year_index import build_year_index, describe_year_range
+from thumbnails import DerivativeCatalog
+from text_index import load_text_index
+from fuzzy_index import load_fuzzy_index
+from retrieval import build_retriever
+from facets import load_facets
+from backends import describe_backend, load_backend, select_documents
+from llm_cache import answer_key, get_answer_cache
+from llm_stream import GenerationStream, stream_answer
+from context_builder import NO_CONTEXT_MESSAGE, build_prompt, choose_max_new_tokens
+from metrics import span, start_metrics_server, summary_rows, trace
 
 # ------------------ Configuración inicial ------------------
 load_dotenv()
@@ -15,99 +22,96 @@ HF_API_TOKEN = os.getenv("HF_API_TOKEN")
 MODEL_NAME = "mistralai/Mixtral-8x7B-Instruct-v0.1"
 RDF_FILE = "dataset.ttl"
 METADATA_FILE = "metadata.json"
-
-# Cargar grafo RDF desde archivo local
-g = rdflib.Graph()
-g.parse(RDF_FILE, format="turtle")
-
-# Cargar metadatos del JSON
-with open(METADATA_FILE, "r", encoding="utf-8") as f:
-    metadata = json.load(f)
-
-# 📌 Extraer categorías clave del JSON
-def get_relevant_categories():
-    citation_fields = metadata["datasetVersion"]["metadataBlocks"]["citation"]["fields"]
-    keywords = [
-        kw["keywordValue"]["value"]
-        for field in citation_fields if field["typeName"] == "keyword"
-        for kw in field["value"]
-    ]
-    return keywords if keywords else ["Historia", "Fotografía", "Lima"]
-
-# 📌 Función para consultar el grafo RDF local con SPARQL
+PAGE_SIZE = 20
+
+# Endpoint /metrics de Prometheus si METRICS_PORT está definido (uno por proceso)
+start_metrics_server()
+
+# Cargar grafo RDF desde el snapshot binario (una vez por proceso, compartido entre sesiones).
+# Las consultas SPARQL van al backend configurado: el almacén local, o GraphDB con respaldo local
+@st.cache_resource
+def load_store():
+    with span("startup.load_store"):
+        snapshot = load_or_build_snapshot(RDF_FILE, METADATA_FILE)
+        store = TripleStore(snapshot)
+        year_index = build_year_index(store)
+        retriever = build_retriever(store, load_text_index(store), year_index, fuzzy_index=load_fuzzy_index(store))
+        return store, retriever, load_facets(store), DerivativeCatalog(METADATA_FILE), load_backend(store)
+
+store, retriever, facets, image_catalog, backend = load_store()
+
+# 📌 Filas del backend con los valores por defecto de la app
+def format_rows(rows):
+    return [{
+        "doc": row.get("doc"),
+        "title": str(row.get("title")),
+        "date": row.get("date") or "Fecha desconocida",
+        "creator": row.get("creator") or "Autor desconocido",
+        "subject": row.get("subject") or "Sin tema"
+    } for row in rows]
+
+# 📌 Función para consultar el grafo RDF con SPARQL (almacén local o GraphDB, según el backend)
 def query_rdf(sparql_query):
     try:
-        q = prepareQuery(sparql_query)
-        results = g.query(q)
-        return [{
-            "title": str(row.title),
-            "date": str(row.date) if row.date else "Fecha desconocida",
-            "creator": str(row.creator) if row.creator else "Autor desconocido",
-            "subject": str(row.subject) if row.subject else "Sin tema"
-        } for row in results]
+        return format_rows(backend.select(sparql_query))
     except Exception as e:
         print(f"Error en consulta SPARQL: {e}")
         return []
 
-# 📌 Extraer entidades clave de la pregunta
-def extract_year(question):
-    match = re.search(r"\b(1[89]\d{2}|20\d{2})\b", question)
-    return match.group(0) if match else None
-
 # 📌 Generar consulta SPARQL
 def generate_sparql_query(question):
-    year = extract_year(question)
     sparql_query = """
     PREFIX dc: <http://purl.org/dc/elements/1.1/>
-    SELECT ?title ?date ?creator ?subject WHERE {
+    SELECT ?doc ?title ?date ?creator ?subject WHERE {
         ?doc dc:title ?title .
         OPTIONAL { ?doc dc:date ?date }
         OPTIONAL { ?doc dc:creator ?creator }
         OPTIONAL { ?doc dc:subject ?subject }
+    }
     """
-    if year:
-        sparql_query += f'\n    FILTER(?date = "{year}"^^<http://www.w3.org/2001/XMLSchema#gYear>)'
-    
-    sparql_query += "\n} LIMIT 20"
     return sparql_query.strip()
 
-# 📌 Generar un resumen en formato de texto
-def generate_summary_text(documents, year_filter=None):
-    if not documents:
-        return f"No se encontraron documentos para el año {year_filter}."
-
-    categories = get_relevant_categories()
-    summary_text = f"Se han encontrado {len(documents)} documentos correspondientes al año {year_filter}. "
-
-    categorized_docs = {category: 0 for category in categories}
-    uncategorized_count = 0
-
-    for doc in documents:
-        subject = doc["subject"]
-        assigned = False
-        for category in categories:
-            if category.lower() in subject.lower():
-                categorized_docs[category] += 1
-                assigned = True
-                break
-        if not assigned:
-            uncategorized_count += 1
-
-    for category, count in categorized_docs.items():
-        if count > 0:
-            summary_text += f"En la categoría de {category}, se encontraron {count} documentos. "
-
+# 📌 Buscar documentos: una página de la recuperación híbrida (léxica + semántica) restringida por años
+def find_documents(question, cursor=None, page_size=PAGE_SIZE):
+    page = retriever.page(question, page_size, cursor)
+    if not len(page):
+        return [], page
+
+    with span("documents.select", unit="rows") as measured:
+        rows = select_documents(backend, [store.doc_iri(doc_id) for doc_id in page.doc_ids])
+        measured.set(size=len(rows))
+    if page.year_range is not None:
+        # Sólo las fechas dentro del rango, como el FILTER sobre ?date
+        start, end = page.year_range
+        rows = [row for row in rows if row["date"] and row["date"][:4].isdigit()
+                and (start is None or int(row["date"][:4]) >= start)
+                and (end is None or int(row["date"][:4]) <= end)]
+    return format_rows(rows), page
+
+# 📌 Generar un resumen en formato de texto (conteos por categoría desde las facetas materializadas)
+def generate_summary_text(doc_ids, year_range=None):
+    if not len(doc_ids):
+        return f"No se encontraron documentos para {describe_year_range(year_range)}."
+
+    summary_text = f"Se han encontrado {len(doc_ids)} documentos correspondientes a {describe_year_range(year_range)}. "
+
+    categorized_docs = dict(facets.counts("category", doc_ids))
+    for category in facets.categories:
+        if categorized_docs.get(category):
+            summary_text += f"En la categoría de {category}, se encontraron {categorized_docs[category]} documentos. "
+
+    uncategorized_count = facets.count_missing("category", doc_ids)
     if uncategorized_count > 0:
         summary_text += f"Además, hay {uncategorized_count} documentos sin una categoría específica."
 
     return summary_text.strip()
 
 # 📌 Generar la lista detallada de documentos sin modificar el formato previo
-def generate_detailed_list(documents, year_filter=None):
+def generate_detailed_list(documents, year_range=None):
     if not documents:
-        return f"**No se encontraron documentos para el año {year_filter}.**"
+        return f"**No se encontraron documentos para {describe_year_range(year_range)}.**"
 
-    summary = f"## Documentos detallados para el año {year_filter}\n\n"
+    summary = f"## Documentos detallados para {describe_year_range(year_range)}\n\n"
     grouped_docs = {}
 
     for doc in documents:
@@ -125,32 +129,69 @@ def generate_detailed_list(documents, year_filter=None):
 
     return summary.strip()
 
-# 📌 Generar respuesta con Mixtral
-def ask_mistral(question, summary_text):
-    headers = {"Authorization": f"Bearer {HF_API_TOKEN}"}
-    data = {
-        "inputs": f"Pregunta: {question}\nInformación relevante:\n{summary_text}",
-        "parameters": {"max_new_tokens": 250, "temperature": 0.3}
-    }
-    response = requests.post(f"https://api-inference.huggingface.co/models/{MODEL_NAME}", headers=headers, json=data)
-    return response.json()[0].get("generated_text", "Error en la generación de respuesta.") if response.status_code == 200 else "Error en Hugging Face API"
-
-# 📌 Procesar la pregunta y generar la respuesta en tres partes
+# 📌 Miniaturas de los documentos encontrados (derivadas pregeneradas, nunca los originales)
+def find_thumbnails(documents, limit=12):
+    thumbnails = []
+    doc_iris = list(dict.fromkeys(doc["doc"] for doc in documents if doc.get("doc")))
+    for doc_id in store.doc_ids_for_iris(doc_iris):
+        paths = image_catalog.for_record(store, doc_id)
+        if paths:
+            thumbnails.append((paths["thumb"], store.values("title", doc_id)[0]))
+        if len(thumbnails) >= limit:
+            break
+    return thumbnails
+
+# 📌 Generar respuesta con Mixtral (en streaming, en segundo plano)
+GENERATION_PARAMS = {"max_new_tokens": 250, "temperature": 0.3, "return_full_text": False}
+PROMPT_TEMPLATE = "Pregunta: {question}\nInformación relevante:\n{context}"
+
+# Respuestas guardadas en disco y compartidas entre sesiones; los errores no se guardan
+def ask_mistral(question, summary_text, doc_ids=()):
+    # Las frases del resumen van en orden de importancia: si no caben se cortan desde el final
+    context = build_prompt(PROMPT_TEMPLATE, re.split(r"(?<=\.) ", summary_text), MODEL_NAME, separator=" ",
+                           question=question)
+    if not context.records:
+        # Ni la primera frase cabe en el presupuesto: no se llama al modelo con un contexto vacío
+        return GenerationStream(lambda cancel_event: iter([NO_CONTEXT_MESSAGE]))
+    params = dict(GENERATION_PARAMS, max_new_tokens=choose_max_new_tokens(question, GENERATION_PARAMS["max_new_tokens"]))
+    key = answer_key(MODEL_NAME, question, doc_ids, params)
+    return stream_answer(get_answer_cache(), key, MODEL_NAME, context.prompt, params, HF_API_TOKEN,
+                         error_message="Error en Hugging Face API")
+
+# 📌 Procesar la pregunta: el resumen cubre todas las coincidencias (no sólo la primera página)
+# y la respuesta de Mixtral se sigue generando mientras se muestran los documentos
 def ask_question(question):
-    year = extract_year(question)
-    sparql_query = generate_sparql_query(question)
-    rdf_results = query_rdf(sparql_query)
-    
-    # Generar resumen en formato de texto
-    summary_text = generate_summary_text(rdf_results, year)
+    result = retriever.ranking(question)
     
-    # Generar respuesta con Mixtral basada en el resumen
-    mixtral_response = ask_mistral(question, summary_text)
+    # Generar resumen en formato de texto (sobre las coincidencias, sin los candidatos sólo semánticos)
+    with span("summary.facets", unit="chars") as measured:
+        summary_text = generate_summary_text(result.matched, result.year_range)
+        measured.set(size=len(summary_text))
     
-    # Generar la lista detallada de documentos
-    detailed_list = generate_detailed_list(rdf_results, year)
+    # Lanzar la generación con Mixtral basada en el resumen
+    doc_iris = sorted(store.doc_iri(doc_id) for doc_id in result.matched)
+    mixtral_stream = ask_mistral(question, summary_text, doc_iris)
     
-    return summary_text, mixtral_response, detailed_list
+    return summary_text, mixtral_stream
+
+# 📌 Mostrar una página de documentos; la sesión sólo guarda los cursores, no los resultados
+def render_page(question, cursors):
+    rdf_results, page = find_documents(question, cursors[-1])
+    with span("documents.thumbnails", unit="items") as measured:
+        thumbnails = find_thumbnails(rdf_results)
+        measured.set(size=len(thumbnails))
+    if thumbnails:
+        st.image([path for path, _ in thumbnails], caption=[title for _, title in thumbnails], width=160)
+    detailed_list = generate_detailed_list(rdf_results, page.year_range)
+    st.markdown(f"## Respuesta Detallada\n\n{detailed_list}")
+
+    first = (len(cursors) - 1) * PAGE_SIZE + 1
+    if page.total:
+        st.caption(f"Documentos {first}-{first + len(page) - 1} de {page.total}")
+    previous_col, next_col = st.columns(2)
+    previous_col.button("⬅️ Anterior", disabled=len(cursors) == 1, on_click=cursors.pop)
+    next_col.button("Siguiente ➡️", disabled=page.next_cursor is None,
+                    on_click=cursors.append, args=(page.next_cursor,))
 
 # ------------------ Interfaz Streamlit ------------------
 
@@ -169,8 +210,39 @@ pregunta = st.text_area("Escribe tu pregunta:", placeholder="Ejemplo: ¿Qué doc
 
 # **Botón para consultar**
 if st.button("Buscar"):
-    with st.spinner("Buscando información..."):
-        summary_text, mixtral_response, detailed_list = ask_question(pregunta)
-        st.markdown(f"### Resumen de los Documentos\n\n{summary_text}")
-        st.markdown(f"### Respuesta Generada con Mixtral\n\n{mixtral_response}")
-        st.markdown(f"## Respuesta Detallada\n\n{detailed_list}")
+    # Una pregunta nueva cancela la generación que siga en curso
+    previous_stream = st.session_state.pop("mixtral_stream", None)
+    if previous_stream is not None:
+        previous_stream.cancel()
+
+    # La traza sigue recibiendo las etapas de la generación, que termina en segundo plano
+    with st.spinner("Buscando información..."), trace("ask_question") as question_trace:
+        summary_text, mixtral_stream = ask_question(pregunta)
+    st.session_state.mixtral_stream = mixtral_stream
+    st.session_state.question_trace = question_trace
+    st.session_state.search = {"question": pregunta, "summary": summary_text, "cursors": [None]}
+
+# **Resultados de la última búsqueda (también al cambiar de página)**
+search = st.session_state.get("search")
+if search:
+    st.markdown(f"### Resumen de los Documentos\n\n{search['summary']}")
+    st.markdown("### Respuesta Generada con Mixtral")
+    answer_container = st.container()
+    with trace("render_page") as page_trace:
+        render_page(search["question"], search["cursors"])
+    st.session_state.page_trace = page_trace
+    answer_container.write_stream(st.session_state.mixtral_stream)
+
+stats = get_answer_cache().snapshot_stats()
+st.sidebar.caption(f"Caché de respuestas: {stats['hits'] + stats['coalesced']} aciertos, {stats['misses']} fallos")
+st.sidebar.caption(f"Backend SPARQL: {describe_backend(backend)}")
+
+# **Panel de depuración: etapas de la última pregunta y acumulado del proceso**
+if st.sidebar.checkbox("Mostrar tiempos por etapa"):
+    for title, key in (("Última pregunta", "question_trace"), ("Página mostrada", "page_trace")):
+        stage_trace = st.session_state.get(key)
+        if stage_trace is not None:
+            st.sidebar.markdown(f"**{title}** ({stage_trace.total_ms:.0f} ms)")
+            st.sidebar.dataframe(stage_trace.rows(), hide_index=True)
+    st.sidebar.markdown("**Acumulado del proceso**")
+    st.sidebar.dataframe(summary_rows(), hide_index=True)
@@ -9,6 +9,9 @@ from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
 import torch
 import os
 from dotenv import load_dotenv
+from snapshot import load_or_build_snapshot
+from triple_store import TripleStore
+from vector_index import load_vector_index
 
 # Cargar variables de entorno
 load_dotenv()
@@ -34,12 +37,18 @@ for entry in languages:
 # Inicializar el modelo de embeddings
 embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 
-# Convertir los documentos en embeddings
-vectorstore = FAISS.from_texts(documents, embedding_model)
-
-# Guardar la base de datos FAISS
+# Cargar la base de datos FAISS guardada; sólo se calculan los embeddings la primera vez
 faiss_db_path = "quechua_rag.index"
-vectorstore.save_local(faiss_db_path)
+if os.path.exists(faiss_db_path):
+    vectorstore = FAISS.load_local(faiss_db_path, embedding_model)
+else:
+    vectorstore = FAISS.from_texts(documents, embedding_model)
+    vectorstore.save_local(faiss_db_path)
+
+# Índice vectorial de los registros IRA (dataset.ttl): se mapea desde disco y
+# sólo se codifican los registros nuevos o modificados
+ira_store = TripleStore(load_or_build_snapshot("dataset.ttl", "metadata.json"))
+ira_index = load_vector_index(ira_store)
 
 # Cargar modelo Mixtral-8x7B-Instruct de Hugging Face con optimización
 model_name = "mistralai/Mixtral-8x7B-Instruct-v0.1"
@@ -6,12 +6,23 @@ Created on Sun Mar  9 19:27:09 2025
 """
 
 import os
-import requests
-import spacy
-import unicodedata
 import streamlit as st
 from dotenv import load_dotenv
 from pyngrok import ngrok
+from snapshot import load_or_build_snapshot
+from retrieval import build_retriever
+from facets import load_facets
+from backends import describe_backend, documents_query, load_backend
+from fuzzy_index import load_fuzzy_index
+from context_builder import (NO_CONTEXT_MESSAGE, SUMMARY_FIELD_CHARS, SUMMARY_MAX_NEW_TOKENS, SUMMARY_PROMPT,
+                             build_prompt, choose_max_new_tokens)
+from llm_cache import answer_key, get_answer_cache
+from query_analysis import analyze_question
+from llm_stream import GenerationStream, stream_answer
+from metrics import span, start_metrics_server, summary_rows, trace
+from text_index import load_text_index
+from triple_store import TripleStore
+from year_index import build_year_index
 
 # Cargar variables de entorno
 load_dotenv()
@@ -27,129 +38,117 @@ try:
 except Exception as e:
     st.error(f"Error al iniciar ngrok: {str(e)}")
 
-# Configuración de GraphDB
-GRAPHDB_SERVER = os.getenv("GRAPHDB_SERVER", "http://localhost:7200")
-REPO_NAME = os.getenv("REPO_NAME", "IRA")
-SPARQL_ENDPOINT = f"{GRAPHDB_SERVER}/repositories/{REPO_NAME}"
+# Datos locales para el índice de búsqueda
+RDF_FILE = "dataset.ttl"
+METADATA_FILE = "metadata.json"
+TOP_K = 10
 
-# Cargar modelo spaCy
+# Endpoint /metrics de Prometheus si METRICS_PORT está definido (uno por proceso)
+start_metrics_server()
+
+# Cargar índices de búsqueda (BM25 de la ingesta + trigramas + vectorial) para la recuperación híbrida y las facetas,
+# y el backend SPARQL (GraphDB si GRAPHDB_SERVER está definido, con respaldo en el almacén local)
 @st.cache_resource
-def load_spacy_model():
-    modelo_es = "es_core_news_sm"
-    if not spacy.util.is_package(modelo_es):
-        os.system(f"python -m spacy download {modelo_es}")
-    return spacy.load(modelo_es)
+def load_search_index():
+    with span("startup.load_search_index"):
+        snapshot = load_or_build_snapshot(RDF_FILE, METADATA_FILE)
+        store = TripleStore(snapshot)
+        retriever = build_retriever(store, load_text_index(store), build_year_index(store), fuzzy_index=load_fuzzy_index(store))
+        return store, retriever, load_facets(store), load_backend(store)
 
-nlp = load_spacy_model()
+store, retriever, facets, backend = load_search_index()
 
-# Función para consultar GraphDB
+# Función para consultar el backend SPARQL
 @st.cache_data(ttl=3600)
-def query_graphdb(sparql_query):
-    headers = {"Accept": "application/sparql-results+json"}
+def query_backend(sparql_query):
     try:
-        response = requests.get(
-            SPARQL_ENDPOINT,
-            params={"query": sparql_query},
-            headers=headers,
-            timeout=10
-        )
-        return response.json() if response.status_code == 200 else None
+        return backend.select(sparql_query)
     except Exception as e:
-        st.error(f"Error de conexión con GraphDB: {str(e)}")
+        st.error(f"Error de consulta SPARQL ({describe_backend(backend)}): {str(e)}")
         return None
 
-# Función de limpieza de texto
-def clean_text(text):
-    if not text or not isinstance(text, str):
-        return ""
-    text = unicodedata.normalize("NFKD", text).encode('latin-1', 'ignore').decode('utf-8', 'ignore').strip()
-    replacements = {"Ã¡": "á", "Ã©": "é", "Ã±": "ñ", "Âº": "º"}
-    for wrong, correct in replacements.items():
-        text = text.replace(wrong, correct)
-    return text
-
-# Generación de consulta SPARQL
-def generate_sparql_query(question):
-    doc = nlp(question.lower())
-    keywords = [ent.text for ent in doc.ents] + [token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN"]]
-    
-    base_query = """
-    PREFIX dc: <http://purl.org/dc/elements/1.1/>
-    SELECT ?title ?date ?creator ?subject ?description WHERE {
-        ?doc dc:title ?title .
-        OPTIONAL { ?doc dc:date ?date . }
-        OPTIONAL { ?doc dc:creator ?creator . }
-        OPTIONAL { ?doc dc:subject ?subject . }
-        OPTIONAL { ?doc dc:description ?description . }
-    }
-    ORDER BY DESC(?date) 
-    LIMIT 30
-    """
-    
-    if keywords:
-        filters = " || ".join([f'regex(str(?title), "{term}", "i")' for term in set(keywords)])
-        return base_query.replace("WHERE {", f"WHERE {{ FILTER({filters}) ")
-    
-    return base_query
-
-# Función de consulta a modelo de IA
-@st.cache_data(ttl=600)
-def ask_mistral(context):
-    headers = {"Authorization": f"Bearer {os.getenv('HF_API_TOKEN')}"}
-    prompt = f"""
-    [INST] Como experto en historia peruana del siglo XIX, genera:
-    1. Un párrafo resumen con los aspectos clave
-    2. Lista de puntos importantes
-    3. Contexto histórico relevante
-    
-    Información a analizar:
-    {context}
-    [/INST]
-    """
-    response = requests.post(
-        f"https://api-inference.huggingface.co/models/{os.getenv('MODEL_NAME')}",
-        headers=headers,
-        json={"inputs": prompt, "parameters": {"max_new_tokens": 600}}
-    )
-    if response.status_code == 200:
-        return response.json()[0]['generated_text'].split("[/INST]")[-1].strip()
-    return "Error generando el resumen"
-
-# Procesamiento de consultas
+# Búsqueda de documentos relevantes (BM25 sobre las palabras clave + similitud semántica),
+# una página a la vez: `cursor` es el que devolvió la página anterior
+def search_documents(question, cursor=None, page_size=TOP_K):
+    keywords = analyze_question(question).keywords
+    page = retriever.page(question, page_size, cursor, lexical_query=" ".join(keywords) if keywords else None)
+    return [store.doc_iri(doc_id) for doc_id in page.doc_ids], page
+
+# Generación de consulta SPARQL para los documentos encontrados
+def generate_sparql_query(doc_iris):
+    return documents_query(doc_iris, ("doc", "title", "date", "creator", "subject", "description", "publisher"))
+
+# Función de consulta a modelo de IA (en streaming, con caché persistente compartida entre sesiones)
+def ask_mistral(question, documents):
+    model = os.getenv('MODEL_NAME')
+    # Los documentos entran por relevancia hasta llenar el presupuesto de tokens del prompt
+    context = build_prompt(SUMMARY_PROMPT, documents, model, field_chars=SUMMARY_FIELD_CHARS)
+    if not context.records:
+        # Ni el primer documento cabe en el presupuesto: no se llama al modelo con un contexto vacío
+        return GenerationStream(lambda cancel_event: iter([NO_CONTEXT_MESSAGE]))
+    params = {"max_new_tokens": choose_max_new_tokens(question, SUMMARY_MAX_NEW_TOKENS), "return_full_text": False}
+    key = answer_key(model, question, [d["doc"] for d in context.records], params)
+    return stream_answer(get_answer_cache(), key, model, context.prompt, params, os.getenv('HF_API_TOKEN'),
+                         error_message="Error generando el resumen")
+
+# Metadatos de los documentos (ya normalizados en la ingesta): una fila por documento,
+# en el orden del ranking
+def fetch_documents(doc_iris):
+    with span("documents.fetch", requested=len(doc_iris)):
+        rows = query_backend(generate_sparql_query(doc_iris))
+    if not rows:
+        return []
+
+    rank = {iri: i for i, iri in enumerate(doc_iris)}
+    ranked = {}
+    for row in rows:
+        iri = row.get('doc')
+        if iri in rank and iri not in ranked:
+            ranked[iri] = row
+
+    documents = []
+    for row in sorted(ranked.values(), key=lambda r: rank[r['doc']]):
+        documents.append({
+            "doc": row['doc'],
+            "title": row.get('title') or '',
+            "date": row.get('date') or '',
+            "subject": row.get('subject') or '',
+            "description": row.get('description') or '',
+            "publisher": row.get('publisher') or '',
+        })
+    return documents
+
+# Procesamiento de consultas: el resumen se genera en segundo plano a partir de la primera página
 def process_question(question):
-    sparql_query = generate_sparql_query(question)
-    graphdb_results = query_graphdb(sparql_query)
-    
-    if not graphdb_results:
-        return "No se encontraron resultados. Intente con otros términos.", ""
-    
-    context = []
-    references = []
-    for result in graphdb_results['results']['bindings'][:10]:
-        title = clean_text(result.get('title', {}).get('value', ''))
-        date = clean_text(result.get('date', {}).get('value', ''))
-        subject = clean_text(result.get('subject', {}).get('value', ''))
-        description = clean_text(result.get('description', {}).get('value', ''))
-        
-        context.append(f"Título: {title}\nFecha: {date}\nTema: {subject}\nDescripción: {description[:200]}...")
-        references.append(f"- {title} ({date}) - {subject}")
-    
-    return ask_mistral("\n\n".join(context)), "\n".join(references)
+    doc_iris, _ = search_documents(question)
+    documents = fetch_documents(doc_iris) if doc_iris else []
+    if not documents:
+        return None
+
+    return ask_mistral(question, documents)
+
+# Referencias de una página de resultados; la sesión sólo guarda los cursores
+def render_references(question, cursors):
+    doc_iris, page = search_documents(question, cursors[-1])
+    documents = fetch_documents(doc_iris) if doc_iris else []
+    st.markdown("\n".join(f"- {d['title']} ({d['date']}) - {d['subject']}" for d in documents))
+
+    first = (len(cursors) - 1) * TOP_K + 1
+    if page.total:
+        st.caption(f"Documentos {first}-{first + len(page) - 1} de {page.total}")
+    previous_col, next_col = st.columns(2)
+    previous_col.button("⬅️ Anterior", disabled=len(cursors) == 1, on_click=cursors.pop)
+    next_col.button("Siguiente ➡️", disabled=page.next_cursor is None,
+                    on_click=cursors.append, args=(page.next_cursor,))
 
-# Generación de preguntas sugeridas
+# Generación de preguntas sugeridas (temas más frecuentes, precalculados en la ingesta)
 def generate_suggested_questions():
-    sparql_query = """
-    PREFIX dc: <http://purl.org/dc/elements/1.1/>
-    SELECT DISTINCT ?subject (COUNT(?doc) as ?count) WHERE {
-        ?doc dc:subject ?subject 
-    } GROUP BY ?subject ORDER BY DESC(?count) LIMIT 5
-    """
-    results = query_graphdb(sparql_query)
+    top_subjects = facets.counts("subject", top=5)
     
-    if not results:
+    if not top_subjects:
         return ["Documentos más recientes", "Documentos sin clasificar"]
     
-    return [f"Documentos sobre {clean_text(r['subject']['value'])}" for r in results['results']['bindings']]
+    return [f"Documentos sobre {subject}" for subject, _ in top_subjects]
 
 # Interfaz de Streamlit
 st.title("Análisis de Documentos Históricos")
@@ -165,22 +164,57 @@ for i, pregunta in enumerate(suggested_questions):
 pregunta = st.text_input("Escribe tu pregunta:", value=getattr(st.session_state, 'pregunta', ''))
 if st.button("Analizar documentos"):
     if pregunta:
-        with st.spinner('Buscando y analizando...'):
-            resumen, referencias = process_question(pregunta)
-            
-            st.markdown("## Resumen analítico")
-            st.markdown(f"""
-            <div style='
-                background-color: #f8f9fa;
-                padding: 1.5rem;
-                border-radius: 8px;
-                margin-bottom: 2rem;
-            '>
-            {resumen}
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("## Documentos relacionados")
-            st.markdown(referencias)
+        # Una pregunta nueva cancela la generación que siga en curso
+        previous_stream = st.session_state.pop("resumen_stream", None)
+        if previous_stream is not None:
+            previous_stream.cancel()
+        st.session_state.pop("search", None)
+
+        # La traza sigue recibiendo las etapas de la generación, que termina en segundo plano
+        with st.spinner('Buscando documentos...'), trace("process_question") as question_trace:
+            resumen_stream = process_question(pregunta)
+        st.session_state.question_trace = question_trace
+
+        if resumen_stream is None:
+            st.warning("No se encontraron resultados. Intente con otros términos.")
+        else:
+            st.session_state.resumen_stream = resumen_stream
+            st.session_state.search = {"question": pregunta, "cursors": [None]}
     else:
-        st.warning("Por favor ingresa una pregunta")
\ No newline at end of file
+        st.warning("Por favor ingresa una pregunta")
+
+# Resultados de la última búsqueda (también al cambiar de página)
+search = st.session_state.get("search")
+if search:
+    st.markdown("## Resumen analítico")
+    resumen_slot = st.empty()
+    st.markdown("## Documentos relacionados")
+    with trace("render_references") as page_trace:
+        render_references(search["question"], search["cursors"])
+    st.session_state.page_trace = page_trace
+
+    resumen = ""
+    for chunk in st.session_state.resumen_stream:
+        resumen += chunk
+        resumen_slot.markdown(f"""
+        <div style='
+            background-color: #f8f9fa;
+            padding: 1.5rem;
+            border-radius: 8px;
+            margin-bottom: 2rem;
+        '>
+        {resumen}
+        </div>
+        """, unsafe_allow_html=True)
+
+st.sidebar.caption(f"Backend SPARQL: {describe_backend(backend)}")
+
+# Panel de depuración: etapas de la última pregunta y acumulado del proceso
+if st.sidebar.checkbox("Mostrar tiempos por etapa"):
+    for title, key in (("Última pregunta", "question_trace"), ("Página mostrada", "page_trace")):
+        stage_trace = st.session_state.get(key)
+        if stage_trace is not None:
+            st.sidebar.markdown(f"**{title}** ({stage_trace.total_ms:.0f} ms)")
+            st.sidebar.dataframe(stage_trace.rows(), hide_index=True)
+    st.sidebar.markdown("**Acumulado del proceso**")
+    st.sidebar.dataframe(summary_rows(), hide_index=True)
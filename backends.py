@@ -0,0 +1,373 @@
+"""Backends SPARQL intercambiables: almacén local, endpoint remoto y respaldo automático.
+
+Todos exponen `select(sparql_query)` -> lista de filas {variable: texto o None}:
+
+- LocalBackend resuelve las consultas en estrella de las apps (también con
+  `VALUES ?doc {...}`) con el TripleStore y deja el resto a rdflib, que sólo
+  se materializa si hace falta.
+- SparqlBackend consulta un endpoint remoto (GraphDB) con el cliente HTTP
+  compartido, con plazo y circuit breaker.
+- FallbackBackend usa el remoto mientras responda dentro de su presupuesto;
+  si falla o es lento, responde con el local y no vuelve a probar el remoto
+  hasta pasado un tiempo de espera.
+
+`load_backend` elige según el entorno (SPARQL_BACKEND = auto | local | remote),
+así la misma app corre en un portátil o contra un triple store compartido.
+`bulk_load` sube las tripletas del snapshot a un endpoint con el protocolo
+Graph Store HTTP, en bloques de N-Triples enviados en paralelo. Para
+reemplazar el grafo se carga primero en un grafo de staging y sólo si todos
+los bloques llegaron se mueve al destino con un SPARQL Update (MOVE), así un
+fallo a mitad de carga nunca deja a medias el grafo que están consultando:
+
+    python backends.py load [--replace] [--chunk-size 5000] [--workers 4]
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from http_client import deadline_in, get_client
+from metrics import record, span
+from triple_store import parse_star_query
+
+# Segundos que se espera al remoto antes de responder con el almacén local
+REMOTE_BUDGET = 2.0
+FALLBACK_COOLDOWN = 30
+QUERY_TIMEOUT = 10
+# Consultas más largas que esto van por POST (las URL largas se cortan en proxies)
+MAX_GET_QUERY = 2000
+CHUNK_SIZE = 5000
+UPLOAD_WORKERS = 4
+UPLOAD_DEADLINE = 120
+# Grafo con nombre donde se arma la carga antes de reemplazar el destino
+STAGING_GRAPH = "urn:ira:staging"
+
+_VALUES_RE = re.compile(r"VALUES\s+\?doc\s*\{([^}]*)\}\s*", re.I)
+_IRI_RE = re.compile(r"<([^>]+)>")
+
+
+# La configuración se lee al usarla: las apps llaman a load_dotenv después de importar los módulos
+def repository_endpoint(server=None, repository=None):
+    """Endpoint SPARQL del repositorio de GraphDB (GRAPHDB_SERVER y REPO_NAME), o None si no hay servidor."""
+    server = server or os.getenv("GRAPHDB_SERVER")
+    if not server:
+        return None
+    return f"{server.rstrip('/')}/repositories/{repository or os.getenv('REPO_NAME', 'IRA')}"
+
+
+def graph_store_url(server=None, repository=None):
+    """Endpoint Graph Store HTTP del grafo por defecto del repositorio (así lo expone GraphDB)."""
+    endpoint = repository_endpoint(server, repository)
+    return f"{endpoint}/rdf-graphs/service?default" if endpoint else None
+
+
+def update_url(graph_store):
+    """Endpoint SPARQL Update junto a un servicio Graph Store (en GraphDB y RDF4J, .../statements)."""
+    base = graph_store.split("?", 1)[0]
+    if not base.endswith("/rdf-graphs/service"):
+        raise ValueError(f"No se puede deducir el endpoint de actualización de {graph_store}")
+    return base[:-len("/rdf-graphs/service")] + "/statements"
+
+
+def named_graph_url(graph_store, graph):
+    """URL Graph Store de un grafo con nombre en el mismo servicio."""
+    return f"{graph_store.split('?', 1)[0]}?{urlencode({'graph': graph})}"
+
+
+def _graph_ref(graph_store):
+    """El grafo de una URL Graph Store en sintaxis SPARQL Update: DEFAULT o <iri>."""
+    graph = parse_qs(urlsplit(graph_store).query).get("graph")
+    return f"<{graph[0]}>" if graph else "DEFAULT"
+
+
+# 📌 Almacén local
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, store):
+        self.store = store
+        self._graph = None
+        self._graph_lock = threading.Lock()
+
+    def _star_select(self, sparql_query):
+        """Filas de la consulta en estrella (con VALUES opcional), o None si no tiene esa forma."""
+        doc_ids = None
+        match = _VALUES_RE.search(sparql_query)
+        if match:
+            doc_ids = self.store.doc_ids_for_iris(_IRI_RE.findall(match.group(1)))
+            sparql_query = sparql_query[:match.start()] + sparql_query[match.end():]
+        shape = parse_star_query(sparql_query.strip())
+        if shape is None:
+            return None
+        variables, required, filters, limit = shape
+        filter_ids = {var: self.store.literal_ids(lexical, datatype) for var, (lexical, datatype) in filters.items()}
+        return self.store.star_query(variables, required=required, filters=filter_ids, doc_ids=doc_ids, limit=limit)
+
+    def graph(self):
+        """El grafo rdflib sólo se materializa si llega una consulta SPARQL arbitraria."""
+        with self._graph_lock:
+            if self._graph is None:
+                with span("backend.local.rdflib_graph"):
+                    self._graph = self.store.snapshot.to_graph()
+            return self._graph
+
+    def select(self, sparql_query, deadline=None):
+        with span("backend.local.star", unit="rows") as measured:
+            rows = self._star_select(sparql_query)
+            measured.set(size=len(rows) if rows is not None else None, supported=rows is not None)
+        if rows is not None:
+            return rows
+
+        from rdflib.plugins.sparql import prepareQuery
+
+        with span("backend.local.prepare"):
+            query = prepareQuery(sparql_query)
+        with span("backend.local.rdflib", unit="rows") as measured:
+            results = self.graph().query(query)
+            variables = [str(var) for var in results.vars]
+            rows = [{var: str(value) if value is not None else None for var, value in zip(variables, row)}
+                    for row in results]
+            measured.set(size=len(rows))
+        return rows
+
+
+# 📌 Endpoint remoto (GraphDB u otro servidor SPARQL 1.1)
+class SparqlBackend:
+    name = "remote"
+
+    def __init__(self, endpoint, timeout=QUERY_TIMEOUT):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def select(self, sparql_query, deadline=None):
+        headers = {"Accept": "application/sparql-results+json"}
+        deadline = deadline or deadline_in(self.timeout)
+        with span("backend.remote") as measured:
+            if len(sparql_query) > MAX_GET_QUERY:
+                response = get_client().post(self.endpoint, data={"query": sparql_query}, headers=headers,
+                                             deadline=deadline)
+            else:
+                response = get_client().get(self.endpoint, params={"query": sparql_query}, headers=headers,
+                                            deadline=deadline)
+            measured.set(size=len(response.content), status=response.status_code)
+            if response.status_code != 200:
+                raise RuntimeError(f"{self.endpoint} respondió {response.status_code}")
+            results = response.json()
+        variables = results["head"]["vars"]
+        return [{var: binding[var]["value"] if var in binding else None for var in variables}
+                for binding in results["results"]["bindings"]]
+
+
+# 📌 Remoto con respaldo local
+class FallbackBackend:
+    def __init__(self, primary, fallback, budget=REMOTE_BUDGET, cooldown=FALLBACK_COOLDOWN):
+        self.primary = primary
+        self.fallback = fallback
+        self.budget = budget
+        self.cooldown = cooldown
+        self.last_error = None
+        self.fallbacks = 0
+        self._skip_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.primary.name}+{self.fallback.name}"
+
+    @property
+    def degraded(self):
+        """True mientras se está respondiendo con el respaldo."""
+        return time.monotonic() < self._skip_until
+
+    def select(self, sparql_query, deadline=None):
+        if not self.degraded:
+            try:
+                return self.primary.select(sparql_query, deadline=deadline or deadline_in(self.budget))
+            except Exception as e:
+                # Caído, lento o con error: se responde en local y se deja descansar al remoto
+                print(f"Backend {self.primary.name} no disponible ({e}); se usa {self.fallback.name}")
+                self.last_error = e
+                self._skip_until = time.monotonic() + self.cooldown
+        self.fallbacks += 1
+        record("backend.fallback", reason=type(self.last_error).__name__ if self.last_error else None)
+        return self.fallback.select(sparql_query)
+
+    def describe(self):
+        if self.degraded:
+            return f"{self.fallback.name} (respaldo: {self.primary.name} no disponible)"
+        return self.primary.name
+
+
+def load_backend(store, mode=None, endpoint=None):
+    """Backend según SPARQL_BACKEND: `auto` usa el remoto con respaldo local si hay GRAPHDB_SERVER o SPARQL_ENDPOINT."""
+    mode = mode or os.getenv("SPARQL_BACKEND", "auto")
+    endpoint = endpoint or os.getenv("SPARQL_ENDPOINT") or repository_endpoint()
+    local = LocalBackend(store)
+    if mode == "local" or (mode == "auto" and not endpoint):
+        return local
+    if not endpoint:
+        raise ValueError("SPARQL_BACKEND=remote necesita GRAPHDB_SERVER o SPARQL_ENDPOINT")
+    remote = SparqlBackend(endpoint)
+    return remote if mode == "remote" else FallbackBackend(remote, local, float(os.getenv("SPARQL_BUDGET", REMOTE_BUDGET)))
+
+
+def describe_backend(backend):
+    return backend.describe() if hasattr(backend, "describe") else backend.name
+
+
+# 📌 Metadatos de una página de documentos (la misma consulta para cualquier backend)
+def documents_query(doc_iris, variables=("doc", "title", "date", "creator", "subject")):
+    """Consulta en estrella restringida a esos documentos con VALUES."""
+    values = " ".join(f"<{iri}>" for iri in doc_iris)
+    optionals = "\n".join(f"        OPTIONAL {{ ?doc dc:{var} ?{var} . }}" for var in variables if var not in ("doc", "title"))
+    return f"""
+    PREFIX dc: <http://purl.org/dc/elements/1.1/>
+    SELECT {" ".join("?" + var for var in variables)} WHERE {{
+        VALUES ?doc {{ {values} }}
+        ?doc dc:title ?title .
+{optionals}
+    }}
+    """
+
+
+def select_documents(backend, doc_iris, variables=("doc", "title", "date", "creator", "subject")):
+    """Filas de esos documentos en el orden de `doc_iris` (un endpoint remoto no garantiza el orden)."""
+    if not doc_iris:
+        return []
+    rank = {iri: i for i, iri in enumerate(doc_iris)}
+    rows = backend.select(documents_query(doc_iris, variables))
+    return sorted((row for row in rows if row.get("doc") in rank), key=lambda row: rank[row["doc"]])
+
+
+# 📌 Carga masiva (Graph Store HTTP)
+def snapshot_ntriples(snapshot):
+    """Las tripletas del snapshot como líneas N-Triples (sin volver a parsear Turtle)."""
+    terms = [snapshot.term(term_id).n3() for term_id in range(len(snapshot.term_kind))]
+    for s, p, o in snapshot.triples.tolist():
+        yield f"{terms[s]} {terms[p]} {terms[o]} .\n"
+
+
+def _chunks(lines, size):
+    chunk, count = [], 0
+    for line in lines:
+        chunk.append(line)
+        count += 1
+        if count == size:
+            yield "".join(chunk).encode("utf-8"), count
+            chunk, count = [], 0
+    if chunk:
+        yield "".join(chunk).encode("utf-8"), count
+
+
+def _upload(url, data):
+    response = get_client().post(url, content=data, headers={"Content-Type": "application/n-triples"},
+                                 deadline=deadline_in(UPLOAD_DEADLINE))
+    if response.status_code not in (200, 201, 204):
+        raise RuntimeError(f"{url} respondió {response.status_code}: {response.text[:200]}")
+
+
+def _clear(url):
+    response = get_client().request("DELETE", url, deadline=deadline_in(UPLOAD_DEADLINE))
+    if response.status_code not in (200, 204, 404):
+        raise RuntimeError(f"No se pudo vaciar {url}: {response.status_code}")
+
+
+def _update(url, sparql_update):
+    response = get_client().post(url, data={"update": sparql_update}, deadline=deadline_in(UPLOAD_DEADLINE))
+    if response.status_code not in (200, 204):
+        raise RuntimeError(f"{url} respondió {response.status_code} a la actualización: {response.text[:200]}")
+
+
+def bulk_load(lines, url, chunk_size=CHUNK_SIZE, workers=UPLOAD_WORKERS, replace=False, staging_graph=STAGING_GRAPH,
+              update_endpoint=None):
+    """Sube líneas N-Triples a un grafo con POST en bloques paralelos.
+
+    Como mucho hay `2 * workers` bloques en memoria a la vez, así la carga va
+    en streaming. Con `replace` los bloques van al grafo `staging_graph` y, si
+    llegaron todos, un MOVE en `update_endpoint` (por defecto el de GraphDB junto
+    al servicio) reemplaza el grafo destino de una vez; si alguno falla se borra
+    el staging y el destino queda intacto. Devuelve un resumen; si algún bloque
+    falla se lanza RuntimeError al terminar, indicando cuántos.
+    """
+    started = time.perf_counter()
+    target = url
+    if replace:
+        update_endpoint = update_endpoint or update_url(target)
+        url = named_graph_url(target, staging_graph)
+        # Restos de una carga anterior interrumpida
+        _clear(url)
+
+    stats = {"triples": 0, "chunks": 0, "bytes": 0, "failed": 0}
+    errors = []
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            count = pending.pop(future)
+            try:
+                future.result()
+                stats["triples"] += count
+            except Exception as e:
+                stats["failed"] += 1
+                errors.append(e)
+
+    with span("backend.bulk_load") as measured, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-load") as pool:
+        for data, count in _chunks(lines, chunk_size):
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(_upload, url, data)] = count
+            stats["chunks"] += 1
+            stats["bytes"] += len(data)
+        collect(wait(pending)[0])
+        measured.set(size=stats["bytes"], triples=stats["triples"], failed=stats["failed"])
+
+    if errors:
+        message = f"{stats['failed']} de {stats['chunks']} bloques fallaron (primer error: {errors[0]})"
+        if replace:
+            # El destino no se tocó: sólo se descarta lo que llegó al staging
+            try:
+                _clear(url)
+            except Exception as e:
+                print(f"No se pudo borrar el grafo de staging {staging_graph}: {e}")
+            message += f"; {target} no se modificó"
+        raise RuntimeError(message)
+    if replace:
+        with span("backend.bulk_load.swap"):
+            _update(update_endpoint, f"MOVE <{staging_graph}> TO {_graph_ref(target)}")
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def load_snapshot_into(url, snapshot, **kwargs):
+    stats = bulk_load(snapshot_ntriples(snapshot), url, **kwargs)
+    print(f"✅ {stats['triples']} tripletas cargadas en {url} ({stats['chunks']} bloques, "
+          f"{stats['bytes'] / 1e6:.1f} MB, {stats['seconds']:.1f} s)")
+    return stats
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from snapshot import load_or_build_snapshot
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Carga el snapshot de dataset.ttl en un endpoint Graph Store HTTP.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    load = subcommands.add_parser("load", help="sube las tripletas (por defecto al repositorio de GRAPHDB_SERVER)")
+    load.add_argument("--url", default=None, help="URL Graph Store (p. ej. .../rdf-graphs/service?default)")
+    load.add_argument("--replace", action="store_true",
+                      help="reemplaza el grafo (se carga en staging y se mueve al terminar sin errores)")
+    load.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="tripletas por bloque")
+    load.add_argument("--workers", type=int, default=UPLOAD_WORKERS, help="bloques subidos en paralelo")
+    load.add_argument("--ttl", default="dataset.ttl")
+    load.add_argument("--metadata", default="metadata.json")
+    args = parser.parse_args()
+
+    url = args.url or graph_store_url()
+    if not url:
+        parser.error("indica --url o define GRAPHDB_SERVER")
+    load_snapshot_into(url, load_or_build_snapshot(args.ttl, args.metadata),
+                       chunk_size=args.chunk_size, workers=args.workers, replace=args.replace)
@@ -0,0 +1,301 @@
+"""Modo por lotes: responde preguntas leídas de un JSONL sin pasar por Streamlit.
+
+    python batch_qa.py preguntas.jsonl respuestas.jsonl [--workers 8] [--batch-size 32] [--concurrency 4]
+
+Cada línea de entrada es {"id": ..., "question": ...} (sin "id" se usa el número
+de línea). El snapshot y los índices se compilan y ponen al día una sola vez en
+el proceso principal, que también codifica las preguntas con el modelo de
+embeddings; la recuperación corre después en un pool de procesos que sólo los
+abre para leer, una vez por pregunta distinta. Las preguntas que recuperan los mismos documentos comparten prompt y
+una sola llamada al modelo. Las llamadas se hacen por lotes con concurrencia
+acotada y las respuestas van a la caché compartida con app3. La salida se
+escribe línea por línea con los tiempos de cada pregunta; al relanzar el
+comando se saltan las preguntas que ya tienen respuesta sin error (o cuyos
+documentos no caben en el prompt) y las demás se reemplazan, una fila por id.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from context_builder import (NO_CONTEXT_MESSAGE, SUMMARY_FIELD_CHARS, SUMMARY_MAX_NEW_TOKENS, SUMMARY_PROMPT,
+                             build_prompt, choose_max_new_tokens)
+from llm_cache import answer_key, get_answer_cache
+from llm_stream import stream_tokens
+from query_analysis import analyze_question, normalize_question
+
+RDF_FILE = "dataset.ttl"
+METADATA_FILE = "metadata.json"
+DEFAULT_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+TOP_K = 10
+BATCH_SIZE = 32
+CHUNK_SIZE = 8
+CONCURRENCY = 4
+DOCUMENT_FIELDS = ("title", "date", "subject", "description", "publisher")
+
+_store = None
+_retriever = None
+# Embeddings de las preguntas en curso en el worker, calculados por el proceso principal
+_query_vectors = {}
+
+
+# 📌 Recuperación: los índices se preparan una vez aquí; los procesos del pool sólo los leen
+def prepare_indices(questions):
+    """Compila el snapshot, pone al día los índices y codifica `questions`, antes de crear el pool.
+
+    Devuelve el snapshot (se pasa a los workers como ruta) y los embeddings de
+    las preguntas, o None si no hay búsqueda semántica. Así sólo este proceso
+    escribe en `indices/` y carga el modelo de sentence-transformers.
+    """
+    from fuzzy_index import load_fuzzy_index
+    from snapshot import load_or_build_snapshot
+    from text_index import load_text_index
+    from triple_store import TripleStore
+    from vector_index import load_vector_index
+
+    snapshot = load_or_build_snapshot(RDF_FILE, METADATA_FILE)
+    store = TripleStore(snapshot)
+    load_text_index(store)
+    load_fuzzy_index(store)
+    try:
+        vector_index = load_vector_index(store)
+        query_vectors = np.asarray(vector_index.encoder(questions), dtype=np.float32) if len(vector_index) else None
+    except Exception as e:
+        # Sin sentence-transformers, o sin red/disco para el modelo: como build_retriever, queda sólo léxico
+        print(f"Índice vectorial no disponible ({e}); se usa sólo búsqueda léxica")
+        query_vectors = None
+    return snapshot, query_vectors
+
+
+def _encode_query(texts):
+    return np.stack([_query_vectors[text] for text in texts])
+
+
+def _init_worker(snapshot, dense):
+    """Abre el snapshot y los índices ya preparados, sin escribir nada ni cargar el modelo."""
+    global _store, _retriever
+    from fuzzy_index import load_fuzzy_index
+    from retrieval import HybridRetriever
+    from text_index import load_text_index
+    from triple_store import TripleStore
+    from vector_index import open_vector_index
+    from year_index import build_year_index
+
+    _store = TripleStore(snapshot)
+    vector_index = open_vector_index(encoder=_encode_query) if dense else None
+    _retriever = HybridRetriever(_store, load_text_index(_store, save=False), vector_index, build_year_index(_store),
+                                 fuzzy_index=load_fuzzy_index(_store, save=False))
+
+
+def _retrieve(item):
+    """Documentos de la primera página (los mismos que usa app3) y el tiempo de recuperación."""
+    question, query_vector = item
+    started = time.perf_counter()
+    if query_vector is not None:
+        _query_vectors[question] = query_vector
+    keywords = analyze_question(question).keywords
+    try:
+        page = _retriever.page(question, TOP_K, lexical_query=" ".join(keywords) if keywords else None)
+    finally:
+        _query_vectors.pop(question, None)
+    documents = [
+        dict({"doc": _store.doc_iri(doc_id)},
+             **{name: (_store.values(name, doc_id) or [""])[0] for name in DOCUMENT_FIELDS})
+        for doc_id in page.doc_ids
+    ]
+    return documents, (time.perf_counter() - started) * 1000
+
+
+# 📌 Entrada y salida
+def read_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if line.strip():
+                item = json.loads(line)
+                yield item.get("id", number), item["question"]
+
+
+def _is_done(row, require_answer):
+    # Sin documentos que quepan en el prompt el resultado no cambia al reintentar: cuenta como hecha
+    if row.get("error"):
+        return row["error"] == NO_CONTEXT_MESSAGE
+    return row.get("answer") is not None or not require_answer
+
+
+def answered_ids(path, require_answer=True):
+    """Ids ya resueltos en una salida anterior; la salida queda con una sola fila por id.
+
+    De cada id se mira la última fila. Las filas de los ids que se van a volver
+    a intentar (con error, o sin respuesta si ahora se pide) se quitan del
+    archivo, igual que una línea cortada a la mitad, así al agregar las nuevas
+    respuestas ningún id aparece dos veces.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb") as f:
+        lines = f.read().split(b"\n")
+    # Lo que sigue al último salto de línea es una fila incompleta (o nada)
+    latest = {}
+    for line in lines[:-1]:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        key = json.dumps(row["id"])
+        latest.pop(key, None)
+        latest[key] = (row, line)
+    done = {key for key, (row, _) in latest.items() if _is_done(row, require_answer)}
+
+    kept = [line for key, (_, line) in latest.items() if key in done]
+    if kept != lines[:-1] or lines[-1]:
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.writelines(line + b"\n" for line in kept)
+        os.replace(tmp_path, path)
+    return done
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Resultado de una pregunta cuyos documentos no caben en el prompt: no se llama al modelo
+SKIPPED = {"answer": None, "error": NO_CONTEXT_MESSAGE, "cached": False, "ms": 0.0}
+
+
+class BatchAnswerer:
+    def __init__(self, model, api_token, concurrency=CONCURRENCY, url=None):
+        self.model = model
+        self.api_token = api_token
+        self.url = url
+        self.cache = get_answer_cache()
+        self.threads = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-llm")
+        # (prompt, parámetros) -> {"answer", "error", "ms", "cached"}: una llamada por prompt distinto
+        self.jobs = {}
+
+    def prepare(self, question, documents):
+        """(clave de caché, llamada, contexto); la llamada es None si ningún documento cupo en el prompt."""
+        context = build_prompt(SUMMARY_PROMPT, documents, self.model, field_chars=SUMMARY_FIELD_CHARS)
+        params = {"max_new_tokens": choose_max_new_tokens(question, SUMMARY_MAX_NEW_TOKENS), "return_full_text": False}
+        key = answer_key(self.model, question, [d["doc"] for d in context.records], params)
+        if documents and not context.records:
+            return key, None, context
+        return key, (context.prompt, json.dumps(params, sort_keys=True)), context
+
+    def _run(self, job, keys):
+        started = time.perf_counter()
+        cached = next((value for value in map(self.cache.get, keys) if value is not None), None)
+        try:
+            if cached is None:
+                prompt, params = job
+                answer = "".join(stream_tokens(self.model, prompt, json.loads(params), self.api_token, url=self.url))
+            else:
+                answer = cached
+            for key in keys:
+                self.cache.put(key, answer)
+            return {"answer": answer, "error": None, "cached": cached is not None,
+                    "ms": (time.perf_counter() - started) * 1000}
+        except Exception as e:
+            return {"answer": None, "error": str(e), "cached": False, "ms": (time.perf_counter() - started) * 1000}
+
+    def answer(self, prepared):
+        """Resuelve las llamadas pendientes de un lote [(key, job, ...)] en paralelo; None para las que no van al modelo."""
+        pending = {}
+        for key, job in prepared:
+            if job is not None and job not in self.jobs:
+                pending.setdefault(job, []).append(key)
+        futures = {job: self.threads.submit(self._run, job, keys) for job, keys in pending.items()}
+        for job, future in futures.items():
+            self.jobs[job] = future.result()
+        return [self.jobs[job] if job is not None else SKIPPED for _, job in prepared]
+
+
+# 📌 Procesar el archivo
+def run(input_path, output_path, workers=None, batch_size=BATCH_SIZE, concurrency=CONCURRENCY,
+        model=DEFAULT_MODEL, api_token=None, url=None, generate=True):
+    done = answered_ids(output_path, require_answer=generate)
+    items = [(item_id, question) for item_id, question in read_questions(input_path)
+             if json.dumps(item_id) not in done]
+    if not items:
+        print(f"✅ Todas las preguntas de {input_path} ya están en {output_path}")
+        return {"answered": 0, "skipped": len(done)}
+
+    # Una recuperación por pregunta distinta, en el orden en que aparecen
+    unique = list(dict.fromkeys(normalize_question(question) for _, question in items))
+    answerer = BatchAnswerer(model, api_token, concurrency, url)
+    retrieved = {}
+    stats = {"answered": 0, "errors": 0, "cached": 0, "skipped": len(done), "retrievals": len(unique)}
+    started = time.perf_counter()
+
+    snapshot, query_vectors = prepare_indices(unique)
+    dense = query_vectors is not None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(snapshot, dense)) as pool, \
+            open(output_path, "a", encoding="utf-8") as out:
+        results = pool.map(_retrieve, zip(unique, query_vectors if dense else [None] * len(unique)),
+                           chunksize=CHUNK_SIZE)
+        pending_unique = iter(unique)
+        for batch in _batches(items, batch_size):
+            batch_started = time.perf_counter()
+            keys = [normalize_question(question) for _, question in batch]
+            # pool.map entrega en orden: basta avanzar hasta la última pregunta nueva del lote
+            while any(key not in retrieved for key in keys):
+                retrieved[next(pending_unique)] = next(results)
+
+            prepared, contexts = [], []
+            for (_, question), key in zip(batch, keys):
+                cache_key, job, context = answerer.prepare(question, retrieved[key][0])
+                prepared.append((cache_key, job))
+                contexts.append(context)
+            outcomes = answerer.answer(prepared) if generate else [None] * len(batch)
+            batch_ms = (time.perf_counter() - batch_started) * 1000
+
+            for (item_id, question), key, context, outcome in zip(batch, keys, contexts, outcomes):
+                documents, retrieval_ms = retrieved[key]
+                row = {
+                    "id": item_id,
+                    "question": question,
+                    "documents": [d["doc"] for d in documents],
+                    "prompt_tokens": context.tokens,
+                    "answer": outcome["answer"] if outcome else None,
+                    "error": outcome["error"] if outcome else None,
+                    "cached": outcome["cached"] if outcome else False,
+                    "timings_ms": {
+                        "retrieval": round(retrieval_ms, 2),
+                        "generation": round(outcome["ms"], 2) if outcome else 0.0,
+                        "batch": round(batch_ms, 2),
+                    },
+                }
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                stats["answered"] += 1
+                stats["errors"] += bool(row["error"])
+                stats["cached"] += row["cached"]
+            out.flush()
+
+    elapsed = time.perf_counter() - started
+    answerer.threads.shutdown()
+    stats["llm_calls"] = sum(not job["cached"] for job in answerer.jobs.values())
+    print(f"✅ {stats['answered']} preguntas en {elapsed:.1f} s ({stats['answered'] / elapsed:.1f} por segundo): "
+          f"{stats['retrievals']} recuperaciones, {stats['llm_calls']} llamadas al modelo, "
+          f"{stats['cached']} desde la caché, {stats['errors']} con error")
+    return stats
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Responde en lote las preguntas de un archivo JSONL.")
+    parser.add_argument("input", help="JSONL con una pregunta por línea: {\"id\": ..., \"question\": ...}")
+    parser.add_argument("output", help="JSONL de respuestas (se reanuda si ya existe)")
+    parser.add_argument("--workers", type=int, default=None, help="procesos para la recuperación (por defecto, uno por núcleo)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="preguntas por lote de escritura")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="llamadas simultáneas al modelo")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME") or DEFAULT_MODEL)
+    parser.add_argument("--endpoint", default=None, help="URL de generación (p. ej. un text-generation-inference propio)")
+    parser.add_argument("--no-llm", action="store_true", help="sólo recuperación (evaluación o precalentar índices)")
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.workers, args.batch_size, args.concurrency, args.model,
+        os.getenv("HF_API_TOKEN"), args.endpoint, generate=not args.no_llm)
@@ -0,0 +1,410 @@
+"""Benchmarks y pruebas de carga reproducibles del buscador.
+
+    python benchmark.py                     # todo, comparado con benchmarks/baseline.json
+    python benchmark.py --save-baseline     # guarda esta corrida como línea base
+    python benchmark.py --only micro        # sólo micro-benchmarks (o --only load)
+    python benchmark.py --users 16 --requests 400 --sparql-latency 30 --first-token 300 --token-ms 5
+
+Las preguntas son fijas (benchmarks/preguntas.jsonl: años, rangos, nombres,
+temas y preguntas sin resultados) y todo corre sobre dataset.ttl. GraphDB y
+la API de inferencia se reemplazan por los stand-ins locales de stand_ins.py,
+con latencia configurable y jitter con semilla. Cada medición reporta
+p50/p95/p99 y rendimiento. La prueba de carga se corre en frío (cachés de
+rankings y de palabras clave vaciadas antes de cada petición) y en caliente,
+y cuenta como error toda petición con una etapa de recuperación degradada o
+sin resultados para una pregunta que debe tenerlos (`expect_matches`). Contra
+la línea base, una regresión mayor que la tolerancia termina con código 1 y
+una configuración distinta con código 2.
+La línea base depende de la máquina: se genera en la misma máquina (o runner
+de CI) donde se compara.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backends import (FallbackBackend, LocalBackend, SparqlBackend, bulk_load, select_documents,
+                      snapshot_ntriples)
+from context_builder import (SUMMARY_FIELD_CHARS, SUMMARY_MAX_NEW_TOKENS, SUMMARY_PROMPT, build_prompt,
+                             choose_max_new_tokens)
+from fuzzy_index import load_fuzzy_index
+from llm_stream import stream_tokens
+from metrics import REGISTRY, summary_rows
+from query_analysis import analyze_question, clear_cache
+from retrieval import build_retriever
+from snapshot import load_or_build_snapshot
+from stand_ins import start_inference_stand_in, start_sparql_stand_in
+from text_index import load_text_index
+from triple_store import TripleStore
+from year_index import build_year_index
+
+RDF_FILE = "dataset.ttl"
+METADATA_FILE = "metadata.json"
+CORPUS_FILE = os.path.join("benchmarks", "preguntas.jsonl")
+BASELINE_FILE = os.path.join("benchmarks", "baseline.json")
+# Cambia cuando cambian las mediciones: una línea base de otra versión no es comparable
+BENCHMARK_VERSION = 2
+DEFAULT_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+REPOSITORY = "IRA"
+TOP_K = 10
+REPEAT = 5
+PARSE_REPEAT = 3
+TOLERANCE = 0.25
+# Diferencias menores que esto no cuentan como regresión (ruido en etapas de microsegundos)
+MIN_DELTA_MS = 2.0
+DOCUMENT_FIELDS = ("title", "date", "subject", "description", "publisher")
+# Las variables que pide app3 a su backend
+APP3_VARIABLES = ("doc", "title", "date", "creator", "subject", "description", "publisher")
+
+# La consulta en estrella de app.py y su variante con FILTER por año
+STAR_QUERY = """
+    PREFIX dc: <http://purl.org/dc/elements/1.1/>
+    SELECT ?doc ?title ?date ?creator ?subject WHERE {
+        ?doc dc:title ?title .
+        OPTIONAL { ?doc dc:date ?date }
+        OPTIONAL { ?doc dc:creator ?creator }
+        OPTIONAL { ?doc dc:subject ?subject }
+    }
+    """.strip()
+YEAR_QUERY = STAR_QUERY.replace(
+    "OPTIONAL { ?doc dc:subject ?subject }",
+    'OPTIONAL { ?doc dc:subject ?subject }\n        FILTER(?date = "1906"^^<http://www.w3.org/2001/XMLSchema#gYear>)',
+)
+
+
+# 📌 Corpus y estadísticas
+def read_corpus(path=CORPUS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def latency_stats(samples_ms, elapsed_s=None):
+    """p50/p95/p99 en ms; el rendimiento es por segundo de pared (o de trabajo, si no se pasa `elapsed_s`)."""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if not len(samples):
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]).tolist()
+    elapsed_s = samples.sum() / 1000 if elapsed_s is None else elapsed_s
+    return {
+        "n": len(samples),
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "max_ms": round(float(samples.max()), 3),
+        "throughput_per_s": round(len(samples) / elapsed_s, 3) if elapsed_s > 0 else None,
+    }
+
+
+def measure(function, inputs=(None,), repeat=REPEAT, warmup=1, before=None):
+    """Tiempos (ms) de `function(x)` para cada entrada, `repeat` veces, tras `warmup` pasadas sin medir."""
+    samples = []
+    for round_number in range(warmup + repeat):
+        for value in inputs:
+            if before is not None:
+                before()
+            started = time.perf_counter()
+            function(value)
+            if round_number >= warmup:
+                samples.append((time.perf_counter() - started) * 1000)
+    return latency_stats(samples)
+
+
+# 📌 El pipeline de las apps, sin Streamlit
+def load_search_index():
+    store = TripleStore(load_or_build_snapshot(RDF_FILE, METADATA_FILE))
+    retriever = build_retriever(store, load_text_index(store), build_year_index(store), fuzzy_index=load_fuzzy_index(store))
+    return store, retriever
+
+
+def lexical_query(question):
+    keywords = analyze_question(question).keywords
+    return " ".join(keywords) if keywords else None
+
+
+def local_documents(store, retriever, question):
+    """Primera página como la arma batch_qa (sin GraphDB)."""
+    page = retriever.page(question, TOP_K, lexical_query=lexical_query(question))
+    return [
+        dict({"doc": store.doc_iri(doc_id)},
+             **{name: (store.values(name, doc_id) or [""])[0] for name in DOCUMENT_FIELDS})
+        for doc_id in page.doc_ids
+    ]
+
+
+def fetch_documents(backend, doc_iris):
+    """Como el fetch_documents de app3: una fila por documento, en el orden del ranking."""
+    documents = {}
+    for row in select_documents(backend, doc_iris, APP3_VARIABLES):
+        documents.setdefault(row["doc"], {name: row.get(name) or "" for name in ("doc",) + DOCUMENT_FIELDS})
+    return list(documents.values())
+
+
+def summary_prompt(question, documents, model):
+    context = build_prompt(SUMMARY_PROMPT, documents, model, field_chars=SUMMARY_FIELD_CHARS)
+    params = {"max_new_tokens": choose_max_new_tokens(question, SUMMARY_MAX_NEW_TOKENS), "return_full_text": False}
+    return context.prompt, params
+
+
+def generate(model, prompt, params, inference_url, on_first_token=None):
+    """Genera contra el stand-in sin pasar por la caché de respuestas (se mide la generación)."""
+    chunks = []
+    for token in stream_tokens(model, prompt, params, None, url=f"{inference_url}/models/{model}"):
+        if not chunks and on_first_token is not None:
+            on_first_token()
+        chunks.append(token)
+    return "".join(chunks)
+
+
+# 📌 Micro-benchmarks
+def micro_benchmarks(store, retriever, questions, model, repeat=REPEAT, parse_repeat=PARSE_REPEAT):
+    results = {}
+    print("⏱️ Arranque...")
+    results["startup.snapshot"] = measure(lambda _: TripleStore(load_or_build_snapshot(RDF_FILE, METADATA_FILE)),
+                                          repeat=repeat)
+    results["startup.indices"] = measure(
+        lambda _: (load_text_index(store), load_fuzzy_index(store), build_year_index(store)), repeat=repeat)
+    if parse_repeat:
+        import rdflib
+        results["startup.parse_ttl"] = measure(lambda _: rdflib.Graph().parse(RDF_FILE, format="turtle"),
+                                               repeat=parse_repeat, warmup=0)
+
+    print("⏱️ Consultas SPARQL locales (query_rdf)...")
+    local = LocalBackend(store)
+    results["query_rdf.star"] = measure(lambda _: local.select(STAR_QUERY), repeat=repeat)
+    results["query_rdf.year"] = measure(lambda _: local.select(YEAR_QUERY), repeat=repeat)
+
+    print("⏱️ Palabras clave y recuperación...")
+    results["keywords.cold"] = measure(analyze_question, questions, repeat=repeat, before=clear_cache)
+    results["keywords.warm"] = measure(analyze_question, questions, repeat=repeat)
+    # retrieve() no pasa por la caché de rankings: mide BM25 + trigramas + denso + fusión
+    results["retrieval"] = measure(lambda q: retriever.retrieve(q, None, lexical_query(q)), questions, repeat=repeat)
+
+    print("⏱️ Resumen (prompt y generación contra un stand-in sin latencia)...")
+    documents = {q: local_documents(store, retriever, q) for q in questions}
+    with_documents = [q for q in questions if documents[q]]
+    results["summary.prompt"] = measure(lambda q: summary_prompt(q, documents[q], model), with_documents, repeat=repeat)
+    prompts = {q: summary_prompt(q, documents[q], model) for q in with_documents}
+    with start_inference_stand_in() as inference:
+        results["summary.generate"] = measure(lambda q: generate(model, *prompts[q], inference.url),
+                                              with_documents, repeat=1)
+
+    print("⏱️ Carga masiva (Graph Store HTTP contra el stand-in)...")
+    with start_sparql_stand_in(store, repository=REPOSITORY) as sparql:
+        url = f"{sparql.url}/repositories/{REPOSITORY}/rdf-graphs/service?default"
+        results["backend.bulk_load"] = measure(lambda _: bulk_load(snapshot_ntriples(store.snapshot), url, replace=True),
+                                               repeat=1)
+        uploaded = sum(body.count("\n") for body in sparql.uploads)
+    if uploaded != len(store.snapshot):
+        print(f"⚠️ El stand-in recibió {uploaded} tripletas de {len(store.snapshot)}")
+        results["backend.bulk_load"]["errors"] = 1
+    return results
+
+
+# 📌 Prueba de carga: N usuarios concurrentes contra los stand-ins
+def clear_caches(retriever):
+    """Deja en frío las cachés de la recuperación: rankings y análisis de preguntas."""
+    retriever.clear_cache()
+    clear_cache()
+
+
+def load_test(store, retriever, corpus, model, users, requests, sparql_latency=0.0, first_token_ms=0.0,
+              token_ms=0.0, jitter_ms=0.0, seed=0):
+    """Cada petición es el process_question de app3: análisis, página, GraphDB, prompt y generación completa.
+
+    Se corre dos veces con la misma secuencia: `load.cold` vacía las cachés antes de
+    cada petición y `load.warm` las usa (tras una pasada sin medir por el corpus).
+    Una recuperación degradada (etapa con timeout o error) o vacía cuando la pregunta
+    tiene `expect_matches` cuenta como error, no como una petición rápida.
+    """
+    results = {}
+    with start_sparql_stand_in(store, sparql_latency, jitter_ms, REPOSITORY, seed=seed) as sparql, \
+            start_inference_stand_in(first_token_ms, token_ms, jitter_ms, seed=seed) as inference:
+        # El backend de app3 con GRAPHDB_SERVER definido: remoto con respaldo local
+        backend = FallbackBackend(SparqlBackend(f"{sparql.url}/repositories/{REPOSITORY}"), LocalBackend(store))
+
+        def answer(item, cold=False):
+            if cold:
+                clear_caches(retriever)
+            question = item["question"]
+            started = time.perf_counter()
+            first_token = []
+            try:
+                page = retriever.page(question, TOP_K, lexical_query=lexical_query(question))
+                doc_iris = [store.doc_iri(doc_id) for doc_id in page.doc_ids]
+                documents = fetch_documents(backend, doc_iris) if doc_iris else []
+                if documents:
+                    prompt, params = summary_prompt(question, documents, model)
+                    generate(model, prompt, params, inference.url,
+                             on_first_token=lambda: first_token.append((time.perf_counter() - started) * 1000))
+                degraded = sorted(name for name, stage in page.stages.items() if stage["status"] != "ok")
+                if degraded:
+                    error = f"Recuperación degradada ({', '.join(degraded)}): {item['id']}"
+                elif item.get("expect_matches") and not documents:
+                    error = f"Sin resultados: {item['id']}"
+                else:
+                    error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            return (time.perf_counter() - started) * 1000, first_token[0] if first_token else None, error
+
+        # Misma secuencia de preguntas en cada corrida: la petición i es la pregunta i del corpus (en ciclo)
+        sequence = [corpus[i % len(corpus)] for i in range(requests)]
+        stages = {}
+        for phase in ("cold", "warm"):
+            if phase == "warm":
+                clear_caches(retriever)
+                for item in corpus:
+                    answer(item)
+            print(f"🚦 Carga en {'frío' if phase == 'cold' else 'caliente'}: {requests} peticiones, "
+                  f"{users} usuarios concurrentes...")
+            REGISTRY.reset()
+            fallbacks = backend.fallbacks
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=users, thread_name_prefix=f"load-{phase}") as pool:
+                outcomes = list(pool.map(lambda item: answer(item, cold=phase == "cold"), sequence))
+            elapsed = time.perf_counter() - started
+            stages[phase] = summary_rows()
+
+            errors = [error for _, _, error in outcomes if error]
+            results[f"load.{phase}.request"] = dict(
+                latency_stats([ms for ms, _, _ in outcomes], elapsed), errors=len(errors),
+                degraded=sum(error.startswith("Recuperación degradada") for error in errors),
+                empty=sum(error.startswith("Sin resultados") for error in errors),
+                fallbacks=backend.fallbacks - fallbacks,
+            )
+            results[f"load.{phase}.first_token"] = latency_stats([ms for _, ms, _ in outcomes if ms is not None])
+            for error in sorted(set(errors))[:5]:
+                print(f"⚠️ {error}")
+    return results, stages["cold"]
+
+
+# 📌 Línea base
+def compare(results, baseline, tolerance=TOLERANCE, min_delta_ms=MIN_DELTA_MS):
+    """Lista de regresiones (textos) respecto de la línea base."""
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if not previous or not current.get("n"):
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            before, after = previous.get(metric), current.get(metric)
+            if before is not None and after is not None \
+                    and after > before * (1 + tolerance) and after - before > min_delta_ms:
+                regressions.append(f"{name} {metric}: {before:.2f} → {after:.2f} ms (+{(after / before - 1) * 100:.0f}%)")
+        before, after = previous.get("throughput_per_s"), current.get("throughput_per_s")
+        if before and after is not None and after < before / (1 + tolerance):
+            regressions.append(f"{name} rendimiento: {before:.1f} → {after:.1f} por segundo")
+        for counter, label in (("errors", "errores"), ("degraded", "recuperaciones degradadas"),
+                               ("empty", "preguntas sin resultados"), ("fallbacks", "respuestas del respaldo local")):
+            if current.get(counter, 0) > previous.get(counter, 0):
+                regressions.append(f"{name} {label}: {previous.get(counter, 0)} → {current[counter]}")
+    return regressions
+
+
+def print_report(benchmarks, stages=None):
+    print(f"\n{'benchmark':<22}{'n':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'por s':>10}")
+    for name, stats in benchmarks.items():
+        if not stats.get("n"):
+            print(f"{name:<22}{0:>6}")
+            continue
+        print(f"{name:<22}{stats['n']:>6}{stats['p50_ms']:>11.2f}{stats['p95_ms']:>11.2f}{stats['p99_ms']:>11.2f}"
+              f"{stats['throughput_per_s'] or 0:>10.1f}")
+    if stages:
+        print("\nEtapas durante la carga en frío (metrics):")
+        for row in stages:
+            if row["count"]:
+                print(f"  {row['stage']:<24}{row['count']:>7} × {row['mean_ms']:>9.2f} ms (máx. {row['max_ms']:.2f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks y pruebas de carga con stand-ins locales.")
+    parser.add_argument("--only", choices=("micro", "load"), default=None)
+    parser.add_argument("--corpus", default=CORPUS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="guarda los resultados como línea base")
+    parser.add_argument("--output", default=None, help="JSON con los resultados de esta corrida")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="regresión tolerada (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="pasadas medidas por micro-benchmark")
+    parser.add_argument("--parse-repeat", type=int, default=PARSE_REPEAT, help="parseos de dataset.ttl (0 = omitir)")
+    parser.add_argument("--users", type=int, default=8, help="usuarios concurrentes")
+    parser.add_argument("--requests", type=int, default=200, help="peticiones totales de la prueba de carga")
+    parser.add_argument("--sparql-latency", type=float, default=20.0, help="ms por consulta del stand-in de GraphDB")
+    parser.add_argument("--first-token", type=float, default=100.0, help="ms hasta el primer token del stand-in de inferencia")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="ms entre tokens del stand-in de inferencia")
+    parser.add_argument("--jitter", type=float, default=0.0, help="jitter máximo (ms) de los stand-ins")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="modelo cuyo tokenizador arma los prompts")
+    args = parser.parse_args()
+
+    corpus = read_corpus(args.corpus)
+    questions = [item["question"] for item in corpus]
+    store, retriever = load_search_index()
+    config = {
+        "version": BENCHMARK_VERSION,
+        "corpus": file_digest(args.corpus),
+        "dataset": store.snapshot.fingerprint,
+        "model": args.model,
+        "repeat": args.repeat,
+        "parse_repeat": args.parse_repeat,
+        "users": args.users,
+        "requests": args.requests,
+        "sparql_latency": args.sparql_latency,
+        "first_token": args.first_token,
+        "token_ms": args.token_ms,
+        "jitter": args.jitter,
+        "seed": args.seed,
+    }
+
+    benchmarks, stages = {}, None
+    if args.only in (None, "micro"):
+        benchmarks.update(micro_benchmarks(store, retriever, questions, args.model, args.repeat, args.parse_repeat))
+    if args.only in (None, "load"):
+        load_results, stages = load_test(store, retriever, corpus, args.model, args.users, args.requests,
+                                         args.sparql_latency, args.first_token, args.token_ms, args.jitter, args.seed)
+        benchmarks.update(load_results)
+    results = {
+        "config": config,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "benchmarks": benchmarks,
+    }
+    print_report(benchmarks, stages)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Línea base guardada en {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSin línea base en {args.baseline}; usa --save-baseline para crearla")
+        sys.exit(0)
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    different = sorted(key for key in config if baseline.get("config", {}).get(key) != config[key])
+    if different:
+        print(f"\n❌ La línea base se midió con otra configuración ({', '.join(different)}); "
+              f"repite con la misma o guarda una nueva con --save-baseline")
+        sys.exit(2)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regresiones respecto de {args.baseline} (tolerancia {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"\n✅ Sin regresiones respecto de {args.baseline} (tolerancia {args.tolerance:.0%})")
@@ -0,0 +1,202 @@
+"""Contexto de los prompts con presupuesto de tokens.
+
+Los tokens se cuentan con el tokenizador del modelo (paquete `tokenizers`,
+cargado una vez por modelo); si no está disponible se estima por caracteres.
+Los registros entran en orden de relevancia hasta agotar el presupuesto (el
+primero siempre, recortado si hace falta) y lo que se repite en todos (p. ej. el editor "Archivo Histórico Riva-Agüero…" o
+el sufijo "[fotografía]" de los títulos) se escribe una sola vez.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from metrics import record
+from text_utils import fold_text
+
+DEFAULT_PROMPT_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1024"))
+# Estimación sin tokenizador: los tokenizadores de Mistral/Llama dan ~3 caracteres por token en español
+CHARS_PER_TOKEN = 3.0
+FIELD_LABELS = {
+    "title": "Título",
+    "date": "Fecha",
+    "creator": "Autor",
+    "subject": "Tema",
+    "description": "Descripción",
+    "publisher": "Editor",
+}
+RECORD_SEPARATOR = "\n\n"
+# Un primer registro recortado a menos que esto no aporta nada al modelo
+MIN_TRUNCATED_CHARS = 20
+# Lo que se muestra en lugar de la respuesta cuando no entra ningún registro
+NO_CONTEXT_MESSAGE = "Los documentos encontrados no caben en el presupuesto del prompt (PROMPT_TOKEN_BUDGET)."
+
+# Tokens de respuesta según el tipo de pregunta (se prueba en este orden)
+QUESTION_TYPES = (
+    ("factual", re.compile(r"^(quien|quienes|cuando|donde|cuantos|cuantas|en que ano|que fecha)\b")),
+    ("list", re.compile(r"\b(lista|listar|enumera|cuales|que documentos|que fotografias|muestra)\b")),
+)
+MAX_NEW_TOKENS = {"factual": 150, "list": 350, "summary": 600}
+
+# Prompt de resumen de app3 (también lo usa el modo por lotes, así comparten la caché de respuestas)
+SUMMARY_PROMPT = """
+    [INST] Como experto en historia peruana del siglo XIX, genera:
+    1. Un párrafo resumen con los aspectos clave
+    2. Lista de puntos importantes
+    3. Contexto histórico relevante
+    
+    Información a analizar:
+    {context}
+    [/INST]
+    """
+SUMMARY_FIELD_CHARS = {"description": 200}
+SUMMARY_MAX_NEW_TOKENS = 600
+
+PromptContext = namedtuple("PromptContext", ["prompt", "records", "tokens", "dropped"])
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def load_tokenizer(model):
+    """Tokenizador de Hugging Face del modelo, o None si no se puede cargar (se recuerda el fallo)."""
+    with _tokenizers_lock:
+        if model not in _tokenizers:
+            try:
+                from tokenizers import Tokenizer
+                _tokenizers[model] = Tokenizer.from_pretrained(model, auth_token=os.getenv("HF_API_TOKEN"))
+            except Exception as e:
+                print(f"Tokenizador de {model} no disponible ({e}); se estiman los tokens por caracteres")
+                _tokenizers[model] = None
+        return _tokenizers[model]
+
+
+def count_tokens(text, model=None):
+    tokenizer = load_tokenizer(model) if model else None
+    if tokenizer is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def question_type(question):
+    folded = fold_text(question or "").strip(" ¿?¡!")
+    return next((name for name, pattern in QUESTION_TYPES if pattern.search(folded)), "summary")
+
+
+def choose_max_new_tokens(question, limit=None):
+    """max_new_tokens para la pregunta, sin pasar de `limit`."""
+    tokens = MAX_NEW_TOKENS[question_type(question)]
+    return min(tokens, limit) if limit else tokens
+
+
+def _common_affix(values, suffix=False):
+    """Prefijo (o sufijo) común a todos los valores, cortado en un límite de palabra."""
+    if len(values) < 2:
+        return ""
+    texts = [value[::-1] for value in values] if suffix else values
+    common = os.path.commonprefix(texts)
+    # Se corta en el último espacio para no partir palabras ni vaciar un valor
+    common = common[:common.rfind(" ") + 1]
+    common = common[::-1] if suffix else common
+    return common if len(common.strip()) >= 4 else ""
+
+
+def _shared_boilerplate(records, fields):
+    """Campos con el mismo valor en todos los registros y prefijos/sufijos comunes por campo."""
+    constant, affixes = {}, {}
+    for name in fields:
+        values = [record.get(name) or "" for record in records]
+        if len(records) > 1 and values[0] and all(value == values[0] for value in values):
+            constant[name] = values[0]
+        elif all(values):
+            # El sufijo se busca en lo que queda tras el prefijo, así nunca se solapan
+            prefix = _common_affix(values)
+            affixes[name] = (prefix, _common_affix([value[len(prefix):] for value in values], suffix=True))
+    return constant, affixes
+
+
+def _render_record(record, fields, constant, affixes, field_chars):
+    if isinstance(record, str):
+        return record
+    lines = []
+    for name in fields:
+        value = record.get(name) or ""
+        if name in constant or not value:
+            continue
+        prefix, suffix = affixes.get(name, ("", ""))
+        value = value[len(prefix):len(value) - len(suffix)].strip()
+        if not value:
+            # Todo el valor quedó en el encabezado común: sin línea vacía
+            continue
+        limit = field_chars.get(name)
+        if limit and len(value) > limit:
+            value = value[:limit].rstrip() + "..."
+        lines.append(f"{FIELD_LABELS.get(name, name)}: {value}")
+    return "\n".join(lines)
+
+
+def _render_header(constant, affixes):
+    parts = [f"{FIELD_LABELS.get(name, name)}: {value}" for name, value in constant.items()]
+    for name, (prefix, suffix) in affixes.items():
+        if prefix or suffix:
+            parts.append(f"{FIELD_LABELS.get(name, name)}: {prefix.strip()}…{suffix.strip()}")
+    return f"Común a todos los registros: {'; '.join(parts)}" if parts else ""
+
+
+def _truncate_to_budget(text, tokens, model, separator):
+    """El prefijo más largo de `text` (con "...") que cabe en `tokens`, o "" si no cabe nada útil."""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle].rstrip() + "..." + separator, model) <= tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + "..." if low >= MIN_TRUNCATED_CHARS else ""
+
+
+# 📌 Armar el prompt dentro del presupuesto
+def build_prompt(template, records, model=None, budget=DEFAULT_PROMPT_BUDGET, fields=tuple(FIELD_LABELS),
+                 field_chars=None, separator=RECORD_SEPARATOR, **values):
+    """Rellena `{context}` del template con los registros que caben en `budget` tokens.
+
+    `records` va en orden de relevancia (dicts con los campos de FIELD_LABELS, o
+    textos ya armados, p. ej. las frases de un resumen); se descartan desde el
+    final, pero el primero entra siempre, recortado si no cabe entero. Si ni así
+    cabe, `records` del resultado queda vacío y no conviene llamar al modelo.
+    `values` rellena el resto de los campos del template (p. ej. `question`).
+    """
+    started = time.perf_counter()
+    records = list(records)
+    field_chars = field_chars or {}
+    dict_records = [entry for entry in records if not isinstance(entry, str)]
+    constant, affixes = _shared_boilerplate(dict_records, fields) if dict_records else ({}, {})
+    header = _render_header(constant, affixes)
+
+    used = count_tokens(template.format(context="", **values), model)
+    if header:
+        used += count_tokens(header + separator, model)
+    blocks = []
+    for entry in records:
+        block = _render_record(entry, fields, constant, affixes, field_chars)
+        cost = count_tokens(block + separator, model)
+        if used + cost > budget:
+            if not blocks:
+                block = _truncate_to_budget(block, budget - used, model, separator)
+                if block:
+                    blocks.append(block)
+                    used += count_tokens(block + separator, model)
+            break
+        blocks.append(block)
+        used += cost
+
+    if not blocks:
+        header = ""
+        used = count_tokens(template.format(context="", **values), model)
+    context = separator.join(([header] if header else []) + blocks)
+    prompt = template.format(context=context, **values)
+    record("prompt.build", (time.perf_counter() - started) * 1000, size=used, unit="tokens",
+           dropped=len(records) - len(blocks))
+    return PromptContext(prompt, records[:len(blocks)], used, len(records) - len(blocks))
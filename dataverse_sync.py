@@ -0,0 +1,212 @@
+"""Descarga incremental de los archivos del dataset desde Dataverse.
+
+La lista de archivos (id, tamaño, checksum) sale de metadata.json. Cada
+archivo se descarga por separado y en paralelo con una sesión HTTP con pool
+de conexiones (http_client); las descargas interrumpidas se retoman con cabeceras Range
+desde el `.part` y cada archivo se verifica contra su checksum. Los archivos
+que ya están y son válidos no se vuelven a transferir.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+
+from http_client import HttpClient
+
+CHUNK_SIZE = 1024 * 1024
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 4
+STATE_FILE = ".sync_state.json"
+
+
+def dataset_files(metadata_file):
+    """Lista de archivos del dataset según metadata.json."""
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    files = []
+    for entry in metadata["datasetVersion"]["files"]:
+        data_file = entry["dataFile"]
+        checksum = data_file.get("checksum") or {"type": "MD5", "value": data_file.get("md5")}
+        files.append({
+            "id": data_file["id"],
+            "filename": data_file["filename"],
+            "directory": entry.get("directoryLabel") or "",
+            "size": data_file.get("filesize"),
+            "checksum_type": checksum["type"],
+            "checksum": checksum["value"],
+            # En archivos tabulares Dataverse sirve el .tab, pero el checksum es del original
+            "tabular": data_file.get("tabularData", False),
+        })
+    return files
+
+
+def _auth_headers(api_key):
+    return {"X-Dataverse-key": api_key} if api_key else {}
+
+
+def fetch_metadata(base_url, persistent_id, metadata_file, api_key=None, client=None):
+    """Actualiza metadata.json con la última versión publicada del dataset.
+
+    Se pide la exportación `dataverse_json` (con `datasetVersion`), el mismo formato
+    que leen dataset_files, snapshot.read_dataset_version y thumbnails; la respuesta de
+    /api/datasets/:persistentId/ trae `latestVersion` y no sirve aquí.
+    """
+    client = client or make_client(1)
+    response = client.get(f"{base_url}/api/datasets/export",
+                          params={"exporter": "dataverse_json", "persistentId": persistent_id},
+                          headers=_auth_headers(api_key), timeout=30)
+    response.raise_for_status()
+    metadata = response.json()
+    if "datasetVersion" not in metadata:
+        raise ValueError(f"La exportación de {persistent_id} no tiene datasetVersion")
+    # Se escribe aparte y se reemplaza: un metadata.json a medias rompería la siguiente ingesta
+    tmp_path = metadata_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, metadata_file)
+
+
+def make_client(max_workers=MAX_WORKERS):
+    """Cliente con un pool keep-alive y una concurrencia por host del tamaño del pool de hilos."""
+    return HttpClient(max_connections=max_workers, max_keepalive=max_workers, host_concurrency=max_workers,
+                      timeout=60)
+
+
+def file_digest(path, checksum_type="MD5"):
+    """Calcula el checksum de un archivo por bloques."""
+    digest = hashlib.new(checksum_type.lower().replace("-", ""))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+
+def _load_state(dest_dir):
+    try:
+        with open(os.path.join(dest_dir, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(dest_dir, state):
+    tmp_path = os.path.join(dest_dir, STATE_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(dest_dir, STATE_FILE))
+
+
+def _state_key(entry):
+    return f"{entry['id']}:{entry['checksum']}"
+
+
+def relative_path(entry):
+    """Ruta del archivo dentro del dataset; Dataverse admite el mismo nombre en carpetas distintas."""
+    return "/".join(part for part in (entry["directory"].strip("/"), entry["filename"]) if part)
+
+
+def is_up_to_date(entry, path, state):
+    """Un archivo está al día si coincide con el estado guardado o con su checksum."""
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    saved = state.get(relative_path(entry))
+    if saved and saved["key"] == _state_key(entry) and saved["size"] == stat.st_size and saved["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    if entry["tabular"]:
+        return False
+    if entry["size"] is not None and stat.st_size != entry["size"]:
+        return False
+    return file_digest(path, entry["checksum_type"]).hexdigest() == entry["checksum"]
+
+
+def download_file(client, base_url, entry, path, api_key=None):
+    """Descarga un archivo retomando el `.part` con Range y verifica su checksum."""
+    part_path = path + ".part"
+    url = f"{base_url}/api/access/datafile/{entry['id']}"
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = _auth_headers(api_key)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 416:
+                    # El .part ya está completo (o es inválido): se verifica más abajo
+                    pass
+                else:
+                    response.raise_for_status()
+                    # Si el servidor ignora el Range responde 200 con el archivo completo
+                    mode = "ab" if offset and response.status_code == 206 else "wb"
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_bytes(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+        except httpx.HTTPStatusError:
+            # 429/5xx ya los reintentó el cliente; un 4xx no se arregla reintentando
+            raise
+        except httpx.HTTPError as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            print(f"Reintentando {relative_path(entry)} ({attempt}/{MAX_ATTEMPTS}): {e}")
+            time.sleep(min(2 ** attempt, 30))
+            continue
+
+        if entry["tabular"] or file_digest(part_path, entry["checksum_type"]).hexdigest() == entry["checksum"]:
+            os.replace(part_path, path)
+            return os.path.getsize(path)
+
+        # Checksum incorrecto: se descarta el parcial y se reintenta desde cero
+        os.remove(part_path)
+        print(f"⚠️ Checksum incorrecto en {relative_path(entry)}, descargando de nuevo")
+    raise IOError(f"No se pudo descargar {relative_path(entry)} con un checksum válido")
+
+
+def sync_dataset(base_url, metadata_file, dest_dir, api_key=None, max_workers=MAX_WORKERS, client=None):
+    """Sincroniza `dest_dir` con la lista de archivos de metadata.json.
+
+    Devuelve un resumen con los archivos descargados, omitidos y fallidos (por
+    ruta dentro del dataset, que también es la clave de `.sync_state.json`).
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    files = dataset_files(metadata_file)
+    state = _load_state(dest_dir)
+    client = client or make_client(max_workers)
+
+    pending = []
+    skipped = []
+    for entry in files:
+        path = os.path.join(dest_dir, entry["directory"], entry["filename"])
+        if is_up_to_date(entry, path, state):
+            skipped.append((entry, path))
+        else:
+            pending.append((entry, path))
+
+    downloaded, failed = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for entry, path in pending:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            futures[executor.submit(download_file, client, base_url, entry, path, api_key)] = (entry, path)
+        for future in as_completed(futures):
+            entry, path = futures[future]
+            try:
+                future.result()
+            except (IOError, httpx.HTTPError) as e:
+                print(f"Error al descargar {relative_path(entry)}: {e}")
+                failed.append(relative_path(entry))
+                continue
+            stat = os.stat(path)
+            state[relative_path(entry)] = {"key": _state_key(entry), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            downloaded.append(relative_path(entry))
+
+    # Los archivos omitidos también quedan registrados para no volver a calcular su checksum
+    for entry, path in skipped:
+        stat = os.stat(path)
+        state[relative_path(entry)] = {"key": _state_key(entry), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    _save_state(dest_dir, state)
+
+    return {"downloaded": downloaded, "skipped": [relative_path(entry) for entry, _ in skipped], "failed": failed}
@@ -1,6 +1,7 @@
 import os
-import requests
-from dotenv import load_dotenv  
+from dotenv import load_dotenv
+from dataverse_sync import fetch_metadata, sync_dataset
+from metrics import span, write_prometheus
 
 # Cargar variables de entorno
 load_dotenv()
@@ -8,124 +9,254 @@ DATAVERSE_API_KEY = os.getenv("DATAVERSE_API_KEY")
 DATASET_PERSISTENT_ID = "hdl:20.500.12534/RFZZNY" ## https://datos.pucp.edu.pe/dataset.xhtml?persistentId=hdl:20.500.12534/RFZZNY&version=1.0
 DATAVERSE_URL = "https://datos.pucp.edu.pe"
 
-# ruta
-DATASET_PATH = "dataset"
+# rutas
+METADATA_FILE = "metadata.json"
+EXTRACTION_PATH = "dataset_extracted/"  # Carpeta de los archivos del dataset
 
 def download_dataset():
-    """Descarga el dataset desde Dataverse PUCP."""
-    url = f"{DATAVERSE_URL}/api/access/dataset/:persistentId?persistentId={DATASET_PERSISTENT_ID}"
-    headers = {"X-Dataverse-key": DATAVERSE_API_KEY}
-
+    """Sincroniza los archivos del dataset desde Dataverse PUCP (sólo lo que cambió)."""
     try:
-        response = requests.get(url, headers=headers, stream=True)
-        response.raise_for_status()  # Lanza un error si la solicitud falla
-
-        with open(DATASET_PATH, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-
-        print(f"Dataset descargado exitosamente en {DATASET_PATH}")
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error al descargar dataset: {e}")
-
-download_dataset()
-
-import zipfile
-import os
-
-DATASET_PATH_ZIP = "dataset"  # Archivo ZIP
-EXTRACTION_PATH = "dataset_extracted/"  # Carpeta de extracción
-
-# Crear la carpeta de extracción si no existe
-os.makedirs(EXTRACTION_PATH, exist_ok=True)
-
-# Extraer el ZIP
-with zipfile.ZipFile(DATASET_PATH_ZIP, "r") as zip_ref:
-    zip_ref.extractall(EXTRACTION_PATH)
-
-print(f"Archivo extraído en: {EXTRACTION_PATH}")
-print("Contenido extraído:", os.listdir(EXTRACTION_PATH))
-
-import rdflib
+        with span("ingest.fetch_metadata"):
+            fetch_metadata(DATAVERSE_URL, DATASET_PERSISTENT_ID, METADATA_FILE, DATAVERSE_API_KEY)
+    except Exception as e:
+        print(f"No se pudo actualizar {METADATA_FILE}, se usa la copia local: {e}")
+
+    with span("ingest.sync_dataset") as measured:
+        result = sync_dataset(DATAVERSE_URL, METADATA_FILE, EXTRACTION_PATH, api_key=DATAVERSE_API_KEY)
+        measured.set(downloaded=len(result["downloaded"]), skipped=len(result["skipped"]), failed=len(result["failed"]))
+    print(f"Dataset sincronizado en {EXTRACTION_PATH}: {len(result['downloaded'])} descargados, "
+          f"{len(result['skipped'])} sin cambios, {len(result['failed'])} con error")
+    return result
+
+import json
 import pandas as pd
 import urllib.parse
 import chardet
+from text_utils import repair_mojibake
 
-# Detectar encoding del archivo antes de cargarlo
 archivo_tab = "dataset_extracted/1. Lima y personajes peruanos - PUCP - IRA - Base de datos.tab"
-
-with open(archivo_tab, "rb") as f:
-    raw_data = f.read(100000)  # Leer una parte del archivo para detectar encoding
-    detected_encoding = chardet.detect(raw_data)["encoding"]
-    print(f"Encoding detectado: {detected_encoding}")
-
-# Cargar el archivo asegurando UTF-8
-df = pd.read_csv(archivo_tab, encoding=detected_encoding, sep="\t", on_bad_lines="skip", dtype=str)
-
-# Crear un grafo RDF
-g = rdflib.Graph()
-
-# Definir prefijos RDF
-g.bind("dc", rdflib.Namespace("http://purl.org/dc/elements/1.1/"))
-g.bind("dcterms", rdflib.Namespace("http://purl.org/dc/terms/"))
-g.bind("foaf", rdflib.Namespace("http://xmlns.com/foaf/0.1/"))
-g.bind("ira", rdflib.Namespace("http://ira.pucp.edu.pe/ontology#"))
+rdf_output = "dataset.ttl"
+BUILD_CACHE = os.path.join("indices", "ttl_build_cache.json")
+# Métricas de la última ingesta en texto de Prometheus (textfile collector)
+INGEST_METRICS_FILE = os.getenv("METRICS_FILE") or os.path.join("indices", "ingest_metrics.prom")
 
 # Base URI
 base_uri = "http://ira.pucp.edu.pe/resource/"
 
-# Función para sanitizar URIs y evitar errores
-def sanitize_uri(text):
-    if pd.isna(text) or text.strip() == "":
-        return None  # Ignorar valores vacíos
-    text = text.strip()
-    text = text.replace(" ", "_")  # Reemplazar espacios con "_"
-    text = text.translate(str.maketrans({"\\": "", "\"": "", "[": "", "]": "", "/": "_"}))  # Limpiar caracteres no válidos
-    return urllib.parse.quote(text)  # Codificar caracteres especiales en UTF-8
-
-# Convertir cada fila en RDF
-for _, row in df.iterrows():
-    titulo_sanitizado = sanitize_uri(row.get("dc.title[es_ES]", ""))
-
-    if titulo_sanitizado:
-        doc_uri = rdflib.URIRef(base_uri + titulo_sanitizado)
-
-        g.add((doc_uri, rdflib.RDF.type, rdflib.URIRef("http://purl.org/dc/terms/BibliographicResource")))
-
-        # Agregar propiedades solo si no están vacías
-        if row.get("dc.title[es_ES]"):
-            g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/title"), rdflib.Literal(row["dc.title[es_ES]"], lang="es")))
-
-        if row.get("dc.contributor.author"):
-            g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/creator"), rdflib.Literal(row["dc.contributor.author"], lang="es")))
-
-        # Modifica el bloque del campo 'dc.date.issued' así:
-        if row.get("dc.date.issued"):
-            # Convertir a string y sanitizar
-            fecha_str = str(row["dc.date.issued"]).strip()  # <--- Conversión clave aquí
-    
-            if fecha_str and len(fecha_str) >= 4 and fecha_str[:4].isdigit():
-                año = fecha_str[:4]
-                g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/date"), 
-                       rdflib.Literal(año, datatype=rdflib.XSD.gYear)))
-            else:
+PREFIXES = {
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dcterms": "http://purl.org/dc/terms/",
+    "foaf": "http://xmlns.com/foaf/0.1/",
+    "ira": "http://ira.pucp.edu.pe/ontology#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+}
+
+# Columna del .tab -> (propiedad dc:, tipo de literal); el orden es el de salida
+COLUMN_PROPERTIES = {
+    "dc.contributor.author": ("creator", "es"),
+    "dc.date.issued": ("date", "gYear"),
+    "dc.description[es_ES]": ("description", "es"),
+    "dc.relation.ispartofseries[es_ES]": ("identifier", None),
+    "dc.language.iso[es_ES]": ("language", None),
+    "dc.publisher": ("publisher", "es"),
+    "dc.subject[es_ES]": ("subject", "es"),
+    "dc.title[es_ES]": ("title", "es"),
+}
+
+def load_table(path=archivo_tab):
+    """Lee el .tab detectando antes su encoding."""
+    with open(path, "rb") as f:
+        raw_data = f.read(100000)  # Leer una parte del archivo para detectar encoding
+        detected_encoding = chardet.detect(raw_data)["encoding"]
+        print(f"Encoding detectado: {detected_encoding}")
+
+    with span("ingest.read_table", size=os.path.getsize(path), encoding=detected_encoding) as measured:
+        df = pd.read_csv(path, encoding=detected_encoding, sep="\t", on_bad_lines="skip", dtype=str)
+        measured.set(rows=len(df))
+    return df
+
+# Función para sanitizar URIs y evitar errores (vectorizada sobre una columna)
+def sanitize_uri(texts):
+    texts = texts.str.strip()
+    texts = texts.where(texts != "")  # Ignorar valores vacíos
+    texts = texts.str.replace(" ", "_", regex=False)  # Reemplazar espacios con "_"
+    texts = texts.str.translate(str.maketrans({"\\": "", "\"": "", "[": "", "]": "", "/": "_"}))  # Limpiar caracteres no válidos
+    return texts.map(urllib.parse.quote, na_action="ignore")  # Codificar caracteres especiales en UTF-8
+
+def normalize_values(texts):
+    """Texto de presentación limpio en la ingesta: NFC, sin mojibake, sin comillas
+    escapadas de la exportación y sin espacios repetidos.
+
+    Las celdas vacías quedan como NaN (propiedad ausente), no como literales.
+    """
+    texts = texts.str.normalize("NFC")
+    broken = texts.str.contains("Ã|Â", na=False)
+    texts = texts.where(~broken, texts[broken].map(repair_mojibake))
+    # El .tab trae '\La Micheo\", hoy ... [fotografía]"': comillas escapadas y una comilla final sobrante
+    texts = texts.str.replace(r'\\"?', '"', regex=True)
+    unbalanced = (texts.str.count('"') % 2 == 1) & texts.str.endswith('"')
+    texts = texts.where(~unbalanced, texts.str[:-1])
+    texts = texts.str.replace(r"\s+", " ", regex=True).str.strip()
+    return texts.where(texts != "")
+
+def turtle_string(texts):
+    """Escapa una columna de textos como literales Turtle entre comillas."""
+    escaped = (
+        texts.str.replace("\\", "\\\\", regex=False)
+        .str.replace('"', '\\"', regex=False)
+        .str.replace("\n", "\\n", regex=False)
+        .str.replace("\r", "\\r", regex=False)
+    )
+    return '"' + escaped + '"'
+
+def build_triples(df):
+    """Convierte el .tab en tripletas (iri, propiedad, objeto Turtle) con operaciones de columna.
+
+    Los valores se normalizan aquí (ver normalize_values) y los vacíos o NaN se
+    descartan: nunca llegan a ser literales. La IRI sale del título original para
+    que no cambie al mejorar la normalización.
+    """
+    iris = base_uri + sanitize_uri(df["dc.title[es_ES]"])
+    has_iri = iris.notna()
+
+    parts = []
+    for column, (prop, kind) in COLUMN_PROPERTIES.items():
+        values = normalize_values(df[column])
+        if kind == "gYear":
+            # Sólo se conserva el año de 'dc.date.issued'
+            years = values.str.extract(r"^(\d{4})", expand=False)
+            invalid = values.notna() & years.isna()
+            for fecha_str in values[invalid & has_iri]:
                 print(f"⚠️ Formato de fecha inválido: '{fecha_str}'")
+            objects = '"' + years + '"^^xsd:gYear'
+        elif kind:
+            objects = turtle_string(values) + "@" + kind
+        else:
+            objects = turtle_string(values)
+        parts.append(pd.DataFrame({"iri": iris, "prop": f"dc:{prop}", "object": objects})[has_iri & objects.notna()])
+
+    triples = pd.concat(parts, ignore_index=True).drop_duplicates()
+    types = pd.DataFrame({"iri": iris[has_iri].unique(), "prop": "a", "object": "dcterms:BibliographicResource"})
+    return pd.concat([types, triples], ignore_index=True)
+
+def record_hashes(triples):
+    """Hash de contenido por registro (todas las tripletas de una misma IRI)."""
+    lines = triples["prop"] + " " + triples["object"]
+    keys = triples["iri"].to_numpy()
+    # Dos hashes de 64 bits sumados por registro: no dependen del orden de las filas
+    first = pd.util.hash_pandas_object(lines, index=False).groupby(keys).sum()
+    second = pd.util.hash_pandas_object(lines, index=False, hash_key="ira-ttl-build-02").groupby(keys).sum()
+    return (first.map("{:016x}".format) + second.map("{:016x}".format)).to_dict()
+
+def render_blocks(triples, iris, fmt="turtle"):
+    """Genera el texto de cada registro (un bloque por IRI) en Turtle o N-Triples."""
+    subset = triples[triples["iri"].isin(iris)].sort_values(["iri", "prop", "object"], kind="stable")
+    if fmt == "nt":
+        subjects = "<" + subset["iri"] + "> "
+        predicates = subset["prop"].map(_expand_prefixed)
+        objects = subset["object"].str.replace(r"\^\^xsd:(\w+)$", lambda m: f"^^<{PREFIXES['xsd']}{m[1]}>", regex=True)
+        objects = objects.where(subset["prop"] != "a", "<" + PREFIXES["dcterms"] + "BibliographicResource>")
+        lines = subjects + predicates + " " + objects + " ."
+        return lines.groupby(subset["iri"].to_numpy(), sort=False).agg("\n".join).to_dict()
+
+    lines = subset["prop"] + " " + subset["object"]
+    blocks = lines.groupby(subset["iri"].to_numpy(), sort=False).agg(" ;\n    ".join)
+    return {iri: f"<{iri}> {body} ." for iri, body in blocks.items()}
+
+def _expand_prefixed(name):
+    if name == "a":
+        return "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+    prefix, local = name.split(":", 1)
+    return f"<{PREFIXES[prefix]}{local}>"
+
+def write_rdf(df, output=rdf_output, fmt="turtle", cache_path=BUILD_CACHE):
+    """Escribe el RDF directamente a disco, regenerando sólo los registros que cambiaron.
+
+    Devuelve el número de registros regenerados (0 si no hubo cambios y no se reescribió nada).
+    """
+    with span("ingest.build_triples") as measured:
+        triples = build_triples(df)
+        measured.set(triples=len(triples))
+    with span("ingest.record_hashes"):
+        hashes = record_hashes(triples)
 
-        if row.get("dc.description[es_ES]"):
-            g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/description"), rdflib.Literal(row["dc.description[es_ES]"], lang="es")))
-
-        if row.get("dc.language.iso[es_ES]"):
-            g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/language"), rdflib.Literal(row["dc.language.iso[es_ES]"])))
-
-        if row.get("dc.publisher"):
-            g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/publisher"), rdflib.Literal(row["dc.publisher"], lang="es")))
-
-        if row.get("dc.subject[es_ES]"):
-            g.add((doc_uri, rdflib.URIRef("http://purl.org/dc/elements/1.1/subject"), rdflib.Literal(row["dc.subject[es_ES]"], lang="es")))
-
-# Guardar en archivo Turtle asegurando UTF-8
-rdf_output = "dataset.ttl"
-g.serialize(destination=rdf_output, format="turtle", encoding="utf-8")
-
-print(f"✅ RDF guardado en UTF-8 en {rdf_output}")
\ No newline at end of file
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    previous = cache.get("records", {}) if cache.get("format") == fmt else {}
+
+    changed = [iri for iri, h in hashes.items() if previous.get(iri, [None])[0] != h]
+    if not changed and set(previous) == set(hashes) and os.path.exists(output):
+        print(f"✅ {output} ya está al día, no se reescribe")
+        return 0
+
+    with span("ingest.render_blocks", records=len(changed)):
+        blocks = render_blocks(triples, changed, fmt)
+    records = {iri: [h, blocks[iri] if iri in blocks else previous[iri][1]] for iri, h in hashes.items()}
+
+    # Escritura en streaming a un archivo temporal, luego reemplazo atómico
+    tmp_output = f"{output}.tmp"
+    with span("ingest.write_rdf", format=fmt) as measured, open(tmp_output, "w", encoding="utf-8", newline="\n") as f:
+        if fmt == "turtle":
+            for prefix, namespace in PREFIXES.items():
+                f.write(f"@prefix {prefix}: <{namespace}> .\n")
+            f.write("\n")
+        separator = "\n\n" if fmt == "turtle" else "\n"
+        for iri in sorted(records):
+            f.write(records[iri][1] + separator)
+        measured.set(size=f.tell())
+    os.replace(tmp_output, output)
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"format": fmt, "records": records}, f, ensure_ascii=False)
+    return len(changed)
+
+
+if __name__ == "__main__":
+    download_dataset()
+
+    df = load_table(archivo_tab)
+    regenerated = write_rdf(df, rdf_output)
+    print(f"✅ RDF guardado en UTF-8 en {rdf_output} ({regenerated} registros regenerados)")
+
+    # Compilar el snapshot binario, el índice de texto completo, el de trigramas y las facetas a partir del RDF generado
+    from facets import load_facets
+    from fuzzy_index import build_fuzzy_index
+    from snapshot import build_snapshot
+    from text_index import build_text_index
+    from triple_store import TripleStore
+
+    snapshot = build_snapshot(rdf_output, METADATA_FILE)
+    store = TripleStore(snapshot)
+    with span("ingest.text_index"):
+        build_text_index(store).save()
+    with span("ingest.fuzzy_index"):
+        build_fuzzy_index(store).save()
+    with span("ingest.facets"):
+        load_facets(store)
+    print(f"Snapshot, índices de texto y de trigramas y facetas generados a partir de {rdf_output}")
+
+    # Carga en GraphDB (con GRAPHDB_LOAD=1): reemplaza el grafo por defecto del repositorio de GRAPHDB_SERVER,
+    # sólo si todos los bloques llegaron al grafo de staging
+    if os.getenv("GRAPHDB_LOAD"):
+        from backends import graph_store_url, load_snapshot_into
+
+        url = graph_store_url()
+        if url is None:
+            print("GRAPHDB_LOAD está definido pero falta GRAPHDB_SERVER; no se carga nada")
+        else:
+            with span("ingest.graphdb_load"):
+                load_snapshot_into(url, snapshot, replace=True)
+
+    # Miniaturas y vistas previas de las imágenes (sólo las que cambiaron)
+    from thumbnails import build_derivatives
+
+    with span("ingest.derivatives") as measured:
+        processed = build_derivatives(EXTRACTION_PATH)
+        measured.set(files=processed)
+    print(f"Derivadas de imágenes generadas para {processed} archivos")
+
+    print(f"Métricas de la ingesta en {write_prometheus(INGEST_METRICS_FILE)}")
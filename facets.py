@@ -0,0 +1,164 @@
+"""Facetas materializadas (tema, año, década, autor, idioma y categoría) del dataset.
+
+Se calculan en la ingesta y se guardan en indices/facets.json con un hash por
+registro, así al cambiar el dataset sólo se recalculan los registros
+modificados. En memoria cada valor de faceta es un bitset sobre los ids de
+documento del TripleStore, o una lista de ids en las facetas con muchos
+valores: los conteos totales ya vienen ordenados y los conteos sobre un
+conjunto de resultados son un AND + popcount (o un recorrido de las listas).
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from snapshot import INDEX_DIR
+from year_index import MAX_YEAR, MIN_YEAR
+
+FACETS_FILE = os.path.join(INDEX_DIR, "facets.json")
+FACETS = ("subject", "year", "decade", "creator", "language", "category")
+SOURCE_PROPERTIES = ("subject", "date", "creator", "language")
+# Categorías por defecto si metadata.json no trae palabras clave
+DEFAULT_CATEGORIES = ["Historia", "Fotografía", "Lima"]
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def record_facets(values, categories):
+    """Valores de faceta de un registro a partir de sus propiedades dc:*."""
+    years = sorted({int(date[:4]) for date in values["date"] if date[:4].isdigit()
+                    and MIN_YEAR <= int(date[:4]) <= MAX_YEAR})
+    subjects = [subject.lower() for subject in values["subject"]]
+    # La primera categoría (en el orden de metadata.json) que aparece en algún tema
+    category = next((c for c in categories if any(c.lower() in s for s in subjects)), None)
+    return {
+        "subject": list(dict.fromkeys(values["subject"])),
+        "year": [str(year) for year in years],
+        "decade": list(dict.fromkeys(str(year - year % 10) for year in years)),
+        "creator": list(dict.fromkeys(values["creator"])),
+        "language": list(dict.fromkeys(values["language"])),
+        "category": [category] if category else [],
+    }
+
+
+class FacetIndex:
+    def __init__(self, n_docs, doc_facets, categories):
+        """`doc_facets[doc_id]` es el dict de record_facets de cada documento.
+
+        Cada faceta se arma desde las listas de documentos por valor, sin una matriz
+        valores × documentos: se guarda como bitsets empaquetados si ocupan menos que
+        las listas (pocos valores, p. ej. categoría o idioma) y si no como listas
+        ordenadas (muchos valores, p. ej. autor o tema).
+        """
+        self.n_docs = n_docs
+        self.categories = categories
+        self.values, self.totals, self.bits, self.postings, self.any_bits = {}, {}, {}, {}, {}
+        n_bytes = (n_docs + 7) // 8
+        for facet in FACETS:
+            docs_by_value = {}
+            for doc_id, facets in enumerate(doc_facets):
+                for value in facets[facet]:
+                    docs_by_value.setdefault(value, []).append(doc_id)
+            values = sorted(docs_by_value)
+            totals = np.array([len(docs_by_value[value]) for value in values], dtype=np.int64)
+            # Valores ordenados por frecuencia total: el top-k global es un slice
+            order = np.argsort(-totals, kind="stable")
+            self.values[facet] = [values[row] for row in order]
+            self.totals[facet] = totals[order]
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum(self.totals[facet], out=offsets[1:])
+            doc_ids = np.fromiter((doc_id for row in order for doc_id in docs_by_value[values[row]]),
+                                  dtype=np.int32, count=int(offsets[-1]))
+            mask = np.zeros(n_docs, dtype=bool)
+            mask[doc_ids] = True
+            self.any_bits[facet] = np.packbits(mask)
+            if len(values) * n_bytes <= doc_ids.nbytes:
+                bits = np.zeros((len(values), n_bytes), dtype=np.uint8)
+                rows = np.repeat(np.arange(len(values)), self.totals[facet])
+                np.bitwise_or.at(bits, (rows, doc_ids >> 3), (0x80 >> (doc_ids & 7)).astype(np.uint8))
+                self.bits[facet] = bits
+            else:
+                self.postings[facet] = (offsets, doc_ids)
+
+    def bitset(self, doc_ids):
+        """Bitset de un conjunto de ids de documento."""
+        return np.packbits(self._mask(doc_ids))
+
+    def _mask(self, doc_ids):
+        mask = np.zeros(self.n_docs, dtype=bool)
+        mask[np.asarray(doc_ids, dtype=np.int64)] = True
+        return mask
+
+    def counts(self, facet, doc_ids=None, top=None):
+        """[(valor, n.º de documentos)] de mayor a menor, global o dentro de `doc_ids`."""
+        if doc_ids is None:
+            totals = self.totals[facet][:top]
+            return [(value, int(count)) for value, count in zip(self.values[facet], totals)]
+        if facet in self.bits:
+            counts = _POPCOUNT[self.bits[facet] & self.bitset(doc_ids)].sum(axis=1, dtype=np.int64)
+        else:
+            # Listas: cuántos documentos de cada lista están en el conjunto (suma acumulada por tramos)
+            offsets, postings = self.postings[facet]
+            hits = np.zeros(len(postings) + 1, dtype=np.int64)
+            np.cumsum(self._mask(doc_ids)[postings], out=hits[1:])
+            counts = hits[offsets[1:]] - hits[offsets[:-1]]
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0][:top]
+        return [(self.values[facet][row], int(counts[row])) for row in order]
+
+    def count_missing(self, facet, doc_ids=None):
+        """Documentos (del conjunto) sin ningún valor para la faceta."""
+        with_value = self.any_bits[facet] if doc_ids is None else self.any_bits[facet] & self.bitset(doc_ids)
+        total = self.n_docs if doc_ids is None else len(np.unique(np.asarray(doc_ids, dtype=np.int64)))
+        return total - int(_POPCOUNT[with_value].sum())
+
+    def documents(self, facet, value):
+        """Ids de documento con ese valor de faceta."""
+        row = self.values[facet].index(value)
+        if facet in self.bits:
+            return np.flatnonzero(np.unpackbits(self.bits[facet][row])[:self.n_docs])
+        offsets, postings = self.postings[facet]
+        return postings[offsets[row]:offsets[row + 1]].astype(np.int64)
+
+
+def _load_saved(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_facets(store, path=FACETS_FILE):
+    """Pone al día las facetas guardadas con el TripleStore y las carga.
+
+    Sólo se recalculan los registros nuevos o modificados (según su hash).
+    """
+    categories = store.snapshot.keywords or DEFAULT_CATEGORIES
+    saved = _load_saved(path)
+    saved_records = saved.get("records", {}) if saved.get("categories") == categories else {}
+
+    records, doc_facets, changed = {}, [], 0
+    for doc_id in range(store.n_docs):
+        values = {name: store.values(name, doc_id) for name in SOURCE_PROPERTIES}
+        digest = hashlib.sha1(json.dumps(values, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        iri = store.doc_iri(doc_id)
+        record = saved_records.get(iri)
+        if record is None or record["hash"] != digest:
+            record = {"hash": digest, "facets": record_facets(values, categories)}
+            changed += 1
+        records[iri] = record
+        doc_facets.append(record["facets"])
+
+    removed = len(saved_records.keys() - records.keys())
+    if changed or removed:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"categories": categories, "records": records}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"No se pudieron guardar las facetas en {path}: {e}")
+    return FacetIndex(store.n_docs, doc_facets, categories)
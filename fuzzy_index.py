@@ -0,0 +1,166 @@
+"""Índice de trigramas para búsqueda tolerante a errores de nombres de personas y lugares.
+
+El vocabulario son las palabras plegadas (sin acentos, en minúsculas) de
+autor, título y tema. Cada palabra se descompone en trigramas y las listas
+de palabras por trigrama se guardan en arreglos NumPy (CSR). Una consulta
+cuenta trigramas compartidos sólo sobre las listas de sus propios trigramas,
+filtra por longitud y por el lema de q-gramas, y verifica los candidatos con
+una distancia de edición acotada.
+"""
+import os
+
+import numpy as np
+
+from snapshot import INDEX_DIR
+from text_utils import STOPWORDS, tokenize
+
+FUZZY_INDEX_FILE = os.path.join(INDEX_DIR, "fuzzy_index.npz")
+FUZZY_FIELDS = ("creator", "title", "subject")
+MAX_EXPANSIONS = 2
+
+
+def max_distance(word):
+    """Errores tolerados según la longitud: ninguno en palabras cortas."""
+    if len(word) <= 4:
+        return 0
+    return 1 if len(word) <= 8 else 2
+
+
+def trigrams(word):
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_levenshtein(a, b, limit):
+    """Distancia de edición entre a y b, o None si supera `limit` (corta en cuanto se pasa)."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class FuzzyIndex:
+    def __init__(self, words, frequencies, grams, offsets, postings, fingerprint=None):
+        self.words = words
+        self.frequencies = frequencies
+        self.lengths = np.array([len(word) for word in words], dtype=np.int32)
+        self.word_ids = {word: i for i, word in enumerate(words)}
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+        self.fingerprint = fingerprint
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+    def search(self, word, limit=5, distance=None):
+        """[(palabra, distancia)] del vocabulario más parecidas, de la más cercana a la más frecuente."""
+        distance = max_distance(word) if distance is None else distance
+        query_grams = [self.grams[g] for g in trigrams(word) if g in self.grams]
+        if not query_grams:
+            return []
+        candidates = np.concatenate([self.postings[self.offsets[g]:self.offsets[g + 1]] for g in query_grams])
+        shared = np.bincount(candidates, minlength=len(self.words))
+        # Lema de q-gramas: cada error destruye a lo sumo 3 trigramas
+        needed = np.maximum(self.lengths, len(word)) - 3 * distance
+        keep = np.flatnonzero((shared > 0) & (shared >= needed) & (np.abs(self.lengths - len(word)) <= distance))
+
+        matches = []
+        for word_id in keep[np.argsort(-shared[keep], kind="stable")]:
+            found = bounded_levenshtein(word, self.words[word_id], distance)
+            if found is not None:
+                matches.append((found, -int(self.frequencies[word_id]), self.words[word_id]))
+        return [(candidate, d) for d, _, candidate in sorted(matches)[:limit]]
+
+    def expand(self, text, max_expansions=MAX_EXPANSIONS):
+        """El texto más las correcciones de las palabras que no están en el vocabulario."""
+        extra = []
+        for word in tokenize(text):
+            if word in STOPWORDS or word.isdigit() or word in self.word_ids:
+                continue
+            extra.extend(candidate for candidate, _ in self.search(word, max_expansions))
+        return f"{text} {' '.join(extra)}" if extra else text
+
+    def save(self, path=FUZZY_INDEX_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Se escribe aparte y se reemplaza: un guardado interrumpido no deja un índice truncado
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    words=np.array(self.words, dtype=str),
+                    frequencies=self.frequencies,
+                    grams=np.array(sorted(self.grams, key=self.grams.get), dtype=str),
+                    offsets=self.offsets,
+                    postings=self.postings,
+                    fingerprint=np.array(self.fingerprint or ""),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path=FUZZY_INDEX_FILE):
+        with np.load(path) as data:
+            grams = {gram: i for i, gram in enumerate(data["grams"].tolist())}
+            return cls(data["words"].tolist(), data["frequencies"], grams, data["offsets"], data["postings"],
+                       str(data["fingerprint"]) or None)
+
+
+def build_fuzzy_index(store, fields=FUZZY_FIELDS):
+    """Construye el índice de trigramas a partir del TripleStore."""
+    frequencies = {}
+    for doc_id in range(store.n_docs):
+        words = {word for name in fields for text in store.values(name, doc_id) for word in tokenize(text)}
+        for word in words:
+            if word not in STOPWORDS and not word.isdigit():
+                frequencies[word] = frequencies.get(word, 0) + 1
+
+    words = sorted(frequencies)
+    grams, rows_gram, rows_word = {}, [], []
+    for word_id, word in enumerate(words):
+        for gram in trigrams(word):
+            rows_gram.append(grams.setdefault(gram, len(grams)))
+            rows_word.append(word_id)
+
+    rows_gram = np.array(rows_gram, dtype=np.int32)
+    order = np.argsort(rows_gram, kind="stable")
+    offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows_gram, minlength=len(grams)), out=offsets[1:])
+    return FuzzyIndex(
+        words,
+        np.array([frequencies[word] for word in words], dtype=np.int32),
+        grams,
+        offsets,
+        np.array(rows_word, dtype=np.int32)[order],
+        fingerprint=store.snapshot.fingerprint,
+    )
+
+
+def load_fuzzy_index(store, path=FUZZY_INDEX_FILE, save=True):
+    """Carga el índice guardado en la ingesta; lo reconstruye si no corresponde al snapshot.
+
+    Con `save=False` el índice reconstruido queda sólo en memoria.
+    """
+    if os.path.exists(path):
+        index = FuzzyIndex.load(path)
+        if index.fingerprint == store.snapshot.fingerprint:
+            return index
+    index = build_fuzzy_index(store)
+    if not save:
+        return index
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"No se pudo guardar el índice de trigramas en {path}: {e}")
+    return index
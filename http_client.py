@@ -0,0 +1,232 @@
+"""Cliente HTTP compartido (httpx) para GraphDB, la API de inferencia y Dataverse.
+
+Un solo httpx.Client por proceso mantiene los pools de conexiones keep-alive
+por host, así no se paga un handshake TLS por petición. Encima de él se
+limita la concurrencia por host, se reintenta con backoff exponencial con
+jitter ante 429/5xx y errores de red, cada llamada respeta un plazo total
+(deadline) y un circuit breaker por host corta de inmediato las llamadas a un
+servicio que está fallando en vez de dejar colgados a los workers.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE = 16
+KEEPALIVE_EXPIRY = 30
+HOST_CONCURRENCY = 8
+CONNECT_TIMEOUT = 5
+DEFAULT_TIMEOUT = 30
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+RETRY_STATUS = {429, 500, 502, 503, 504}
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+
+class CircuitOpenError(httpx.TransportError):
+    """El host acumuló demasiados fallos seguidos; no se intenta la llamada."""
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Se agotó el plazo total de la llamada (incluidos los reintentos)."""
+
+
+def deadline_in(seconds):
+    """Plazo absoluto (reloj monotónico) a `seconds` segundos de ahora."""
+    return time.monotonic() + seconds
+
+
+class CircuitBreaker:
+    """Cerrado -> abierto tras `threshold` fallos seguidos -> semiabierto tras `cooldown`.
+
+    En semiabierto pasa una sola llamada de prueba: si sale bien se cierra,
+    si falla se vuelve a abrir.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def _retry_after(response):
+    """Segundos indicados en Retry-After (número o fecha HTTP), o None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE,
+                 host_concurrency=HOST_CONCURRENCY, max_attempts=MAX_ATTEMPTS,
+                 timeout=DEFAULT_TIMEOUT, breaker_threshold=BREAKER_THRESHOLD,
+                 breaker_cooldown=BREAKER_COOLDOWN):
+        self._client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+        self.host_concurrency = host_concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        """(semáforo, circuit breaker) del host de la URL."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.BoundedSemaphore(self.host_concurrency),
+                                     CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+            return self._hosts[host]
+
+    def breaker(self, url):
+        return self._host(url)[1]
+
+    def _attempt_timeout(self, deadline, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("Se agotó el plazo de la llamada")
+            timeout = min(timeout, remaining)
+        return httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout))
+
+    def _retry_delay(self, attempt, deadline, response=None):
+        """Espera (con jitter) antes del siguiente intento, o None si ya no cabe dentro del plazo."""
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, BACKOFF_MAX))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _send(self, breaker, method, url, deadline, timeout, attempts, kwargs):
+        for attempt in range(attempts):
+            attempt_timeout = self._attempt_timeout(deadline, timeout)
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuito abierto para {urlsplit(url).netloc}")
+            request = self._client.build_request(method, url, timeout=attempt_timeout, **kwargs)
+            try:
+                response = self._client.send(request, stream=True)
+            except httpx.TransportError:
+                breaker.record_failure()
+                delay = self._retry_delay(attempt, deadline) if attempt + 1 < attempts else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            delay = self._retry_delay(attempt, deadline, response) if attempt + 1 < attempts else None
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+
+    @contextmanager
+    def stream(self, method, url, deadline=None, timeout=None, retry=True, **kwargs):
+        """Como httpx.Client.stream, con reintentos mientras no se haya empezado a leer el cuerpo.
+
+        Si se acaban los intentos o el plazo se devuelve la última respuesta aunque sea
+        429/5xx; los 4xx se devuelven tal cual. El turno del host se mantiene hasta cerrar.
+        """
+        semaphore, breaker = self._host(url)
+        wait = None if deadline is None else max(deadline - time.monotonic(), 0)
+        if not semaphore.acquire(timeout=wait):
+            raise DeadlineExceeded(f"Sin turno libre para {urlsplit(url).netloc} dentro del plazo")
+        try:
+            response = self._send(breaker, method, url, deadline, timeout, self.max_attempts if retry else 1, kwargs)
+            try:
+                yield response
+            except httpx.TransportError:
+                # Corte a mitad del cuerpo: cuenta como fallo del host, pero no se reintenta aquí
+                breaker.record_failure()
+                raise
+            finally:
+                response.close()
+        finally:
+            semaphore.release()
+
+    def request(self, method, url, deadline=None, timeout=None, retry=True, **kwargs):
+        """Petición completa (cuerpo leído) con reintentos, plazo y circuit breaker."""
+        with self.stream(method, url, deadline=deadline, timeout=timeout, retry=retry, **kwargs) as response:
+            response.read()
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self._client.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_client():
+    """Cliente compartido por todo el proceso (todas las sesiones de Streamlit)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HttpClient()
+        return _shared
@@ -0,0 +1,229 @@
+"""Caché persistente de respuestas del LLM, compartida entre sesiones y procesos.
+
+Las respuestas se guardan en SQLite con expiración por TTL y desalojo LRU
+cuando se supera el tamaño máximo. La clave combina modelo, pregunta
+normalizada, ids de los documentos recuperados (ordenados) y parámetros de
+generación. Si llegan varias peticiones idénticas a la vez, sólo una llama a
+la API y las demás esperan su resultado; si la que calcula se abandona (p. ej.
+el usuario canceló su generación), la siguiente en espera toma su lugar.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import record
+from snapshot import INDEX_DIR
+from text_utils import fold_text
+
+CACHE_FILE = os.path.join(INDEX_DIR, "llm_cache.sqlite")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Resultado del futuro compartido cuando el líder se abandona: las peticiones en espera reintentan
+_ABANDONED = object()
+
+
+class ComputationAbandoned(Exception):
+    """El cálculo se dejó a medias a propósito (no es un error del cálculo en sí)."""
+
+
+def normalize_question(question):
+    """Pregunta plegada, sin signos ni espacios repetidos."""
+    return " ".join(re.findall(r"[a-z0-9]+", fold_text(question or "")))
+
+
+def answer_key(model, question, doc_ids=(), params=None):
+    payload = {
+        "model": model,
+        "question": normalize_question(question),
+        "docs": sorted(str(doc_id) for doc_id in doc_ids),
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path=CACHE_FILE, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL,"
+                " accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+
+    def _connection(self):
+        # Una conexión por hilo; WAL permite lectores concurrentes desde varios procesos
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        db = self._connection()
+        now = time.time()
+        row = db.execute("SELECT value, created FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl:
+            with db:
+                db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            return None
+        with db:
+            db.execute("UPDATE answers SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        db = self._connection()
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO answers (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, data, now, now, len(data.encode("utf-8"))),
+            )
+        self._evict()
+
+    def _evict(self):
+        """Borra lo expirado y, si se supera el tamaño máximo, lo menos usado recientemente."""
+        db = self._connection()
+        with db:
+            expired = db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM answers").fetchone()[0]
+            evicted = 0
+            while total > self.max_bytes:
+                row = db.execute("SELECT key, size FROM answers ORDER BY accessed LIMIT 1").fetchone()
+                if row is None:
+                    break
+                db.execute("DELETE FROM answers WHERE key = ?", (row[0],))
+                total -= row[1]
+                evicted += 1
+        with self._lock:
+            self.stats["evictions"] += expired + evicted
+
+    def _cached(self, key):
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            record("llm.cache", cache_hit=True)
+        return value
+
+    def _join(self, key):
+        """(futuro, líder): el líder calcula y publica el resultado; los demás lo esperan."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        record("llm.cache", cache_hit=not leader, coalesced=not leader)
+        return future, leader
+
+    def get_or_compute(self, key, compute):
+        """Devuelve la respuesta guardada o la calcula una sola vez aunque haya peticiones concurrentes.
+
+        Si `compute` lanza una excepción no se guarda nada y todas las peticiones en espera la reciben,
+        salvo ComputationAbandoned: entonces una de las que esperaban calcula de nuevo.
+        """
+        value = self._cached(key)
+        if value is not None:
+            return value
+
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            value = future.result()
+            if value is not _ABANDONED:
+                return value
+
+        try:
+            value = compute()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except ComputationAbandoned:
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stream_or_compute(self, key, stream):
+        """Como get_or_compute, pero entrega los fragmentos de `stream()` a medida que llegan.
+
+        Una respuesta guardada (o la de otra petición idéntica en curso) se entrega
+        en un solo fragmento. Sólo se guarda si el flujo termina completo.
+        """
+        value = self._cached(key)
+        if value is not None:
+            yield value
+            return
+
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            value = future.result()
+            if value is not _ABANDONED:
+                yield value
+                return
+
+        chunks = []
+        try:
+            for chunk in stream():
+                chunks.append(chunk)
+                yield chunk
+            value = "".join(chunks)
+            self.put(key, value)
+            future.set_result(value)
+        except (GeneratorExit, ComputationAbandoned):
+            # La cancelación de esta petición no es un error para las que esperaban su resultado
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def snapshot_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_answer_cache(path=CACHE_FILE, **kwargs):
+    """Instancia compartida por proceso (todas las sesiones de Streamlit usan la misma)."""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = AnswerCache(path, **kwargs)
+        return _caches[path]
@@ -0,0 +1,146 @@
+"""Generación en streaming con la API de inferencia de Hugging Face.
+
+La petición corre en un hilo aparte y deja los fragmentos en una cola, así la
+página muestra los documentos recuperados mientras el modelo sigue generando.
+Cada generación se puede cancelar (p. ej. cuando llega una pregunta nueva);
+una generación cancelada o fallida nunca se guarda en la caché de respuestas.
+"""
+import contextvars
+import json
+import queue
+import threading
+import time
+
+from http_client import DeadlineExceeded, deadline_in, get_client
+from llm_cache import ComputationAbandoned
+from metrics import span
+
+HF_INFERENCE_URL = "https://api-inference.huggingface.co/models/{model}"
+READ_TIMEOUT = 60
+GENERATION_DEADLINE = 180
+
+_DONE = object()
+
+
+class GenerationCancelled(ComputationAbandoned):
+    pass
+
+
+def iter_sse_tokens(lines):
+    """Texto de cada token de un flujo server-sent events de text-generation-inference."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        event = json.loads(data)
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        token = event.get("token") or {}
+        if token.get("text") and not token.get("special"):
+            yield token["text"]
+
+
+def stream_tokens(model, prompt, parameters, api_token, cancel_event=None, url=None, deadline=None):
+    """Genera los tokens a medida que llegan; lanza GenerationCancelled si se cancela."""
+    deadline = deadline or deadline_in(GENERATION_DEADLINE)
+    started = time.perf_counter()
+    # size: caracteres generados; prompt_chars y ttft_ms (tiempo hasta el primer token) como atributos
+    with span("llm.generate", unit="chars", model=model, prompt_chars=len(prompt)) as measured, get_client().stream(
+        "POST",
+        url or HF_INFERENCE_URL.format(model=model),
+        headers={"Authorization": f"Bearer {api_token}", "Accept": "text/event-stream"},
+        json={"inputs": prompt, "parameters": parameters, "stream": True},
+        deadline=deadline,
+        timeout=READ_TIMEOUT,
+    ) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Hugging Face API respondió {response.status_code}")
+        generated = 0
+        for token in iter_sse_tokens(response.iter_lines()):
+            if cancel_event is not None and cancel_event.is_set():
+                raise GenerationCancelled()
+            if time.monotonic() > deadline:
+                raise DeadlineExceeded("La generación superó su plazo")
+            if not generated:
+                measured.set(ttft_ms=round((time.perf_counter() - started) * 1000, 3))
+            generated += len(token)
+            measured.set(size=generated)
+            yield token
+
+
+class GenerationStream:
+    """Generación en segundo plano que se consume iterando (p. ej. con st.write_stream).
+
+    `produce(cancel_event)` devuelve un iterador de fragmentos de texto. Si falla,
+    la iteración termina con `error_message` en lugar de propagar la excepción.
+    """
+
+    def __init__(self, produce, error_message="Error en la generación de respuesta."):
+        self.error_message = error_message
+        self.error = None
+        self._cancel = threading.Event()
+        self._chunks = queue.Queue()
+        self._parts = []
+        self._finished = False
+        # El hilo hereda la traza activa, así la generación aparece en la misma petición
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run, produce), daemon=True)
+        self._thread.start()
+
+    def _run(self, produce):
+        try:
+            for chunk in produce(self._cancel):
+                self._chunks.put(chunk)
+        except Exception as e:
+            # Sólo la cancelación de esta misma generación termina en silencio
+            if isinstance(e, GenerationCancelled) and self._cancel.is_set():
+                return
+            print(f"{self.error_message} {e}")
+            self.error = e
+        finally:
+            self._chunks.put(_DONE)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def __iter__(self):
+        """Entrega lo ya recibido (si se vuelve a iterar, p. ej. tras un rerun) y luego lo que siga llegando."""
+        if self._parts:
+            yield self.text
+        while not self._finished:
+            chunk = self._chunks.get()
+            if chunk is _DONE:
+                self._finished = True
+                if self.error is not None and not self._parts:
+                    self._parts.append(self.error_message)
+                    yield self.error_message
+                break
+            self._parts.append(chunk)
+            yield chunk
+
+    def result(self):
+        """Bloquea hasta terminar y devuelve el texto completo."""
+        for _ in self:
+            pass
+        return self.text
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+
+def stream_answer(cache, key, model, prompt, parameters, api_token,
+                  error_message="Error en la generación de respuesta."):
+    """Arranca una generación en streaming que pasa por la caché de respuestas."""
+    def produce(cancel_event):
+        return cache.stream_or_compute(
+            key, lambda: stream_tokens(model, prompt, parameters, api_token, cancel_event)
+        )
+    return GenerationStream(produce, error_message)
@@ -0,0 +1,304 @@
+"""Tiempos por etapa (trazas ligeras) y exportación de métricas.
+
+`span("etapa")` mide un bloque de código y `record` registra una medición ya
+hecha (p. ej. las etapas de la recuperación o un acierto de caché). Cada
+medición guarda duración, tamaño del payload (con su unidad: bytes, tokens,
+filas...) y si vino de una caché; se acumula en un registro por proceso y, si hay una traza activa (`trace`), se
+agrega también a ella para el panel de depuración de Streamlit.
+
+Las mediciones salen de tres formas:
+- logs JSON, una línea por etapa, si METRICS_LOG apunta a un archivo ("-" es stderr);
+- texto de Prometheus, en un archivo (`write_prometheus`, p. ej. para el
+  textfile collector) o en http://0.0.0.0:METRICS_PORT/metrics;
+- `Trace.rows()` y `summary_rows()`, pensados para mostrarse con st.dataframe.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites de los buckets del histograma de duraciones, en segundos
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+PREFIX = "ira"
+# Unidades del tamaño de una medición; cada una se exporta como su propio contador
+UNITS = ("bytes", "tokens", "chars", "rows", "items")
+
+_current = contextvars.ContextVar("ira_trace", default=None)
+_logger = logging.getLogger("ira.metrics")
+
+
+class Span:
+    """Una medición: etapa, duración en ms, tamaño (en `unit`), acierto de caché y atributos libres."""
+
+    __slots__ = ("stage", "ms", "size", "unit", "cache_hit", "error", "attrs", "started")
+
+    def __init__(self, stage, ms=None, size=None, cache_hit=None, unit="bytes", **attrs):
+        if unit not in UNITS:
+            raise ValueError(f"Unidad desconocida: {unit}")
+        self.stage = stage
+        self.ms = ms
+        self.size = size
+        self.unit = unit
+        self.cache_hit = cache_hit
+        self.error = None
+        self.attrs = attrs
+        self.started = time.time()
+
+    def set(self, size=None, cache_hit=None, **attrs):
+        if size is not None:
+            self.size = size
+        if cache_hit is not None:
+            self.cache_hit = cache_hit
+        self.attrs.update(attrs)
+        return self
+
+    def as_dict(self):
+        row = {"stage": self.stage, "ms": None if self.ms is None else round(self.ms, 3),
+               "size": self.size, "unit": self.unit if self.size is not None else None,
+               "cache_hit": self.cache_hit, "error": self.error}
+        row.update(self.attrs)
+        return row
+
+
+class Trace:
+    """Las etapas de una petición (una pregunta), en el orden en que terminaron."""
+
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.spans = []
+
+    def rows(self):
+        return [span.as_dict() for span in list(self.spans)]
+
+    @property
+    def total_ms(self):
+        root = next((span for span in self.spans if span.stage == self.name), None)
+        return root.ms if root is not None else None
+
+
+class Registry:
+    """Histogramas de duración y contadores de payload (por unidad), caché y errores por etapa."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _stage(self, stage):
+        entry = self._stages.get(stage)
+        if entry is None:
+            entry = self._stages[stage] = {
+                "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0, "max": 0.0,
+                "payload": {}, "hits": 0, "misses": 0, "errors": 0,
+            }
+        return entry
+
+    def observe(self, span):
+        with self._lock:
+            entry = self._stage(span.stage)
+            if span.ms is not None:
+                seconds = span.ms / 1000
+                entry["count"] += 1
+                entry["sum"] += seconds
+                entry["max"] = max(entry["max"], seconds)
+                for i, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        entry["buckets"][i] += 1
+            if span.size:
+                entry["payload"][span.unit] = entry["payload"].get(span.unit, 0) + span.size
+            if span.cache_hit is not None:
+                entry["hits" if span.cache_hit else "misses"] += 1
+            if span.error:
+                entry["errors"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: dict(entry, buckets=list(entry["buckets"]), payload=dict(entry["payload"]))
+                    for stage, entry in self._stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def render_prometheus(self):
+        """Formato de exposición de texto de Prometheus (versión 0.0.4)."""
+        stages = self.snapshot()
+        lines = [
+            f"# HELP {PREFIX}_stage_duration_seconds Duración de cada etapa del pipeline.",
+            f"# TYPE {PREFIX}_stage_duration_seconds histogram",
+        ]
+        for stage, entry in sorted(stages.items()):
+            if not entry["count"]:
+                continue
+            label = _label(stage)
+            for bound, count in zip(self.buckets, entry["buckets"]):
+                lines.append(f'{PREFIX}_stage_duration_seconds_bucket{{stage="{label}",le="{bound}"}} {count}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_bucket{{stage="{label}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_sum{{stage="{label}"}} {entry["sum"]:.6f}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_count{{stage="{label}"}} {entry["count"]}')
+
+        counters = tuple(
+            (f"stage_payload_{unit}_total", f"Payload procesado por etapa, en {unit}.",
+             lambda label, e, unit=unit: [(f'stage="{label}"', e["payload"][unit])] if unit in e["payload"] else [])
+            for unit in UNITS
+        ) + (
+            ("stage_cache_total", "Consultas a caché por etapa y resultado.",
+             lambda label, e: [(f'stage="{label}",result="{result}"', e[key])
+                               for result, key in (("hit", "hits"), ("miss", "misses")) if e["hits"] or e["misses"]]),
+            ("stage_errors_total", "Etapas que terminaron con una excepción.",
+             lambda label, e: [(f'stage="{label}"', e["errors"])] if e["errors"] else []),
+        )
+        for name, help_text, samples in counters:
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            for stage, entry in sorted(stages.items()):
+                for labels, value in samples(_label(stage), entry):
+                    lines.append(f"{PREFIX}_{name}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+# 📌 Registrar mediciones
+# METRICS_LOG, METRICS_PORT y METRICS_FILE se leen al usarse: las apps llaman a load_dotenv después de importar
+def _configure_logger(target):
+    if not _logger.handlers:
+        handler = logging.StreamHandler(sys.stderr) if target == "-" else logging.FileHandler(target, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+
+
+def _emit(span):
+    REGISTRY.observe(span)
+    current = _current.get()
+    if current is not None:
+        current.spans.append(span)
+    target = os.getenv("METRICS_LOG")
+    if target:
+        _configure_logger(target)
+        row = span.as_dict()
+        row["ts"] = round(span.started, 3)
+        if current is not None:
+            row["trace"], row["trace_id"] = current.name, current.id
+        _logger.info(json.dumps(row, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def span(stage, unit="bytes", **attrs):
+    """Mide el bloque; lo que se pase a `Span.set` dentro del bloque queda en la medición.
+
+    `unit` es la unidad del tamaño (`size`) que se registre: bytes, tokens, chars, rows o items.
+    """
+    measured = Span(stage, unit=unit, **attrs)
+    started = time.perf_counter()
+    try:
+        yield measured
+    except BaseException as e:
+        measured.error = type(e).__name__
+        raise
+    finally:
+        measured.ms = (time.perf_counter() - started) * 1000
+        _emit(measured)
+
+
+def record(stage, ms=None, size=None, cache_hit=None, unit="bytes", **attrs):
+    """Registra una medición hecha por otra vía (sin duración para un simple acierto o fallo de caché)."""
+    measured = Span(stage, ms, size, cache_hit, unit, **attrs)
+    _emit(measured)
+    return measured
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Traza de una petición: las etapas medidas dentro (también en hilos que copien el contexto) se agregan a ella."""
+    current = Trace(name)
+    token = _current.set(current)
+    try:
+        with span(name, **attrs):
+            yield current
+    finally:
+        _current.reset(token)
+
+
+# 📌 Exportar
+def summary_rows(registry=REGISTRY):
+    """Resumen por etapa (conteo, promedio, máximo, payload, caché, errores) para el panel de depuración."""
+    rows = []
+    for stage, entry in sorted(registry.snapshot().items()):
+        rows.append({
+            "stage": stage,
+            "count": entry["count"],
+            "mean_ms": round(entry["sum"] / entry["count"] * 1000, 2) if entry["count"] else None,
+            "max_ms": round(entry["max"] * 1000, 2) if entry["count"] else None,
+            "payload": ", ".join(f"{total} {unit}" for unit, total in sorted(entry["payload"].items())),
+            "cache_hits": entry["hits"],
+            "cache_misses": entry["misses"],
+            "errors": entry["errors"],
+        })
+    return rows
+
+
+def write_prometheus(path=None, registry=REGISTRY):
+    """Escribe el texto de Prometheus de forma atómica (sirve para el textfile collector de node_exporter)."""
+    path = path or os.getenv("METRICS_FILE")
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """Sirve /metrics en un hilo aparte; una sola vez por proceso (Streamlit vuelve a ejecutar el script)."""
+    global _server
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            except OSError as e:
+                print(f"No se pudo abrir el endpoint de métricas en el puerto {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
@@ -0,0 +1,131 @@
+"""Análisis de preguntas: palabras clave, nombres y años, con spaCy reducido y caché.
+
+spaCy se importa y carga sólo la primera vez que se analiza una pregunta, y
+sin el parser ni los componentes que no se usan (sólo hacen falta entidades,
+categorías gramaticales y lemas). Los análisis se guardan en una caché LRU por
+pregunta normalizada; `analyze_questions` procesa lotes con `nlp.pipe`.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from metrics import span
+from text_utils import STOPWORDS, tokenize
+from year_index import extract_year_range
+
+SPACY_MODEL = "es_core_news_sm"
+# Lo que no hace falta para entidades + POS + lemas
+DISABLED_PIPES = ("parser", "senter")
+KEYWORD_POS = ("NOUN", "PROPN")
+NAME_LABELS = ("PER", "ORG", "LOC", "MISC")
+CACHE_SIZE = 2048
+BATCH_SIZE = 64
+
+_YEAR_RE = re.compile(r"\b(1[0-9]\d{2}|20\d{2})\b")
+
+QueryAnalysis = namedtuple("QueryAnalysis", ["question", "keywords", "names", "years", "year_range"])
+
+_nlp = None
+_nlp_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_nlp(model=SPACY_MODEL):
+    """Modelo spaCy sin los componentes innecesarios; None si spaCy no está instalado."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            try:
+                import spacy
+            except ImportError as e:
+                print(f"spaCy no disponible ({e}); se usan palabras clave sin análisis gramatical")
+                _nlp = False
+                return None
+            if not spacy.util.is_package(model):
+                os.system(f"python -m spacy download {model}")
+            with span("query.load_spacy", model=model):
+                _nlp = spacy.load(model, exclude=list(DISABLED_PIPES))
+        return _nlp or None
+
+
+def normalize_question(question):
+    """Clave de la caché: minúsculas y espacios colapsados (el texto que ve spaCy)."""
+    return " ".join((question or "").lower().split())
+
+
+def _from_doc(question, doc):
+    names = [ent.text for ent in doc.ents if ent.label_ in NAME_LABELS]
+    lemmas = [token.lemma_ for token in doc if token.pos_ in KEYWORD_POS]
+    return _build(question, list(dict.fromkeys([ent.text for ent in doc.ents] + lemmas)), names)
+
+
+def _build(question, keywords, names):
+    return QueryAnalysis(
+        question=question,
+        keywords=tuple(keywords),
+        names=tuple(dict.fromkeys(names)),
+        years=tuple(int(year) for year in _YEAR_RE.findall(question)),
+        year_range=extract_year_range(question),
+    )
+
+
+def _fallback(question):
+    """Sin spaCy: los términos de la pregunta sin palabras vacías."""
+    return _build(question, [token for token in tokenize(question) if token not in STOPWORDS and not token.isdigit()], [])
+
+
+def _cache_get(key):
+    with _cache_lock:
+        analysis = _cache.get(key)
+        if analysis is not None:
+            _cache.move_to_end(key)
+        return analysis
+
+
+def _cache_put(key, analysis):
+    with _cache_lock:
+        _cache[key] = analysis
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def clear_cache():
+    """Vacía la caché de análisis (p. ej. para medir el análisis en frío)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+# 📌 Analizar una pregunta
+def analyze_question(question):
+    """QueryAnalysis de una pregunta (palabras clave, nombres, años y rango de años)."""
+    key = normalize_question(question)
+    with span("query.analyze") as measured:
+        analysis = _cache_get(key)
+        measured.set(cache_hit=analysis is not None)
+        if analysis is None:
+            nlp = load_nlp()
+            analysis = _from_doc(key, nlp(key)) if nlp is not None else _fallback(key)
+            _cache_put(key, analysis)
+        return analysis
+
+
+# 📌 Analizar un lote de preguntas (procesos fuera de línea)
+def analyze_questions(questions, batch_size=BATCH_SIZE, n_process=1):
+    """Lista de QueryAnalysis en el mismo orden; las preguntas nuevas pasan por nlp.pipe."""
+    keys = [normalize_question(question) for question in questions]
+    results = {key: _cache_get(key) for key in keys}
+    pending = [key for key, analysis in results.items() if analysis is None]
+    if pending:
+        nlp = load_nlp()
+        if nlp is None:
+            analyses = [_fallback(key) for key in pending]
+        else:
+            docs = nlp.pipe(pending, batch_size=batch_size, n_process=n_process)
+            analyses = [_from_doc(key, doc) for key, doc in zip(pending, docs)]
+        for key, analysis in zip(pending, analyses):
+            results[key] = analysis
+            _cache_put(key, analysis)
+    return [results[key] for key in keys]
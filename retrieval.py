@@ -0,0 +1,239 @@
+"""Recuperación híbrida: índice léxico (BM25) + índice vectorial con fusión RRF.
+
+Las dos etapas corren en paralelo, cada una en su propio pool acotado y con
+su presupuesto de tiempo. Si la etapa densa no termina a tiempo (o falla) se
+sigue con la léxica; a la léxica sólo se la deja atrás si la densa ya dio un
+ranking, así nunca se responde sin resultados habiendo coincidencias.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from metrics import record, span
+from text_utils import analyze
+from vector_index import load_vector_index
+from year_index import extract_year_range, remove_year_expressions
+
+RRF_K = 60
+DEFAULT_BUDGETS_MS = {"lexical": 80, "dense": 200}
+PAGE_SIZE = 20
+RANKING_CACHE_SIZE = 128
+
+# Un pool por etapa, compartido por todas las sesiones del proceso: las tareas de una etapa lenta
+# (p. ej. la carga del modelo de embeddings) no dejan sin hilos a la otra
+_executors = {
+    "lexical": ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval-lexical"),
+    "dense": ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval-dense"),
+}
+
+
+class RetrievalResult:
+    """Ids de documento ordenados, su puntaje fusionado y el estado de cada etapa.
+
+    `matches` son los documentos que coinciden de verdad (léxica o por años), sin
+    los candidatos sólo semánticos con que se completa el ranking; None si la etapa
+    léxica no respondió.
+    """
+
+    def __init__(self, doc_ids, scores, stages, year_range=None, matches=None):
+        self.doc_ids = doc_ids
+        self.scores = scores
+        self.stages = stages
+        self.year_range = year_range
+        self.matches = matches
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def degraded(self):
+        return any(stage["status"] != "ok" for stage in self.stages.values())
+
+    @property
+    def matched(self):
+        """Documentos para conteos y resúmenes: las coincidencias, o todo el ranking si no se conocen."""
+        return self.matches if self.matches is not None else self.doc_ids
+
+
+class ResultPage:
+    """Una página de resultados y el cursor (puntaje, id) del último, para pedir la siguiente."""
+
+    def __init__(self, doc_ids, scores, next_cursor, total, year_range=None, stages=None):
+        self.doc_ids = doc_ids
+        self.scores = scores
+        self.next_cursor = next_cursor
+        self.total = total
+        self.year_range = year_range
+        self.stages = stages or {}
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fusiona listas ordenadas de ids: puntaje = Σ 1 / (k + posición)."""
+    scores = {}
+    for ranking in rankings:
+        for position, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + position)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class HybridRetriever:
+    def __init__(self, store, text_index, vector_index=None, year_index=None, budgets_ms=None, candidates=50,
+                 fuzzy_index=None):
+        self.store = store
+        self.text_index = text_index
+        self.fuzzy_index = fuzzy_index
+        self.vector_index = vector_index
+        self.year_index = year_index
+        self.budgets_ms = dict(DEFAULT_BUDGETS_MS, **(budgets_ms or {}))
+        self.candidates = candidates
+        # Rankings completos recientes, compartidos por todas las sesiones (tamaño acotado)
+        self._rankings = OrderedDict()
+        self._rankings_lock = threading.Lock()
+
+    def _lexical(self, query, n):
+        if self.fuzzy_index is not None:
+            # Nombres sin tildes o mal escritos: se agregan las palabras del vocabulario más cercanas
+            query = self.fuzzy_index.expand(query)
+        return [doc_id for doc_id, _ in self.text_index.search(query, n)]
+
+    def _dense(self, query, n):
+        hits = self.vector_index.search(query, n, budget_ms=self.budgets_ms["dense"])
+        return self.store.doc_ids_for_iris([iri for iri, _ in hits]).tolist()
+
+    def retrieve(self, question, k=10, lexical_query=None, allowed=None):
+        """Punto de entrada único: los documentos más relevantes para la pregunta.
+
+        Si la pregunta menciona años se restringe a ese rango con el índice de
+        años; si además no tiene otros términos se devuelven todos los documentos
+        del rango. `lexical_query` reemplaza el texto usado en BM25 (p. ej.
+        palabras clave) y `allowed` restringe a un conjunto de ids de documento.
+        Con `k=None` se devuelven todas las coincidencias léxicas más los mejores
+        candidatos semánticos.
+        """
+        year_range = extract_year_range(question) if self.year_index is not None else None
+        if year_range is not None:
+            in_range = self.year_index.documents(*year_range)
+            allowed = in_range if allowed is None else np.intersect1d(in_range, allowed)
+            if not analyze(remove_year_expressions(lexical_query or question)):
+                doc_ids = allowed.tolist()
+                return RetrievalResult(doc_ids, [0.0] * len(doc_ids), {}, year_range, matches=doc_ids)
+            lexical_query = remove_year_expressions(lexical_query or question)
+
+        result = self._hybrid(question, k, lexical_query, allowed)
+        result.year_range = year_range
+        return result
+
+    def _hybrid(self, question, k, lexical_query, allowed):
+        n = self.candidates if k is None else max(k, self.candidates)
+        if allowed is not None:
+            allowed = set(np.asarray(allowed).tolist())
+            n = max(n, len(allowed))
+
+        started = time.perf_counter()
+        lexical_n = self.store.n_docs if k is None else n
+        futures = {}
+        if self.vector_index is not None:
+            futures["dense"] = _executors["dense"].submit(self._dense, question, n)
+        futures["lexical"] = _executors["lexical"].submit(self._lexical, lexical_query or question, lexical_n)
+
+        rankings, stages, matches = [], {}, None
+        # La densa se resuelve primero: si no dio un ranking, la léxica es la única que queda y se espera entera
+        for name, future in futures.items():
+            if name == "lexical" and stages.get("dense", {}).get("status") != "ok":
+                timeout = None
+            else:
+                # Cada etapa espera como máximo hasta su propio plazo desde el inicio
+                timeout = max(self.budgets_ms[name] / 1000 - (time.perf_counter() - started), 0)
+            try:
+                ranking = future.result(timeout=timeout)
+            except FutureTimeout:
+                # Si aún no empezó no llega a correr; si ya corre, termina en su pool acotado
+                future.cancel()
+                stages[name] = {"status": "timeout", "ms": (time.perf_counter() - started) * 1000}
+                continue
+            except Exception as e:
+                print(f"Etapa de recuperación '{name}' falló: {e}")
+                stages[name] = {"status": "error", "ms": (time.perf_counter() - started) * 1000}
+                continue
+            stages[name] = {"status": "ok", "ms": (time.perf_counter() - started) * 1000}
+            if allowed is not None:
+                ranking = [doc_id for doc_id in ranking if doc_id in allowed]
+            if name == "lexical":
+                matches = ranking
+            rankings.append(ranking)
+        for name, stage in stages.items():
+            record(f"retrieval.{name}", stage["ms"], status=stage["status"])
+
+        fused = reciprocal_rank_fusion(rankings)[:k]
+        return RetrievalResult([doc_id for doc_id, _ in fused], [score for _, score in fused], stages,
+                               matches=matches)
+
+    def ranking(self, question, lexical_query=None):
+        """Todas las coincidencias ordenadas por (-puntaje, id); se guardan las más recientes."""
+        key = (question, lexical_query)
+        with span("retrieval.ranking") as measured:
+            with self._rankings_lock:
+                result = self._rankings.get(key)
+                if result is not None:
+                    self._rankings.move_to_end(key)
+                    measured.set(cache_hit=True, results=len(result.doc_ids))
+                    return result
+            result = self.retrieve(question, None, lexical_query)
+            measured.set(cache_hit=False, results=len(result.doc_ids), degraded=result.degraded)
+            # Un ranking degradado (etapa con timeout) no se guarda: la próxima vez puede salir completo
+            if not result.degraded:
+                with self._rankings_lock:
+                    self._rankings[key] = result
+                    while len(self._rankings) > RANKING_CACHE_SIZE:
+                        self._rankings.popitem(last=False)
+            return result
+
+    def clear_cache(self):
+        """Vacía la caché de rankings (p. ej. para medir la recuperación en frío)."""
+        with self._rankings_lock:
+            self._rankings.clear()
+
+    def page(self, question, page_size=PAGE_SIZE, cursor=None, lexical_query=None):
+        """Paginación por cursor (keyset): la página que sigue a `cursor` en el orden (-puntaje, id).
+
+        El cursor es el (puntaje, id) del último resultado de la página anterior, así
+        una página no depende de cuántas se hayan visto ni de guardar las anteriores.
+        """
+        result = self.ranking(question, lexical_query)
+        doc_ids = np.asarray(result.doc_ids, dtype=np.int64)
+        scores = np.asarray(result.scores, dtype=np.float64)
+        start = 0
+        if cursor is not None:
+            last_score, last_id = cursor
+            after = (scores < last_score) | ((scores == last_score) & (doc_ids > last_id))
+            start = int(np.argmax(after)) if after.any() else len(doc_ids)
+        end = min(start + page_size, len(doc_ids))
+        next_cursor = (float(scores[end - 1]), int(doc_ids[end - 1])) if end < len(doc_ids) else None
+        return ResultPage(doc_ids[start:end].tolist(), scores[start:end].tolist(), next_cursor,
+                          len(doc_ids), result.year_range, result.stages)
+
+
+def build_retriever(store, text_index, year_index=None, budgets_ms=None, fuzzy_index=None):
+    """Crea el recuperador; si no hay modelo de embeddings disponible, queda sólo léxico."""
+    try:
+        vector_index = load_vector_index(store)
+    except Exception as e:
+        # Sin sentence-transformers, o sin red/disco para el modelo: la app arranca igual
+        print(f"Índice vectorial no disponible ({e}); se usa sólo búsqueda léxica")
+        vector_index = None
+    if vector_index is not None:
+        # Cargar el modelo en segundo plano para que la primera consulta no agote el presupuesto
+        _executors["dense"].submit(lambda: vector_index.encoder)
+    return HybridRetriever(store, text_index, vector_index, year_index, budgets_ms, fuzzy_index=fuzzy_index)
@@ -0,0 +1,277 @@
+"""Snapshot binario y versionado del grafo RDF (dataset.ttl) y de metadata.json.
+
+El snapshot guarda los términos del grafo codificados como enteros y las
+tripletas como un arreglo int32, de modo que se puede abrir con mmap sin
+volver a parsear Turtle. Sólo se reconstruye cuando cambia la versión del
+dataset en metadata.json (versionNumber / lastUpdateTime) o el formato.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+import rdflib
+
+from metrics import span
+
+SNAPSHOT_FORMAT = 1
+MAGIC = b"IRASNAP\x00"
+INDEX_DIR = "indices"
+SNAPSHOT_FILE = os.path.join(INDEX_DIR, "dataset.snapshot")
+
+# Tipos de término
+IRI, BNODE, LITERAL, LANG_LITERAL, TYPED_LITERAL = range(5)
+
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 8
+
+
+# 📌 Partes de metadata.json que necesitan las apps
+def read_dataset_version(metadata_file):
+    """Lee la versión del dataset y las palabras clave desde metadata.json."""
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    version = metadata["datasetVersion"]
+    citation_fields = version["metadataBlocks"]["citation"]["fields"]
+    keywords = [
+        kw["keywordValue"]["value"]
+        for field in citation_fields if field["typeName"] == "keyword"
+        for kw in field["value"]
+    ]
+    return {
+        "versionNumber": version.get("versionNumber"),
+        "versionMinorNumber": version.get("versionMinorNumber"),
+        "lastUpdateTime": version.get("lastUpdateTime"),
+        "keywords": keywords,
+    }
+
+
+def _encode_term(term, strings):
+    """Codifica un término rdflib como (tipo, id léxico, id extra)."""
+    def intern(text):
+        return strings.setdefault(text, len(strings))
+
+    if isinstance(term, rdflib.Literal):
+        if term.language:
+            return LANG_LITERAL, intern(str(term)), intern(term.language)
+        if term.datatype:
+            return TYPED_LITERAL, intern(str(term)), intern(str(term.datatype))
+        return LITERAL, intern(str(term)), -1
+    if isinstance(term, rdflib.BNode):
+        return BNODE, intern(str(term)), -1
+    return IRI, intern(str(term)), -1
+
+
+def _serialize(graph, dataset_version, ttl_size):
+    """Convierte el grafo en los bytes del snapshot."""
+    strings = {}
+    terms = {}
+    term_rows = []
+    triples = np.empty((len(graph), 3), dtype=np.int32)
+
+    # Orden estable: el snapshot no depende del orden de iteración de rdflib
+    for i, triple in enumerate(sorted(graph)):
+        for j, term in enumerate(triple):
+            term_id = terms.get(term)
+            if term_id is None:
+                term_id = terms[term] = len(term_rows)
+                term_rows.append(_encode_term(term, strings))
+            triples[i, j] = term_id
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    term_array = np.array(term_rows, dtype=np.int32).reshape(-1, 3)
+
+    sections = {
+        "strings_blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "strings_offsets": offsets,
+        "term_kind": term_array[:, 0].astype(np.uint8),
+        "term_lex": np.ascontiguousarray(term_array[:, 1]),
+        "term_extra": np.ascontiguousarray(term_array[:, 2]),
+        "triples": triples,
+    }
+
+    header = dict(dataset_version)
+    header["format"] = SNAPSHOT_FORMAT
+    header["ttl_size"] = ttl_size
+    header["fingerprint"] = hashlib.sha1(triples.tobytes() + sections["strings_blob"].tobytes()).hexdigest()
+    header["sections"] = {}
+
+    # Primero se calcula el tamaño de la cabecera para poder alinear las secciones
+    layout = []
+    offset = 0
+    for name, array in sections.items():
+        offset = -(-offset // _ALIGN) * _ALIGN
+        header["sections"][name] = [offset, array.dtype.str, list(array.shape)]
+        layout.append((offset, array))
+        offset += array.nbytes
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(_PREFIX.size + len(header_bytes)) // _ALIGN) * _ALIGN
+    out = bytearray(data_start + offset)
+    out[:_PREFIX.size] = _PREFIX.pack(MAGIC, SNAPSHOT_FORMAT, len(header_bytes))
+    out[_PREFIX.size:_PREFIX.size + len(header_bytes)] = header_bytes
+    for start, array in layout:
+        out[data_start + start:data_start + start + array.nbytes] = array.tobytes()
+    return bytes(out)
+
+
+class Snapshot:
+    """Vista de sólo lectura sobre un snapshot (archivo con mmap o bytes)."""
+
+    def __init__(self, buffer, path=None):
+        magic, fmt, header_len = _PREFIX.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path or 'buffer'} no es un snapshot válido")
+        self.header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_len]).decode("utf-8"))
+        self.path = path
+        self._buffer = buffer
+        data_start = -(-(_PREFIX.size + header_len) // _ALIGN) * _ALIGN
+        for name, (offset, dtype, shape) in self.header["sections"].items():
+            count = int(np.prod(shape)) if shape else 1
+            array = np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+            setattr(self, name, array.reshape(shape))
+        self._strings = None
+        self._string_ids = None
+        self._terms = None
+
+    @property
+    def keywords(self):
+        return self.header.get("keywords", [])
+
+    @property
+    def fingerprint(self):
+        return self.header["fingerprint"]
+
+    def __len__(self):
+        return len(self.triples)
+
+    def __reduce__(self):
+        # A otro proceso (p. ej. los workers de batch_qa) se pasa la ruta, que se vuelve a mapear;
+        # sólo un snapshot que no se pudo guardar viaja como bytes
+        if self.path is not None:
+            return load_snapshot, (self.path,)
+        return Snapshot, (bytes(self._buffer),)
+
+    @property
+    def strings(self):
+        """Tabla de cadenas decodificada (se decodifica una sola vez)."""
+        if self._strings is None:
+            blob = self.strings_blob.tobytes()
+            offsets = self.strings_offsets.tolist()
+            self._strings = [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return self._strings
+
+    def lexical(self, term_id):
+        """Forma léxica (equivalente a str(term)) de un término."""
+        return self.strings[self.term_lex[term_id]]
+
+    def term_ids(self, text):
+        """Ids de los términos cuya forma léxica es `text`."""
+        if self._string_ids is None:
+            self._string_ids = {s: i for i, s in enumerate(self.strings)}
+        string_id = self._string_ids.get(text)
+        if string_id is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.term_lex == string_id)
+
+    def term(self, term_id):
+        """Reconstruye el término rdflib correspondiente a un id."""
+        if self._terms is None:
+            self._terms = self._build_terms()
+        return self._terms[term_id]
+
+    def _build_terms(self):
+        strings = self.strings
+        terms = []
+        for kind, lex, extra in zip(self.term_kind.tolist(), self.term_lex.tolist(), self.term_extra.tolist()):
+            text = strings[lex]
+            if kind == IRI:
+                terms.append(rdflib.URIRef(text))
+            elif kind == BNODE:
+                terms.append(rdflib.BNode(text))
+            elif kind == LANG_LITERAL:
+                terms.append(rdflib.Literal(text, lang=strings[extra]))
+            elif kind == TYPED_LITERAL:
+                terms.append(rdflib.Literal(text, datatype=rdflib.URIRef(strings[extra])))
+            else:
+                terms.append(rdflib.Literal(text))
+        return terms
+
+    def to_graph(self):
+        """Materializa un rdflib.Graph (para consultas SPARQL arbitrarias)."""
+        if self._terms is None:
+            self._terms = self._build_terms()
+        terms = self._terms
+        g = rdflib.Graph()
+        g.bind("dc", rdflib.Namespace("http://purl.org/dc/elements/1.1/"))
+        g.addN((terms[s], terms[p], terms[o], g) for s, p, o in self.triples.tolist())
+        return g
+
+
+# 📌 Construcción y carga
+def build_snapshot(ttl_file, metadata_file, snapshot_file=SNAPSHOT_FILE, graph=None):
+    """Compila dataset.ttl y metadata.json en un snapshot binario."""
+    if graph is None:
+        with span("snapshot.parse_ttl", size=os.path.getsize(ttl_file)):
+            graph = rdflib.Graph()
+            graph.parse(ttl_file, format="turtle")
+    with span("snapshot.serialize") as measured:
+        data = _serialize(graph, read_dataset_version(metadata_file), os.path.getsize(ttl_file))
+        measured.set(size=len(data))
+    try:
+        os.makedirs(os.path.dirname(snapshot_file) or ".", exist_ok=True)
+        tmp_file = f"{snapshot_file}.tmp{os.getpid()}"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, snapshot_file)
+    except OSError as e:
+        # En un sistema de archivos de sólo lectura se sirve el snapshot desde memoria
+        print(f"No se pudo guardar el snapshot en {snapshot_file}: {e}")
+        return Snapshot(data)
+    return load_snapshot(snapshot_file)
+
+
+def load_snapshot(snapshot_file=SNAPSHOT_FILE):
+    """Abre un snapshot con mmap (sin copiar los arreglos a memoria)."""
+    with open(snapshot_file, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return Snapshot(buffer, path=snapshot_file)
+
+
+def snapshot_is_fresh(snapshot_file, ttl_file, metadata_file):
+    """Indica si el snapshot corresponde a la versión actual del dataset."""
+    try:
+        with open(snapshot_file, "rb") as f:
+            magic, fmt, header_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC or fmt != SNAPSHOT_FORMAT:
+                return False
+            header = json.loads(f.read(header_len).decode("utf-8"))
+    except (OSError, ValueError, struct.error):
+        return False
+    current = read_dataset_version(metadata_file)
+    return (
+        header.get("versionNumber") == current["versionNumber"]
+        and header.get("versionMinorNumber") == current["versionMinorNumber"]
+        and header.get("lastUpdateTime") == current["lastUpdateTime"]
+        and header.get("ttl_size") == os.path.getsize(ttl_file)
+    )
+
+
+def load_or_build_snapshot(ttl_file, metadata_file, snapshot_file=SNAPSHOT_FILE):
+    """Carga el snapshot; sólo vuelve a parsear Turtle si está desactualizado."""
+    with span("snapshot.load") as measured:
+        if snapshot_is_fresh(snapshot_file, ttl_file, metadata_file):
+            measured.set(cache_hit=True, size=os.path.getsize(snapshot_file))
+            return load_snapshot(snapshot_file)
+        measured.set(cache_hit=False)
+        print(f"Snapshot desactualizado o inexistente, compilando {ttl_file}...")
+        return build_snapshot(ttl_file, metadata_file, snapshot_file)
+
+
+if __name__ == "__main__":
+    snapshot = build_snapshot("dataset.ttl", "metadata.json")
+    print(f"Snapshot generado en {SNAPSHOT_FILE}: {len(snapshot)} tripletas")
@@ -0,0 +1,349 @@
+"""Servidores locales que imitan a GraphDB (endpoint SPARQL), a la API de inferencia y a Dataverse.
+
+Sirven para medir el pipeline completo sin red ni GPU. El endpoint SPARQL
+responde las consultas con el LocalBackend (TripleStore y, si hace falta,
+rdflib) y acepta cargas Graph Store HTTP en `/rdf-graphs/service` (grafo por
+defecto en `uploads`, grafos con nombre en `graphs`) y el `MOVE` de SPARQL
+Update en `/statements`, para revisar lo que hizo `backends.bulk_load`. El de
+inferencia emite tokens en server-sent events como text-generation-inference. El
+de Dataverse sirve la exportación `dataverse_json` y los archivos (con Range),
+para probar dataverse_sync sin red. El guionado responde una secuencia fija de
+estados (para probar reintentos y el circuit breaker de http_client). Todos tienen latencia configurable (fija + jitter con semilla, para que las
+corridas sean reproducibles) y corren en un hilo aparte:
+
+    with start_sparql_stand_in(store, latency_ms=20) as sparql:
+        get_client().get(sparql.url + "/repositories/IRA", params={"query": q})
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from backends import LocalBackend
+
+_SELECT_RE = re.compile(r"SELECT\s+(?:DISTINCT\s+|REDUCED\s+)?((?:\?\w+\s*)+)WHERE", re.I)
+_MOVE_RE = re.compile(r"\s*MOVE\s+(?:SILENT\s+)?<([^>]+)>\s+TO\s+(?:DEFAULT|<([^>]+)>)\s*", re.I)
+
+# Texto que devuelve el modelo simulado, palabra por palabra
+STAND_IN_ANSWER = (
+    "Los documentos muestran la transformación urbana de Lima entre fines del siglo XIX "
+    "y comienzos del XX: plazas, jirones y edificios públicos fotografiados por estudios "
+    "como el de Courret, junto con escenas de Chorrillos, el Callao y el Rímac. "
+    "Entre los puntos importantes destacan la modernización del transporte, "
+    "las celebraciones cívicas y la vida cotidiana en los balnearios. "
+)
+
+
+class StandIn:
+    """Servidor HTTP local en un hilo aparte; se cierra con `close()` o al salir del `with`."""
+
+    def __init__(self, handler_class, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), handler_class)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name=handler_class.__name__, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _LatencyHandler(BaseHTTPRequestHandler):
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def _sleep(self, base_ms):
+        with self.rng_lock:
+            jitter = self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        if base_ms + jitter > 0:
+            time.sleep((base_ms + jitter) / 1000)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status, payload, content_type="application/json"):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 📌 Endpoint SPARQL (GraphDB)
+def _binding(value):
+    kind = "uri" if value.startswith("http://") or value.startswith("https://") else "literal"
+    return {"type": kind, "value": value}
+
+
+def sparql_results(backend, sparql_query):
+    """Resultados SPARQL JSON de una consulta SELECT respondida por `backend`."""
+    rows = backend.select(sparql_query)
+    match = _SELECT_RE.search(sparql_query)
+    variables = [var.lstrip("?") for var in match.group(1).split()] if match else list(rows[0] if rows else [])
+    return {
+        "head": {"vars": variables},
+        "results": {"bindings": [
+            {var: _binding(value) for var, value in row.items() if value is not None} for row in rows
+        ]},
+    }
+
+
+class SparqlHandler(_LatencyHandler):
+    protocol_version = "HTTP/1.1"
+    backend = None
+    repository = "IRA"
+    uploads = None
+    graphs = None
+    fail_uploads = 0
+    graphs_lock = threading.Lock()
+
+    @property
+    def _graph_store(self):
+        return urlsplit(self.path).path == f"/repositories/{self.repository}/rdf-graphs/service"
+
+    def _graph(self):
+        """Lista de cuerpos del grafo de la URL: `uploads` para ?default, `graphs[iri]` para ?graph=iri."""
+        graph = parse_qs(urlsplit(self.path).query).get("graph")
+        if not graph:
+            return self.uploads
+        return self.graphs.setdefault(graph[0], [])
+
+    def _answer(self, sparql_query):
+        if urlsplit(self.path).path != f"/repositories/{self.repository}":
+            self.send_error(404)
+            return
+        self._sleep(self.latency_ms)
+        try:
+            results = sparql_results(self.backend, sparql_query or "")
+        except Exception as e:
+            self.send_error(400, f"Consulta no válida: {e}")
+            return
+        self._send_json(200, results, "application/sparql-results+json")
+
+    def _no_content(self):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._answer(parse_qs(urlsplit(self.path).query).get("query", [""])[0])
+
+    def do_POST(self):
+        body = self._read_body()
+        if self._graph_store:
+            self._sleep(self.latency_ms)
+            with self.graphs_lock:
+                rejected = self.fail_uploads > 0
+                if rejected:
+                    type(self).fail_uploads -= 1
+                else:
+                    self._graph().append(body.decode("utf-8"))
+            if rejected:
+                self.send_error(400, "Bloque rechazado")
+            else:
+                self._no_content()
+        elif urlsplit(self.path).path == f"/repositories/{self.repository}/statements":
+            self._move(parse_qs(body.decode("utf-8")).get("update", [""])[0])
+        elif self.headers.get("Content-Type", "").startswith("application/sparql-query"):
+            self._answer(body.decode("utf-8"))
+        else:
+            self._answer(parse_qs(body.decode("utf-8")).get("query", [""])[0])
+
+    def do_DELETE(self):
+        if not self._graph_store:
+            self.send_error(404)
+            return
+        with self.graphs_lock:
+            self._graph().clear()
+        self._no_content()
+
+    def _move(self, sparql_update):
+        """Sólo `MOVE <origen> TO DEFAULT|<destino>`, lo que usa bulk_load para reemplazar un grafo."""
+        match = _MOVE_RE.fullmatch(sparql_update)
+        if match is None:
+            self.send_error(400, "Sólo se admite MOVE")
+            return
+        source, destination = match.groups()
+        with self.graphs_lock:
+            moved = self.graphs.pop(source, [])
+            if destination is None:
+                self.uploads[:] = moved
+            else:
+                self.graphs[destination] = moved
+        self._no_content()
+
+
+def start_sparql_stand_in(store, latency_ms=0.0, jitter_ms=0.0, repository="IRA", seed=0, port=0, fail_uploads=0):
+    """Stand-in de GraphDB; `stand_in.uploads` tiene los cuerpos N-Triples del grafo por defecto.
+
+    Las primeras `fail_uploads` cargas Graph Store se rechazan con 400 (para probar cargas fallidas).
+    """
+    handler = type("SparqlStandIn", (SparqlHandler,), {
+        "backend": LocalBackend(store), "repository": repository, "latency_ms": latency_ms, "jitter_ms": jitter_ms,
+        "rng": random.Random(seed), "rng_lock": threading.Lock(), "uploads": [], "graphs": {},
+        "fail_uploads": fail_uploads, "graphs_lock": threading.Lock(),
+    })
+    stand_in = StandIn(handler, port=port)
+    stand_in.uploads = handler.uploads
+    stand_in.graphs = handler.graphs
+    return stand_in
+
+
+# 📌 API de inferencia (text-generation-inference en streaming)
+class InferenceHandler(_LatencyHandler):
+    token_ms = 0.0
+    answer = STAND_IN_ANSWER
+
+    def do_POST(self):
+        if not urlsplit(self.path).path.startswith("/models/"):
+            self.send_error(404)
+            return
+        try:
+            request = json.loads(self._read_body() or b"{}")
+        except ValueError:
+            self.send_error(400, "JSON inválido")
+            return
+        max_new_tokens = int((request.get("parameters") or {}).get("max_new_tokens", 250))
+        words = self.answer.split(" ")
+        tokens = [words[i % len(words)] + " " for i in range(max_new_tokens)]
+
+        # HTTP/1.0: el cuerpo termina al cerrar la conexión, como un flujo SSE sin Content-Length
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        self._sleep(self.latency_ms)
+        for i, text in enumerate(tokens):
+            if i:
+                self._sleep(self.token_ms)
+            event = {"token": {"id": i, "text": text, "special": False}}
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def start_inference_stand_in(first_token_ms=0.0, token_ms=0.0, jitter_ms=0.0, answer=STAND_IN_ANSWER, seed=0, port=0):
+    """`first_token_ms` es la espera antes del primer token y `token_ms` la de cada token siguiente."""
+    handler = type("InferenceStandIn", (InferenceHandler,), {
+        "latency_ms": first_token_ms, "token_ms": token_ms, "jitter_ms": jitter_ms, "answer": answer,
+        "rng": random.Random(seed), "rng_lock": threading.Lock(),
+    })
+    return StandIn(handler, port=port)
+
+
+# 📌 Dataverse (exportación de metadatos y descarga de archivos)
+class DataverseHandler(_LatencyHandler):
+    protocol_version = "HTTP/1.1"
+    metadata = None
+    persistent_id = None
+    files = None
+    requests = None
+
+    def _send_bytes(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.requests.append((url.path, self.headers.get("Range")))
+        self._sleep(self.latency_ms)
+        if url.path == "/api/datasets/export":
+            params = parse_qs(url.query)
+            if params.get("exporter") != ["dataverse_json"] or params.get("persistentId") != [self.persistent_id]:
+                self.send_error(404)
+                return
+            self._send_json(200, self.metadata)
+            return
+
+        match = re.fullmatch(r"/api/access/datafile/(\d+)", url.path)
+        if not match or int(match.group(1)) not in self.files:
+            self.send_error(404)
+            return
+        content = self.files[int(match.group(1))]
+        range_header = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range") or "")
+        if range_header is None:
+            self._send_bytes(200, content)
+            return
+        start = int(range_header.group(1))
+        if start >= len(content):
+            self._send_bytes(416, b"", [("Content-Range", f"bytes */{len(content)}")])
+            return
+        self._send_bytes(206, content[start:], [("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")])
+
+
+def start_dataverse_stand_in(metadata, files, persistent_id, latency_ms=0.0, jitter_ms=0.0, seed=0, port=0):
+    """Stand-in de Dataverse: `metadata` es la exportación dataverse_json y `files` {id: bytes}.
+
+    `stand_in.requests` registra (ruta, cabecera Range) de cada petición.
+    """
+    handler = type("DataverseStandIn", (DataverseHandler,), {
+        "metadata": metadata, "files": files, "persistent_id": persistent_id, "requests": [],
+        "latency_ms": latency_ms, "jitter_ms": jitter_ms, "rng": random.Random(seed), "rng_lock": threading.Lock(),
+    })
+    stand_in = StandIn(handler, port=port)
+    stand_in.requests = handler.requests
+    return stand_in
+
+
+# 📌 Respuestas guionadas (reintentos, Retry-After, plazos y circuit breaker del cliente HTTP)
+class ScriptedHandler(_LatencyHandler):
+    protocol_version = "HTTP/1.1"
+    script = None
+    requests = None
+    script_lock = None
+
+    def do_GET(self):
+        with self.script_lock:
+            self.requests.append(time.monotonic())
+            # La última respuesta del guion se repite indefinidamente
+            status, headers = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        self._sleep(self.latency_ms)
+        body = json.dumps({"status": status}).encode("utf-8")
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente ya se fue (p. ej. se le acabó el plazo)
+            self.close_connection = True
+
+
+def start_scripted_stand_in(script, latency_ms=0.0, port=0):
+    """Responde los GET con `script`, una lista de (estado, {cabecera: valor}) en orden.
+
+    `stand_in.requests` guarda el instante (reloj monotónico) de cada petición.
+    """
+    handler = type("ScriptedStandIn", (ScriptedHandler,), {
+        "script": list(script), "requests": [], "script_lock": threading.Lock(), "latency_ms": latency_ms,
+    })
+    stand_in = StandIn(handler, port=port)
+    stand_in.requests = handler.requests
+    return stand_in
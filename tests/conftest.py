@@ -0,0 +1,43 @@
+import json
+import os
+import sys
+
+import pytest
+
+# Los módulos viven en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_TTL = """
+@prefix dc: <http://purl.org/dc/elements/1.1/> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+
+<http://ira.pucp.edu.pe/doc/1> dc:title "Plaza Mayor de Lima" ;
+    dc:date "1906"^^xsd:gYear ;
+    dc:creator "Courret Hermanos" ;
+    dc:subject "Fotografía" .
+<http://ira.pucp.edu.pe/doc/2> dc:title "Balneario de Chorrillos" ;
+    dc:date "1910"^^xsd:gYear ;
+    dc:subject "Fotografía" .
+<http://ira.pucp.edu.pe/doc/3> dc:title "Carta de José de la Riva-Agüero" ;
+    dc:creator "José de la Riva-Agüero" .
+"""
+SAMPLE_METADATA = {
+    "datasetVersion": {
+        "versionNumber": 1, "versionMinorNumber": 0, "lastUpdateTime": "2025-01-01T00:00:00Z",
+        "metadataBlocks": {"citation": {"fields": [{"typeName": "keyword", "value": []}]}},
+        "files": [],
+    },
+}
+
+
+@pytest.fixture
+def small_store(tmp_path):
+    """TripleStore de tres documentos, compilado en un directorio temporal."""
+    from snapshot import build_snapshot
+    from triple_store import TripleStore
+
+    ttl_file = tmp_path / "dataset.ttl"
+    ttl_file.write_text(SAMPLE_TTL, encoding="utf-8")
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps(SAMPLE_METADATA), encoding="utf-8")
+    return TripleStore(build_snapshot(str(ttl_file), str(metadata_file), str(tmp_path / "dataset.snapshot")))
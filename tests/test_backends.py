@@ -0,0 +1,65 @@
+import pytest
+
+from backends import (FallbackBackend, LocalBackend, SparqlBackend, bulk_load, select_documents,
+                      snapshot_ntriples)
+from stand_ins import start_sparql_stand_in
+
+REPOSITORY = "IRA"
+
+
+def graph_store(stand_in):
+    return f"{stand_in.url}/repositories/{REPOSITORY}/rdf-graphs/service?default"
+
+
+def uploaded_triples(bodies):
+    return sorted(line for body in bodies for line in body.splitlines() if line)
+
+
+def test_replace_swaps_in_the_complete_load(small_store):
+    with start_sparql_stand_in(small_store, repository=REPOSITORY) as sparql:
+        sparql.uploads.append("<http://viejo> <http://p> \"viejo\" .\n")
+        stats = bulk_load(snapshot_ntriples(small_store.snapshot), graph_store(sparql), chunk_size=3, workers=2,
+                          replace=True)
+
+        assert stats["failed"] == 0
+        assert stats["triples"] == len(small_store.snapshot)
+        assert uploaded_triples(sparql.uploads) == sorted(line.strip() for line in
+                                                          snapshot_ntriples(small_store.snapshot))
+        assert not any(sparql.graphs.values())
+
+
+def test_failed_chunk_leaves_the_live_graph_untouched(small_store):
+    live = "<http://ira.pucp.edu.pe/doc/1> <http://purl.org/dc/elements/1.1/title> \"Plaza Mayor de Lima\" .\n"
+    with start_sparql_stand_in(small_store, repository=REPOSITORY, fail_uploads=1) as sparql:
+        sparql.uploads.append(live)
+        with pytest.raises(RuntimeError, match="no se modificó"):
+            bulk_load(snapshot_ntriples(small_store.snapshot), graph_store(sparql), chunk_size=3, workers=2,
+                      replace=True)
+
+        assert sparql.uploads == [live]
+        assert not any(sparql.graphs.values())
+
+
+def test_append_without_replace(small_store):
+    with start_sparql_stand_in(small_store, repository=REPOSITORY) as sparql:
+        sparql.uploads.append("<http://a> <http://p> \"previo\" .\n")
+        bulk_load(snapshot_ntriples(small_store.snapshot), graph_store(sparql), chunk_size=100)
+        assert len(uploaded_triples(sparql.uploads)) == len(small_store.snapshot) + 1
+
+
+def test_remote_and_local_backends_agree(small_store):
+    iris = ["http://ira.pucp.edu.pe/doc/3", "http://ira.pucp.edu.pe/doc/1"]
+    local = LocalBackend(small_store)
+    with start_sparql_stand_in(small_store, repository=REPOSITORY) as sparql:
+        remote = SparqlBackend(f"{sparql.url}/repositories/{REPOSITORY}")
+        assert select_documents(remote, iris) == select_documents(local, iris)
+        assert [row["doc"] for row in select_documents(remote, iris)] == iris
+
+
+def test_fallback_answers_locally_when_remote_is_down(small_store):
+    backend = FallbackBackend(SparqlBackend("http://127.0.0.1:9/repositories/IRA"), LocalBackend(small_store),
+                              budget=1.0)
+    rows = select_documents(backend, ["http://ira.pucp.edu.pe/doc/2"])
+    assert [row["title"] for row in rows] == ["Balneario de Chorrillos"]
+    assert backend.fallbacks == 1
+    assert backend.degraded
@@ -0,0 +1,49 @@
+import json
+
+from batch_qa import answered_ids
+from context_builder import NO_CONTEXT_MESSAGE
+
+
+def write_rows(path, rows, tail=""):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows) + tail, encoding="utf-8")
+
+
+def read_rows(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_retried_rows_are_removed_so_each_id_appears_once(tmp_path):
+    output = tmp_path / "respuestas.jsonl"
+    write_rows(output, [
+        {"id": 1, "answer": "Lima", "error": None},
+        {"id": 2, "answer": None, "error": "Error en Hugging Face API"},
+        {"id": 3, "answer": None, "error": NO_CONTEXT_MESSAGE},
+        {"id": 2, "answer": None, "error": "timeout"},
+        {"id": 4, "answer": None, "error": "timeout"},
+        {"id": 4, "answer": "Callao", "error": None},
+    ], tail='{"id": 5, "answ')
+
+    done = answered_ids(str(output))
+
+    assert done == {"1", "3", "4"}
+    assert sorted((row["id"], row["answer"]) for row in read_rows(output)) == [(1, "Lima"), (3, None), (4, "Callao")]
+
+
+def test_retrieval_only_rows_count_only_without_generation(tmp_path):
+    output = tmp_path / "respuestas.jsonl"
+    rows = [{"id": "a", "answer": None, "error": None}]
+    write_rows(output, rows)
+
+    assert answered_ids(str(output), require_answer=False) == {'"a"'}
+    assert read_rows(output) == rows
+    assert answered_ids(str(output)) == set()
+    assert read_rows(output) == []
+
+
+def test_clean_output_is_left_untouched(tmp_path):
+    output = tmp_path / "respuestas.jsonl"
+    write_rows(output, [{"id": 1, "answer": "Lima", "error": None}])
+    before = output.stat().st_mtime_ns
+
+    assert answered_ids(str(output)) == {"1"}
+    assert output.stat().st_mtime_ns == before
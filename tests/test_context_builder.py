@@ -0,0 +1,49 @@
+from context_builder import CHARS_PER_TOKEN, build_prompt, count_tokens
+
+TEMPLATE = "Pregunta: {question}\n{context}"
+
+
+def test_first_record_is_truncated_to_fit():
+    records = ["Primera frase " * 100, "Segunda frase."]
+    context = build_prompt(TEMPLATE, records, budget=60, separator=" ", question="¿Qué hay?")
+
+    assert len(context.records) == 1 and context.dropped == 1
+    assert context.tokens <= 60
+    assert count_tokens(context.prompt) <= 60
+    assert context.prompt.startswith("Pregunta: ¿Qué hay?\nPrimera frase")
+    assert context.prompt.endswith("...")
+
+
+def test_records_within_budget_enter_whole():
+    records = [{"title": "Plaza de Armas", "date": "1890"}, {"title": "Chorrillos", "date": "1905"}]
+    context = build_prompt(TEMPLATE, records, budget=200, question="Lima")
+
+    assert context.records == records and context.dropped == 0
+    assert "Título: Plaza de Armas" in context.prompt and "Título: Chorrillos" in context.prompt
+
+
+def test_template_larger_than_budget_leaves_no_records():
+    template = "x" * int(50 * CHARS_PER_TOKEN) + "{context}"
+    context = build_prompt(template, ["Una frase cualquiera que no va a entrar."], budget=50)
+
+    assert context.records == [] and context.dropped == 1
+
+
+def test_shared_prefix_and_suffix_do_not_overlap():
+    # Con prefijo y sufijo buscados por separado ("Lima " y " Lima") el segundo título quedaba vacío
+    records = [{"title": "Lima foto Lima", "date": "1906"}, {"title": "Lima Lima", "date": "1910"}]
+    context = build_prompt("{context}", records, budget=200)
+
+    assert "Título: foto Lima" in context.prompt
+    assert "Título: Lima\n" in context.prompt
+    assert "Título: \n" not in context.prompt
+
+
+def test_value_entirely_in_the_shared_header_leaves_no_line():
+    records = [{"title": "Vista de Lima ", "date": "1906"}, {"title": "Vista de Lima desde el cerro", "date": "1910"}]
+    context = build_prompt("{context}", records, budget=200)
+
+    assert "Título: Vista de Lima…" in context.prompt
+    assert "Fecha: 1906" in context.prompt and "Título: desde el cerro" in context.prompt
+    assert "Título: \n" not in context.prompt and context.prompt.count("Título:") == 2
+
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import dataverse_sync
+from dataverse_sync import dataset_files, fetch_metadata, make_client, sync_dataset
+from snapshot import read_dataset_version
+from stand_ins import start_dataverse_stand_in
+
+PERSISTENT_ID = "doi:10.21843/IRA/TEST"
+FILES = {
+    101: b"Plaza Mayor de Lima, 1906. " * 2000,
+    102: b"\x89PNG fotografia Courret" * 500,
+}
+
+
+def export(files, filenames=None, directories=None):
+    """Exportación dataverse_json mínima, con la forma de metadata.json."""
+    filenames = filenames or {file_id: f"archivo_{file_id}.bin" for file_id in files}
+    directories = directories or {102: "imagenes"}
+    entries = [
+        {"label": filenames[file_id], "directoryLabel": directories.get(file_id),
+         "dataFile": {"id": file_id, "filename": filenames[file_id], "filesize": len(content),
+                      "checksum": {"type": "MD5", "value": hashlib.md5(content).hexdigest()}}}
+        for file_id, content in files.items()
+    ]
+    return {
+        "id": 1, "identifier": "IRA/TEST", "publisher": "PUCP",
+        "datasetVersion": {
+            "versionNumber": 4, "versionMinorNumber": 1, "lastUpdateTime": "2025-03-01T10:00:00Z",
+            "metadataBlocks": {"citation": {"fields": [
+                {"typeName": "title", "value": "Archivo Histórico Riva-Agüero"},
+                {"typeName": "keyword", "value": [{"keywordValue": {"value": "Lima"}},
+                                                  {"keywordValue": {"value": "Fotografía"}}]},
+            ]}},
+            "files": entries,
+        },
+    }
+
+
+@pytest.fixture
+def dataverse():
+    with start_dataverse_stand_in(export(FILES), FILES, PERSISTENT_ID) as stand_in:
+        yield stand_in
+
+
+def test_fetch_metadata_round_trips_through_readers(dataverse, tmp_path):
+    metadata_file = str(tmp_path / "metadata.json")
+    fetch_metadata(dataverse.url, PERSISTENT_ID, metadata_file, client=make_client(1))
+
+    assert read_dataset_version(metadata_file) == {
+        "versionNumber": 4, "versionMinorNumber": 1, "lastUpdateTime": "2025-03-01T10:00:00Z",
+        "keywords": ["Lima", "Fotografía"],
+    }
+    assert sorted(entry["id"] for entry in dataset_files(metadata_file)) == [101, 102]
+    assert ("/api/datasets/export", None) in dataverse.requests
+
+
+def test_fetch_metadata_keeps_previous_file_on_error(dataverse, tmp_path):
+    metadata_file = str(tmp_path / "metadata.json")
+    with open(metadata_file, "w", encoding="utf-8") as f:
+        json.dump(export(FILES), f)
+
+    with pytest.raises(Exception):
+        fetch_metadata(dataverse.url, "doi:otro", metadata_file, client=make_client(1))
+    assert read_dataset_version(metadata_file)["versionNumber"] == 4
+
+
+def test_sync_downloads_resumes_and_skips(dataverse, tmp_path):
+    metadata_file = str(tmp_path / "metadata.json")
+    dest_dir = str(tmp_path / "dataset")
+    fetch_metadata(dataverse.url, PERSISTENT_ID, metadata_file, client=make_client(1))
+
+    # Una descarga interrumpida de 101 se retoma con Range desde el .part
+    os.makedirs(dest_dir)
+    with open(os.path.join(dest_dir, "archivo_101.bin.part"), "wb") as f:
+        f.write(FILES[101][:1000])
+
+    result = sync_dataset(dataverse.url, metadata_file, dest_dir, max_workers=2, client=make_client(2))
+    assert sorted(result["downloaded"]) == ["archivo_101.bin", "imagenes/archivo_102.bin"]
+    assert result["failed"] == []
+    with open(os.path.join(dest_dir, "archivo_101.bin"), "rb") as f:
+        assert f.read() == FILES[101]
+    with open(os.path.join(dest_dir, "imagenes", "archivo_102.bin"), "rb") as f:
+        assert f.read() == FILES[102]
+    assert ("/api/access/datafile/101", "bytes=1000-") in dataverse.requests
+
+    result = sync_dataset(dataverse.url, metadata_file, dest_dir, max_workers=2, client=make_client(2))
+    assert result["downloaded"] == []
+    assert sorted(result["skipped"]) == ["archivo_101.bin", "imagenes/archivo_102.bin"]
+
+
+def test_same_filename_in_different_folders_keeps_separate_state(tmp_path, monkeypatch):
+    files = {201: b"primera version " * 300, 202: b"segunda version " * 400}
+    metadata = export(files, filenames={201: "indice.csv", 202: "indice.csv"}, directories={201: "1906", 202: "1910"})
+    metadata_file = str(tmp_path / "metadata.json")
+    dest_dir = str(tmp_path / "dataset")
+    with open(metadata_file, "w", encoding="utf-8") as f:
+        json.dump(metadata, f)
+
+    with start_dataverse_stand_in(metadata, files, PERSISTENT_ID) as stand_in:
+        result = sync_dataset(stand_in.url, metadata_file, dest_dir, max_workers=2, client=make_client(2))
+        assert sorted(result["downloaded"]) == ["1906/indice.csv", "1910/indice.csv"]
+        with open(os.path.join(dest_dir, ".sync_state.json"), "r", encoding="utf-8") as f:
+            assert sorted(json.load(f)) == ["1906/indice.csv", "1910/indice.csv"]
+
+        # Con el estado de cada uno, la segunda pasada no recalcula ningún checksum
+        monkeypatch.setattr(dataverse_sync, "file_digest", lambda *args: pytest.fail("checksum recalculado"))
+        result = sync_dataset(stand_in.url, metadata_file, dest_dir, max_workers=2, client=make_client(2))
+    assert sorted(result["skipped"]) == ["1906/indice.csv", "1910/indice.csv"]
@@ -0,0 +1,57 @@
+import random
+
+import numpy as np
+
+from facets import FACETS, FacetIndex, record_facets
+
+
+def random_facets(n_docs, seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(n_docs):
+        values = {
+            "subject": rng.sample(["Fotografía", "Lima", "Historia", "Callao"], rng.randint(0, 2)),
+            "date": [str(rng.randint(1850, 1950))] if rng.random() < 0.8 else [],
+            # Autores casi únicos: la faceta de alta cardinalidad
+            "creator": [f"Autor {rng.randint(0, n_docs)}"] if rng.random() < 0.9 else [],
+            "language": ["es"] if rng.random() < 0.95 else [],
+        }
+        docs.append(record_facets(values, ["Fotografía", "Lima"]))
+    return docs
+
+
+def brute_counts(doc_facets, facet, doc_ids):
+    counts = {}
+    for doc_id in set(doc_ids):
+        for value in doc_facets[doc_id][facet]:
+            counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def test_counts_match_brute_force():
+    doc_facets = random_facets(500)
+    index = FacetIndex(len(doc_facets), doc_facets, ["Fotografía", "Lima"])
+    subset = random.Random(1).sample(range(500), 120)
+    for facet in FACETS:
+        assert dict(index.counts(facet)) == brute_counts(doc_facets, facet, range(500))
+        assert dict(index.counts(facet, subset)) == brute_counts(doc_facets, facet, subset)
+        missing = sum(1 for doc_id in subset if not doc_facets[doc_id][facet])
+        assert index.count_missing(facet, subset) == missing
+
+
+def test_high_cardinality_facets_use_postings():
+    doc_facets = random_facets(500)
+    index = FacetIndex(len(doc_facets), doc_facets, ["Fotografía", "Lima"])
+    assert "creator" in index.postings
+    assert "category" in index.bits and "language" in index.bits
+
+
+def test_documents_and_top_are_ordered():
+    doc_facets = random_facets(200)
+    index = FacetIndex(len(doc_facets), doc_facets, ["Fotografía", "Lima"])
+    for facet in ("creator", "category"):
+        value, total = index.counts(facet, top=1)[0]
+        documents = index.documents(facet, value)
+        assert len(documents) == total
+        assert np.all(np.diff(documents) > 0)
+        assert all(value in doc_facets[doc_id][facet] for doc_id in documents)
@@ -0,0 +1,119 @@
+import time
+
+import httpx
+import pytest
+
+import http_client
+from http_client import CircuitBreaker, CircuitOpenError, DeadlineExceeded, HttpClient, deadline_in
+from stand_ins import start_scripted_stand_in
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Sin jitter: las esperas entre intentos son sólo las que pide el servidor
+    monkeypatch.setattr(http_client.random, "uniform", lambda low, high: 0.0)
+    client = HttpClient(max_attempts=3, timeout=5, breaker_threshold=3, breaker_cooldown=0.2)
+    yield client
+    client.close()
+
+
+def test_retries_5xx_and_429_until_success(client):
+    with start_scripted_stand_in([(503, {}), (429, {}), (200, {})]) as stand_in:
+        response = client.get(stand_in.url + "/")
+
+    assert response.status_code == 200
+    assert len(stand_in.requests) == 3
+    assert client.breaker(stand_in.url).state == "closed"
+
+
+def test_returns_last_response_when_attempts_run_out(client):
+    with start_scripted_stand_in([(502, {})]) as stand_in:
+        response = client.get(stand_in.url + "/")
+
+    assert response.status_code == 502
+    assert len(stand_in.requests) == 3
+
+
+def test_client_errors_are_not_retried(client):
+    with start_scripted_stand_in([(404, {}), (200, {})]) as stand_in:
+        response = client.get(stand_in.url + "/")
+
+    assert response.status_code == 404
+    assert len(stand_in.requests) == 1
+
+
+def test_honours_retry_after(client):
+    with start_scripted_stand_in([(503, {"Retry-After": "0.3"}), (200, {})]) as stand_in:
+        response = client.get(stand_in.url + "/")
+
+    assert response.status_code == 200
+    first, second = stand_in.requests
+    assert second - first >= 0.3
+
+
+def test_retry_after_beyond_deadline_returns_without_waiting(client):
+    with start_scripted_stand_in([(503, {"Retry-After": "5"}), (200, {})]) as stand_in:
+        started = time.monotonic()
+        response = client.get(stand_in.url + "/", deadline=deadline_in(1))
+
+    assert response.status_code == 503
+    assert len(stand_in.requests) == 1
+    assert time.monotonic() - started < 1
+
+
+def test_expired_deadline_skips_the_request(client):
+    with start_scripted_stand_in([(200, {})]) as stand_in:
+        with pytest.raises(DeadlineExceeded):
+            client.get(stand_in.url + "/", deadline=time.monotonic() - 1)
+
+    assert stand_in.requests == []
+
+
+def test_slow_response_is_cut_at_the_deadline(client):
+    with start_scripted_stand_in([(200, {})], latency_ms=2000) as stand_in:
+        started = time.monotonic()
+        with pytest.raises(httpx.TimeoutException):
+            client.get(stand_in.url + "/", deadline=deadline_in(0.3))
+
+    assert time.monotonic() - started < 1.5
+
+
+def test_breaker_opens_half_opens_and_closes(client):
+    with start_scripted_stand_in([(500, {}), (500, {}), (500, {}), (200, {})]) as stand_in:
+        url = stand_in.url + "/"
+        breaker = client.breaker(url)
+
+        assert client.get(url).status_code == 500
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            client.get(url)
+        assert len(stand_in.requests) == 3
+
+        time.sleep(0.25)
+        assert breaker.state == "half-open"
+        assert client.get(url, retry=False).status_code == 200
+        assert breaker.state == "closed"
+        assert len(stand_in.requests) == 4
+
+
+def test_failed_probe_reopens_the_breaker(client):
+    with start_scripted_stand_in([(500, {})]) as stand_in:
+        url = stand_in.url + "/"
+        breaker = client.breaker(url)
+        client.get(url)
+        time.sleep(0.25)
+
+        assert client.get(url, retry=False).status_code == 500
+        assert breaker.state == "open"
+        assert len(stand_in.requests) == 4
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record_failure()
+
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from fuzzy_index import build_fuzzy_index, load_fuzzy_index
+from text_index import build_text_index, load_text_index
+
+
+@pytest.mark.parametrize("build, load", [(build_text_index, load_text_index), (build_fuzzy_index, load_fuzzy_index)])
+def test_failed_save_keeps_the_previous_index(small_store, tmp_path, monkeypatch, build, load):
+    path = str(tmp_path / "index.npz")
+    index = build(small_store)
+    index.save(path)
+    saved = open(path, "rb").read()
+
+    def interrupted(file, **arrays):
+        file.write(b"PK\x03\x04 a medias")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(np, "savez", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        index.save(path)
+    monkeypatch.undo()
+
+    assert open(path, "rb").read() == saved
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("index")) == ["index.npz"]
+    assert load(small_store, path).fingerprint == small_store.snapshot.fingerprint
+
+
+def test_read_only_loads_never_write(small_store, tmp_path):
+    text_path, fuzzy_path = tmp_path / "text.npz", tmp_path / "fuzzy.npz"
+
+    assert load_text_index(small_store, str(text_path), save=False).n_docs == small_store.n_docs
+    assert load_fuzzy_index(small_store, str(fuzzy_path), save=False).words
+    assert not text_path.exists() and not fuzzy_path.exists()
+
+
+def test_snapshot_reaches_workers_as_its_path(small_store):
+    import pickle
+
+    snapshot = small_store.snapshot
+    assert len(pickle.dumps(snapshot)) < 1024
+    copy = pickle.loads(pickle.dumps(snapshot))
+    assert copy.path == snapshot.path and copy.fingerprint == snapshot.fingerprint and len(copy) == len(snapshot)
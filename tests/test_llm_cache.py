@@ -0,0 +1,86 @@
+import threading
+import time
+
+from llm_cache import AnswerCache
+from llm_stream import GenerationCancelled, GenerationStream
+
+
+def make_cache(tmp_path):
+    return AnswerCache(str(tmp_path / "llm_cache.sqlite"))
+
+
+def wait_for_coalesced(cache, count=1):
+    deadline = time.monotonic() + 5
+    while cache.snapshot_stats()["coalesced"] < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_get_or_compute_stores_the_answer(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+    compute = lambda: calls.append(1) or "respuesta"
+
+    assert cache.get_or_compute("k", compute) == "respuesta"
+    assert cache.get_or_compute("k", compute) == "respuesta"
+    assert len(calls) == 1
+    assert cache.snapshot_stats()["hits"] == 1
+
+
+def test_cancelled_leader_hands_over_to_follower(tmp_path):
+    """Buscar dos veces la misma pregunta: se cancela la primera y la segunda se había unido a ella."""
+    cache = make_cache(tmp_path)
+    leader_started = threading.Event()
+
+    def leader_tokens(cancel_event):
+        yield "Lima "
+        leader_started.set()
+        cancel_event.wait(5)
+        raise GenerationCancelled()
+
+    def follower_tokens(cancel_event):
+        yield "Lima "
+        yield "antigua"
+
+    leader = GenerationStream(lambda cancel: cache.stream_or_compute("k", lambda: leader_tokens(cancel)))
+    assert leader_started.wait(5)
+    follower = GenerationStream(lambda cancel: cache.stream_or_compute("k", lambda: follower_tokens(cancel)))
+    wait_for_coalesced(cache)
+    leader.cancel()
+
+    assert follower.result() == "Lima antigua"
+    assert follower.error is None
+    assert leader.error is None
+    assert cache.get("k") == "Lima antigua"
+
+
+def test_cancellation_from_another_stream_is_an_error(tmp_path):
+    def produce(cancel_event):
+        yield "parcial"
+        raise GenerationCancelled()
+
+    stream = GenerationStream(produce, error_message="Falló.")
+    assert stream.result() == "parcial"
+    assert isinstance(stream.error, GenerationCancelled)
+
+
+def test_failed_leader_propagates_to_followers(tmp_path):
+    cache = make_cache(tmp_path)
+    release = threading.Event()
+    leader_started = threading.Event()
+
+    def failing():
+        leader_started.set()
+        release.wait(5)
+        raise RuntimeError("API caída")
+
+    leader = GenerationStream(lambda cancel: cache.stream_or_compute("k", failing), error_message="Falló.")
+    assert leader_started.wait(5)
+    follower = GenerationStream(lambda cancel: cache.stream_or_compute("k", lambda: iter(["no"])),
+                                error_message="Falló.")
+    wait_for_coalesced(cache)
+    release.set()
+
+    assert leader.result() == "Falló."
+    assert follower.result() == "Falló."
+    assert cache.get("k") is None
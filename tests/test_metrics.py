@@ -0,0 +1,47 @@
+import pytest
+
+from context_builder import build_prompt
+from metrics import Registry, Span, record, span, summary_rows, trace
+
+
+def test_payload_is_exported_per_unit():
+    registry = Registry()
+    registry.observe(Span("backend.remote", ms=12.0, size=2048))
+    registry.observe(Span("prompt.build", ms=1.0, size=300, unit="tokens"))
+    registry.observe(Span("documents.select", ms=3.0, size=20, unit="rows"))
+    text = registry.render_prometheus()
+
+    assert 'ira_stage_payload_bytes_total{stage="backend.remote"} 2048' in text
+    assert 'ira_stage_payload_tokens_total{stage="prompt.build"} 300' in text
+    assert 'ira_stage_payload_rows_total{stage="documents.select"} 20' in text
+    assert 'ira_stage_payload_bytes_total{stage="prompt.build"}' not in text
+    assert 'ira_stage_duration_seconds_count{stage="backend.remote"} 1' in text
+
+
+def test_unknown_unit_is_rejected():
+    with pytest.raises(ValueError):
+        Span("etapa", size=1, unit="kilos")
+
+
+def test_trace_collects_spans_and_summary_reports_units():
+    with trace("ask_question") as question_trace:
+        with span("documents.select", unit="rows") as measured:
+            measured.set(size=3)
+        record("llm.cache", cache_hit=True)
+
+    stages = [row["stage"] for row in question_trace.rows()]
+    assert stages == ["documents.select", "llm.cache", "ask_question"]
+    assert question_trace.rows()[0]["unit"] == "rows"
+    select = next(row for row in summary_rows() if row["stage"] == "documents.select")
+    assert "rows" in select["payload"]
+
+
+def test_build_prompt_records_its_token_count():
+    records = [{"title": "Plaza Mayor de Lima", "date": "1906"}, {"title": "Balneario de Chorrillos"}]
+    with trace("prompt") as prompt_trace:
+        context = build_prompt("Contexto:\n{context}", records)
+
+    assert "Plaza Mayor de Lima" in context.prompt
+    build = next(row for row in prompt_trace.rows() if row["stage"] == "prompt.build")
+    assert build["unit"] == "tokens"
+    assert build["size"] == context.tokens
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+
+import retrieval
+from retrieval import HybridRetriever, build_retriever
+
+
+class FakeStore:
+    n_docs = 10
+
+    def doc_ids_for_iris(self, iris):
+        return np.asarray([int(iri.rsplit("/", 1)[1]) for iri in iris], dtype=np.int64)
+
+
+class FakeTextIndex:
+    def __init__(self, hits, delay=0.0):
+        self.hits = hits
+        self.delay = delay
+
+    def search(self, query, n):
+        time.sleep(self.delay)
+        return [(doc_id, 1.0) for doc_id in self.hits[:n]]
+
+
+class FakeVectorIndex:
+    def __init__(self, hits, error=None):
+        self.hits = hits
+        self.error = error
+
+    def search(self, query, n, budget_ms=None):
+        if self.error is not None:
+            raise self.error
+        return [(f"http://ira/doc/{doc_id}", 1.0) for doc_id in self.hits[:n]]
+
+
+def test_slow_lexical_is_awaited_when_it_is_the_only_stage():
+    retriever = HybridRetriever(FakeStore(), FakeTextIndex([3, 1], delay=0.15), budgets_ms={"lexical": 10})
+    result = retriever.retrieve("plaza mayor", None)
+    assert result.doc_ids == [3, 1]
+    assert result.stages["lexical"]["status"] == "ok"
+
+
+def test_slow_lexical_is_awaited_when_dense_fails():
+    retriever = HybridRetriever(FakeStore(), FakeTextIndex([2], delay=0.15), FakeVectorIndex([], OSError("modelo")),
+                                budgets_ms={"lexical": 10})
+    result = retriever.retrieve("plaza mayor", None)
+    assert result.doc_ids == [2]
+    assert result.stages["dense"]["status"] == "error"
+
+
+def test_slow_lexical_is_dropped_when_dense_answered():
+    retriever = HybridRetriever(FakeStore(), FakeTextIndex([2], delay=0.3), FakeVectorIndex([5, 6]),
+                                budgets_ms={"lexical": 10})
+    result = retriever.retrieve("plaza mayor", None)
+    assert result.doc_ids == [5, 6]
+    assert result.stages["lexical"]["status"] == "timeout"
+    assert result.matched == [5, 6]
+
+
+def test_matches_exclude_dense_only_candidates():
+    retriever = HybridRetriever(FakeStore(), FakeTextIndex([1, 2]), FakeVectorIndex([2, 7, 8]))
+    result = retriever.retrieve("courret", None)
+    assert set(result.doc_ids) == {1, 2, 7, 8}
+    assert result.matches == [1, 2]
+    assert result.matched == [1, 2]
+
+
+def test_build_retriever_falls_back_to_lexical_on_any_error(monkeypatch):
+    def broken(store):
+        raise OSError("sin red para descargar el modelo")
+
+    monkeypatch.setattr(retrieval, "load_vector_index", broken)
+    retriever = build_retriever(FakeStore(), FakeTextIndex([4]))
+    assert retriever.vector_index is None
+    assert retriever.retrieve("lima", 5).doc_ids == [4]
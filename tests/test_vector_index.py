@@ -0,0 +1,27 @@
+import numpy as np
+
+from vector_index import VectorIndex
+
+
+def encoder(offset):
+    return lambda texts: np.array([[len(text) + offset, offset, 1.0] for text in texts], dtype=np.float32)
+
+
+def test_sync_replaces_the_file_instead_of_writing_into_a_mapped_one(small_store, tmp_path):
+    files = dict(vectors_file=str(tmp_path / "vectors.npy"), meta_file=str(tmp_path / "vectors.json"))
+    writer = VectorIndex(encoder=encoder(0), dtype=np.float32, **files)
+    assert writer.sync(small_store) == (small_store.n_docs, 0)
+
+    reader = VectorIndex(encoder=encoder(0), dtype=np.float32, **files)
+    before = np.array(reader.vectors)
+
+    # Todos los registros cambian de hash: se vuelven a codificar con otros vectores
+    writer.hashes = ["otro"] * len(writer.hashes)
+    writer._encoder = encoder(5)
+    assert writer.sync(small_store) == (small_store.n_docs, 0)
+
+    assert np.array_equal(reader.vectors, before)
+    assert np.all(writer.vectors[:, 1] == 5)
+    assert np.array_equal(VectorIndex(encoder=encoder(0), dtype=np.float32, **files).vectors, writer.vectors)
+    assert sorted(path.name for path in tmp_path.iterdir() if path.name.startswith("vectors")) == \
+        ["vectors.json", "vectors.npy"]
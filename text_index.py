@@ -0,0 +1,145 @@
+"""Índice invertido de texto completo con ranking BM25.
+
+Indexa título, descripción, tema y autor de cada documento del TripleStore
+con el mismo plegado de acentos que `clean_text` y un stemmer ligero del
+español. Las listas de postings se guardan en arreglos NumPy (CSR) para que
+una búsqueda sólo toque los postings de los términos de la pregunta.
+"""
+import os
+
+import numpy as np
+
+from snapshot import INDEX_DIR
+from text_utils import analyze
+
+TEXT_INDEX_FILE = os.path.join(INDEX_DIR, "text_index.npz")
+
+# Peso de cada campo en la frecuencia del término (BM25F simplificado)
+FIELD_WEIGHTS = {"title": 2.0, "subject": 1.5, "creator": 1.0, "description": 0.5}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class TextIndex:
+    def __init__(self, vocabulary, offsets, postings, weights, doc_lengths, fingerprint=None):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+        self.doc_lengths = doc_lengths
+        self.fingerprint = fingerprint
+        self.n_docs = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if self.n_docs else 0.0
+        doc_freq = np.diff(offsets)
+        self.idf = np.log(1.0 + (self.n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+    def search(self, query, k=10):
+        """Devuelve [(doc_id, score)] de los k documentos con mejor puntaje BM25."""
+        term_ids = sorted({self.vocabulary[t] for t in analyze(query) if t in self.vocabulary})
+        if not term_ids:
+            return []
+
+        docs, scores = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            posting_docs = self.postings[start:end]
+            tf = self.weights[start:end]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[posting_docs] / self.avg_length)
+            docs.append(posting_docs)
+            scores.append(self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm))
+
+        # Acumulación sólo sobre los documentos tocados, no sobre toda la colección
+        candidates, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        if len(candidates) > k:
+            top = np.argpartition(-totals, k)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -totals[top]))]
+        return [(int(candidates[i]), float(totals[i])) for i in top]
+
+    def save(self, path=TEXT_INDEX_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        # Se escribe aparte y se reemplaza: un guardado interrumpido no deja un índice truncado
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    terms=np.array(terms, dtype=str),
+                    offsets=self.offsets,
+                    postings=self.postings,
+                    weights=self.weights,
+                    doc_lengths=self.doc_lengths,
+                    fingerprint=np.array(self.fingerprint or ""),
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path=TEXT_INDEX_FILE):
+        with np.load(path) as data:
+            vocabulary = {term: i for i, term in enumerate(data["terms"].tolist())}
+            return cls(vocabulary, data["offsets"], data["postings"], data["weights"],
+                       data["doc_lengths"], str(data["fingerprint"]) or None)
+
+
+def document_fields(store, doc_id, fields=FIELD_WEIGHTS):
+    """Textos indexables de un documento (la ingesta ya descarta los valores vacíos)."""
+    return {name: store.values(name, doc_id) for name in fields}
+
+
+def build_text_index(store, field_weights=FIELD_WEIGHTS):
+    """Construye el índice BM25 a partir del TripleStore."""
+    vocabulary = {}
+    rows_term, rows_doc, rows_weight = [], [], []
+    doc_lengths = np.zeros(store.n_docs, dtype=np.float32)
+
+    for doc_id in range(store.n_docs):
+        tf = {}
+        for name, texts in document_fields(store, doc_id, field_weights).items():
+            for text in texts:
+                for token in analyze(text):
+                    tf[token] = tf.get(token, 0.0) + field_weights[name]
+                    doc_lengths[doc_id] += field_weights[name]
+        for token, weight in tf.items():
+            rows_term.append(vocabulary.setdefault(token, len(vocabulary)))
+            rows_doc.append(doc_id)
+            rows_weight.append(weight)
+
+    rows_term = np.array(rows_term, dtype=np.int32)
+    order = np.lexsort((np.array(rows_doc), rows_term))
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows_term, minlength=len(vocabulary)), out=offsets[1:])
+    return TextIndex(
+        vocabulary,
+        offsets,
+        np.array(rows_doc, dtype=np.int32)[order],
+        np.array(rows_weight, dtype=np.float32)[order],
+        doc_lengths,
+        fingerprint=store.snapshot.fingerprint,
+    )
+
+
+def load_text_index(store, path=TEXT_INDEX_FILE, save=True):
+    """Carga el índice guardado en la ingesta; lo reconstruye si no corresponde al snapshot.
+
+    Con `save=False` el índice reconstruido queda sólo en memoria (procesos que
+    no deben escribir en `indices/`, como los workers de batch_qa).
+    """
+    if os.path.exists(path):
+        index = TextIndex.load(path)
+        if index.fingerprint == store.snapshot.fingerprint:
+            return index
+    index = build_text_index(store)
+    if not save:
+        return index
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"No se pudo guardar el índice de texto en {path}: {e}")
+    return index
@@ -0,0 +1,72 @@
+"""Limpieza y normalización de texto compartida por las apps y los índices."""
+import re
+import unicodedata
+
+# Palabras vacías del español (y de las preguntas típicas) que no aportan a la búsqueda
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi cual cuales cuando como con
+contra cuanto cuantos de del desde donde durante e el ella ellas ellos en entre era eran es
+esa esas ese eso esos esta estan estas este esto estos fue fueron ha hay la las le les lo los
+mas me mi muy no nos o para pero por que quien quienes se sea ser si sin sobre son su sus tal
+tambien tiene tienen toda todas todo todos tu un una unas uno unos y ya
+documento documentos muestra muestran busca buscar existen
+foto fotos fotografia fotografias imagen imagenes
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Secuencias de UTF-8 leído como latin-1 que aparecen en exportaciones del repositorio
+MOJIBAKE = {"Ã¡": "á", "Ã©": "é", "Ã±": "ñ", "Âº": "º"}
+
+
+# Función de limpieza de texto
+def clean_text(text):
+    if not text or not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFKD", text).encode('latin-1', 'ignore').decode('utf-8', 'ignore').strip()
+    for wrong, correct in MOJIBAKE.items():
+        text = text.replace(wrong, correct)
+    return text
+
+
+def repair_mojibake(text):
+    """Deshace un UTF-8 decodificado como latin-1 ('CaÃ±ete' -> 'Cañete'); si no se puede, usa la tabla."""
+    if "Ã" not in text and "Â" not in text:
+        return text
+    try:
+        return text.encode("latin-1").decode("utf-8")
+    except UnicodeError:
+        for wrong, correct in MOJIBAKE.items():
+            text = text.replace(wrong, correct)
+        return text
+
+
+def fold_text(text):
+    """Clave de búsqueda: el mismo plegado Unicode/acentos que clean_text, en minúsculas."""
+    return clean_text(text).lower()
+
+
+def stem(word):
+    """Stemmer ligero del español (plurales y vocal final, estilo Savoy)."""
+    if len(word) < 5:
+        return word
+    if word[-1] in "oae":
+        return word[:-1]
+    if word[-1] == "s":
+        if word.endswith("eses"):
+            return word[:-2]
+        if word.endswith("ces"):
+            return word[:-3] + "z"
+        if word[-2] in "oae":
+            return word[:-2]
+    return word
+
+
+def tokenize(text):
+    """Tokens plegados (sin acentos, en minúsculas) de un texto."""
+    return _TOKEN_RE.findall(fold_text(text))
+
+
+def analyze(text, stopwords=STOPWORDS):
+    """Tokens normalizados y con stemming, tal como se guardan en el índice."""
+    return [stem(token) for token in tokenize(text) if token not in stopwords]
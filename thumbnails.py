@@ -0,0 +1,148 @@
+"""Miniaturas y vistas previas de las imágenes del dataset (dataset_extracted/ELE-*.jpg).
+
+Las derivadas se generan fuera de línea en un pool de procesos y se guardan
+en una caché direccionada por contenido (el checksum del original), así que
+un mismo escaneo nunca se procesa dos veces. Un manifiesto con mtime/tamaño
+evita recalcular el hash de los originales que no cambiaron.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from snapshot import INDEX_DIR
+
+IMAGES_DIR = "dataset_extracted"
+DERIVATIVES_DIR = os.path.join(INDEX_DIR, "derivatives")
+MANIFEST_FILE = "manifest.json"
+
+# Nombre -> (tamaño máximo en píxeles, calidad)
+DERIVATIVES = {
+    "thumb": ((200, 200), 75),
+    "preview": ((800, 800), 78),
+}
+IMAGE_FORMAT = "JPEG"  # JPEG progresivo; "WEBP" si Pillow tiene soporte para libwebp
+_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+
+def derivative_path(digest, name, cache_dir=DERIVATIVES_DIR, image_format=IMAGE_FORMAT):
+    """Ruta direccionada por contenido de una derivada."""
+    return os.path.join(cache_dir, digest[:2], f"{digest}_{name}.{_EXTENSIONS[image_format]}")
+
+
+def _file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_derivatives(source_path, digest, cache_dir=DERIVATIVES_DIR, image_format=IMAGE_FORMAT):
+    """Genera todas las derivadas de una imagen (se ejecuta en un proceso del pool)."""
+    from PIL import Image, ImageOps
+
+    outputs = {}
+    with Image.open(source_path) as image:
+        # draft() decodifica el JPEG directamente a una escala reducida: mucho más rápido
+        largest = max(size for size, _ in DERIVATIVES.values())
+        image.draft("RGB", largest)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for name, (size, quality) in sorted(DERIVATIVES.items(), key=lambda item: -item[1][0][0]):
+            path = derivative_path(digest, name, cache_dir, image_format)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            derivative = image.copy()
+            derivative.thumbnail(size, Image.LANCZOS)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            if image_format == "JPEG":
+                derivative.save(tmp_path, "JPEG", quality=quality, progressive=True, optimize=True)
+            else:
+                derivative.save(tmp_path, image_format, quality=quality, method=4)
+            os.replace(tmp_path, path)
+            outputs[name] = path
+    return outputs
+
+
+def _load_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(cache_dir, manifest):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST_FILE))
+
+
+def build_derivatives(images_dir=IMAGES_DIR, cache_dir=DERIVATIVES_DIR, image_format=IMAGE_FORMAT, max_workers=None):
+    """Genera las derivadas que falten; devuelve cuántas imágenes se procesaron."""
+    manifest = _load_manifest(cache_dir)
+    pending = []
+    for filename in sorted(os.listdir(images_dir)):
+        if not filename.lower().endswith((".jpg", ".jpeg", ".png", ".tif", ".tiff")):
+            continue
+        path = os.path.join(images_dir, filename)
+        stat = os.stat(path)
+        saved = manifest.get(filename)
+        if saved and saved["size"] == stat.st_size and saved["mtime_ns"] == stat.st_mtime_ns:
+            digest = saved["md5"]
+        else:
+            digest = _file_md5(path)
+            manifest[filename] = {"md5": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if not all(os.path.exists(derivative_path(digest, name, cache_dir, image_format)) for name in DERIVATIVES):
+            pending.append((path, digest))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(render_derivatives, path, digest, cache_dir, image_format): path
+                   for path, digest in pending}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ No se pudo procesar {futures[future]}: {e}")
+
+    _save_manifest(cache_dir, manifest)
+    return len(pending)
+
+
+class DerivativeCatalog:
+    """Busca las derivadas de un registro a partir de la lista de archivos de metadata.json."""
+
+    def __init__(self, metadata_file, cache_dir=DERIVATIVES_DIR, image_format=IMAGE_FORMAT):
+        with open(metadata_file, "r", encoding="utf-8") as f:
+            files = json.load(f)["datasetVersion"]["files"]
+        # 'ELE-0002' -> md5 de ELE-0002.jpg
+        self.checksums = {}
+        for entry in files:
+            data_file = entry["dataFile"]
+            if data_file.get("contentType", "").startswith("image/"):
+                stem = os.path.splitext(data_file["filename"])[0]
+                self.checksums[stem] = (data_file.get("checksum") or {}).get("value") or data_file.get("md5")
+        self.cache_dir = cache_dir
+        self.image_format = image_format
+
+    def for_identifier(self, identifier):
+        """{'thumb': ruta, 'preview': ruta} de un código ELE-xxxx, o None si no hay derivadas."""
+        digest = self.checksums.get(identifier)
+        if not digest:
+            return None
+        paths = {name: derivative_path(digest, name, self.cache_dir, self.image_format) for name in DERIVATIVES}
+        return paths if all(os.path.exists(p) for p in paths.values()) else None
+
+    def for_record(self, store, doc_id):
+        """Derivadas de un documento del TripleStore (a través de su dc:identifier)."""
+        for identifier in store.values("identifier", doc_id):
+            paths = self.for_identifier(identifier)
+            if paths:
+                return paths
+        return None
+
+
+if __name__ == "__main__":
+    processed = build_derivatives()
+    print(f"Derivadas generadas para {processed} imágenes en {DERIVATIVES_DIR}")
@@ -0,0 +1,200 @@
+"""Almacén de tripletas en columnas NumPy para las consultas dc: en estrella.
+
+Cada IRI y literal ya viene codificado como entero en el snapshot. Aquí se
+arma una columna por propiedad dc: indexada por id de documento (formato CSR:
+`offsets` + `values`, porque hay propiedades con varios valores) y la
+consulta `?doc dc:title ?title . OPTIONAL {...}` se resuelve con gathers
+vectorizados. Cualquier otra consulta SPARQL se deja a rdflib.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from snapshot import TYPED_LITERAL
+
+DC = "http://purl.org/dc/elements/1.1/"
+DC_PROPERTIES = ("title", "date", "creator", "subject", "description", "identifier", "language", "publisher")
+
+
+class PropertyColumn:
+    """Valores (ids de término) de una propiedad, agrupados por documento."""
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+
+class TripleStore:
+    def __init__(self, snapshot, properties=DC_PROPERTIES):
+        self.snapshot = snapshot
+        triples = snapshot.triples
+        strings = snapshot.strings
+        predicate_ids = {snapshot.lexical(t): t for t in np.unique(triples[:, 1]).tolist()}
+
+        # Documentos: sujetos con dc:title, en orden de id de término
+        title_id = predicate_ids.get(DC + "title", -1)
+        self.doc_terms = np.unique(triples[triples[:, 1] == title_id, 0])
+        self.n_docs = len(self.doc_terms)
+
+        self.columns = {}
+        for name in properties:
+            rows = triples[triples[:, 1] == predicate_ids.get(DC + name, -1)]
+            doc_pos = np.searchsorted(self.doc_terms, rows[:, 0])
+            is_doc = doc_pos < self.n_docs
+            is_doc[is_doc] = self.doc_terms[doc_pos[is_doc]] == rows[is_doc, 0]
+            doc_pos, objects = doc_pos[is_doc], rows[is_doc, 2]
+            order = np.lexsort((objects, doc_pos))
+            offsets = np.zeros(self.n_docs + 1, dtype=np.int32)
+            np.cumsum(np.bincount(doc_pos, minlength=self.n_docs), out=offsets[1:])
+            self.columns[name] = PropertyColumn(offsets, objects[order].astype(np.int32))
+
+        # Forma léxica de cada término, para decodificar resultados con un solo gather
+        self.lexical = np.array(strings, dtype=object)[snapshot.term_lex]
+
+    def doc_iri(self, doc_id):
+        return self.snapshot.lexical(self.doc_terms[doc_id])
+
+    def doc_ids_for_iris(self, iris):
+        """Convierte IRIs de documentos en ids (ignora las que no existen)."""
+        lookup = self._iri_lookup()
+        return np.array([lookup[iri] for iri in iris if iri in lookup], dtype=np.int64)
+
+    def _iri_lookup(self):
+        if not hasattr(self, "_iris"):
+            self._iris = {self.snapshot.lexical(t): i for i, t in enumerate(self.doc_terms.tolist())}
+        return self._iris
+
+    def values(self, name, doc_id):
+        """Valores (como texto) de una propiedad para un documento."""
+        column = self.columns[name]
+        return self.lexical[column.values[column.offsets[doc_id]:column.offsets[doc_id + 1]]].tolist()
+
+    def literal_ids(self, lexical, datatype):
+        """Ids de los literales tipados con esa forma léxica y ese datatype."""
+        snapshot = self.snapshot
+        ids = snapshot.term_ids(lexical)
+        ids = ids[snapshot.term_kind[ids] == TYPED_LITERAL]
+        return np.array([i for i in ids.tolist() if snapshot.strings[snapshot.term_extra[i]] == datatype], dtype=np.int32)
+
+    # 📌 Consulta en estrella
+    def star_query(self, variables, required="title", filters=None, doc_ids=None, limit=None):
+        """Equivalente a `?doc dc:<required> ?x . OPTIONAL { ?doc dc:<v> ?v } ...`.
+
+        `filters` mapea una variable a los ids de término aceptados (FILTER con
+        igualdad). Devuelve una fila por cada combinación de valores, igual que
+        la evaluación SPARQL, con None para las variables no ligadas. La
+        variable "doc" devuelve la IRI del documento.
+        """
+        filters = filters or {}
+        names = [required] + [v for v in variables if v not in (required, "doc")]
+        docs = np.arange(self.n_docs) if doc_ids is None else np.asarray(doc_ids, dtype=np.int64)
+
+        # Columnas de trabajo: (offsets por doc, valores); los filtros reducen los valores
+        columns = {}
+        for name in names:
+            column = self.columns[name]
+            if name in filters:
+                keep = np.isin(column.values, filters[name])
+                kept_before = np.concatenate(([0], np.cumsum(keep)))
+                columns[name] = (kept_before[column.offsets], column.values[keep])
+            else:
+                columns[name] = (column.offsets, column.values)
+
+        # Variables obligatorias (la requerida y las filtradas) descartan documentos
+        mandatory = [required] + [name for name in filters if name != required]
+        for name in mandatory:
+            offsets = columns[name][0]
+            docs = docs[offsets[docs + 1] > offsets[docs]]
+
+        # Producto cartesiano por documento: cada propiedad aporta max(1, n) filas
+        sizes = {}
+        row_counts = np.ones(len(docs), dtype=np.int64)
+        for name in names:
+            offsets = columns[name][0]
+            sizes[name] = offsets[docs + 1] - offsets[docs]
+            row_counts *= np.maximum(sizes[name], 1)
+        total = int(row_counts.sum())
+        if limit is not None:
+            total = min(total, limit)
+
+        row_doc = np.repeat(np.arange(len(docs)), row_counts)[:total]
+        starts = np.concatenate(([0], np.cumsum(row_counts)[:-1]))
+        local = np.arange(total) - starts[row_doc]
+
+        result = {}
+        stride = np.ones(total, dtype=np.int64)
+        for name in reversed(names):
+            offsets, values = columns[name]
+            size = sizes[name][row_doc]
+            index = (local // stride) % np.maximum(size, 1)
+            stride = stride * np.maximum(size, 1)
+            gathered = np.full(total, None, dtype=object)
+            bound = size > 0
+            gathered[bound] = self.lexical[values[offsets[docs[row_doc[bound]]] + index[bound]]]
+            result[name] = gathered
+
+        # ?doc se devuelve como la IRI del documento, igual que en SPARQL
+        result["doc"] = self.lexical[self.doc_terms[docs[row_doc]]]
+        selected = [v for v in variables if v in result]
+        return [dict(zip(selected, row)) for row in zip(*(result[v].tolist() for v in selected))]
+
+    def query(self, sparql_query):
+        """Resuelve la consulta si tiene la forma en estrella conocida; si no, None."""
+        shape = parse_star_query(sparql_query)
+        if shape is None:
+            return None
+        variables, required, filters, limit = shape
+        filter_ids = {var: self.literal_ids(lexical, datatype) for var, (lexical, datatype) in filters.items()}
+        return self.star_query(variables, required=required, filters=filter_ids, limit=limit)
+
+
+# 📌 Reconocimiento de la forma de consulta que generan las apps
+_PREFIX_RE = re.compile(r"^\s*PREFIX\s+dc:\s*<http://purl\.org/dc/elements/1\.1/>\s*", re.I)
+_SELECT_RE = re.compile(r"^SELECT\s+((?:\?\w+\s+)+)WHERE\s*\{", re.I)
+_REQUIRED_RE = re.compile(r"^\?doc\s+dc:(\w+)\s+\?(\w+)\s*\.?\s*")
+_OPTIONAL_RE = re.compile(r"^OPTIONAL\s*\{\s*\?doc\s+dc:(\w+)\s+\?(\w+)\s*\.?\s*\}\s*", re.I)
+_FILTER_RE = re.compile(r'^FILTER\s*\(\s*\?(\w+)\s*=\s*"([^"\\]*)"\^\^<([^>]+)>\s*\)\s*', re.I)
+_END_RE = re.compile(r"^\}\s*(?:LIMIT\s+(\d+))?\s*$", re.I)
+
+
+@lru_cache(maxsize=256)
+def parse_star_query(sparql_query):
+    """Devuelve (variables, requerida, filtros, limit) o None si no es la forma en estrella."""
+    rest = _PREFIX_RE.sub("", sparql_query, count=1).strip()
+    match = _SELECT_RE.match(rest)
+    if not match:
+        return None
+    variables = tuple(v.lstrip("?") for v in match.group(1).split())
+    rest = rest[match.end():].strip()
+
+    match = _REQUIRED_RE.match(rest)
+    if not match or match.group(1) != match.group(2):
+        return None
+    required = match.group(1)
+    rest = rest[match.end():]
+
+    bound = {required}
+    filters = {}
+    while True:
+        if (match := _OPTIONAL_RE.match(rest)):
+            if match.group(1) != match.group(2):
+                return None
+            bound.add(match.group(1))
+        elif (match := _FILTER_RE.match(rest)):
+            filters[match.group(1)] = (match.group(2), match.group(3))
+        else:
+            break
+        rest = rest[match.end():]
+
+    match = _END_RE.match(rest)
+    if not match or not set(variables) <= bound | {"doc"} or not set(filters) <= bound:
+        return None
+    if not bound <= set(DC_PROPERTIES):
+        return None
+    limit = int(match.group(1)) if match.group(1) else None
+    return variables, required, filters, limit
@@ -0,0 +1,214 @@
+"""Índice vectorial persistente e incremental de los registros IRA (dataset.ttl).
+
+Los embeddings (all-MiniLM-L6-v2 en CPU) se guardan en un .npy abierto con
+memmap, una fila por registro, y un .json con la IRI y el hash de contenido
+de cada fila. Al arrancar sólo se mapea el archivo; `sync` codifica
+únicamente los registros nuevos o modificados y libera las filas de los
+eliminados para reutilizarlas.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from snapshot import INDEX_DIR
+from text_index import document_fields
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+VECTORS_FILE = os.path.join(INDEX_DIR, "vectors.npy")
+VECTORS_META_FILE = os.path.join(INDEX_DIR, "vectors.json")
+BATCH_SIZE = 64
+SCAN_BLOCK = 8192
+
+_encoders = {}
+
+
+def sentence_encoder(model_name=MODEL_NAME):
+    """Codificador de sentence-transformers en CPU (se carga una vez por proceso)."""
+    if model_name not in _encoders:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name, device="cpu")
+        _encoders[model_name] = lambda texts: model.encode(
+            texts, batch_size=BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True
+        )
+    return _encoders[model_name]
+
+
+def record_text(store, doc_id):
+    """Texto que se embebe por registro: título, descripción, tema y autor."""
+    fields = document_fields(store, doc_id)
+    return ". ".join(text for name in ("title", "description", "subject", "creator") for text in fields[name])
+
+
+class VectorIndex:
+    def __init__(self, vectors_file=VECTORS_FILE, meta_file=VECTORS_META_FILE,
+                 model_name=MODEL_NAME, encoder=None, dtype=np.float16):
+        self.vectors_file = vectors_file
+        self.meta_file = meta_file
+        self.model_name = model_name
+        self._encoder = encoder
+        self.dtype = np.dtype(dtype)
+        self.ids = []
+        self.hashes = []
+        self.vectors = None
+        self._open()
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = sentence_encoder(self.model_name)
+        return self._encoder
+
+    def _open(self):
+        """Mapea el índice guardado (si existe y es del mismo modelo)."""
+        try:
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        if meta.get("model") != self.model_name or meta.get("dtype") != self.dtype.str:
+            return
+        self.ids, self.hashes = meta["ids"], meta["hashes"]
+        self.vectors = np.load(self.vectors_file, mmap_mode="r")
+        self._refresh_lookup()
+
+    def _refresh_lookup(self):
+        self.rows = {record_id: row for row, record_id in enumerate(self.ids) if record_id is not None}
+        self.valid = np.array([record_id is not None for record_id in self.ids], dtype=bool)
+
+    def __len__(self):
+        return len(self.rows) if self.vectors is not None else 0
+
+    def _encode(self, texts):
+        embeddings = []
+        for start in range(0, len(texts), BATCH_SIZE):
+            embeddings.append(np.asarray(self.encoder(texts[start:start + BATCH_SIZE]), dtype=np.float32))
+        return np.vstack(embeddings)
+
+    # 📌 Actualización incremental
+    def sync(self, store):
+        """Agrega/actualiza los registros nuevos o modificados y quita los eliminados.
+
+        Devuelve (agregados o actualizados, eliminados).
+        """
+        current = {}
+        for doc_id in range(store.n_docs):
+            text = record_text(store, doc_id)
+            current[store.doc_iri(doc_id)] = (hashlib.sha1(text.encode("utf-8")).hexdigest(), text)
+
+        ids = list(self.ids)
+        hashes = list(self.hashes)
+        rows = dict(self.rows) if self.vectors is not None else {}
+        removed = [record_id for record_id in rows if record_id not in current]
+        for record_id in removed:
+            row = rows.pop(record_id)
+            ids[row], hashes[row] = None, None
+        changed = [record_id for record_id, (h, _) in current.items()
+                   if record_id not in rows or hashes[rows[record_id]] != h]
+        if not changed and not removed:
+            return 0, 0
+
+        embeddings = self._encode([current[record_id][1] for record_id in changed]) if changed else None
+
+        # Filas destino: la propia si se actualiza, luego huecos libres, luego nuevas al final
+        free_rows = [row for row, record_id in enumerate(ids) if record_id is None]
+        targets = []
+        for record_id in changed:
+            if record_id in rows:
+                targets.append(rows[record_id])
+            elif free_rows:
+                targets.append(free_rows.pop(0))
+            else:
+                targets.append(len(ids))
+                ids.append(None)
+                hashes.append(None)
+            ids[targets[-1]] = record_id
+            hashes[targets[-1]] = current[record_id][0]
+
+        dim = embeddings.shape[1] if embeddings is not None else self.vectors.shape[1]
+        self._write(ids, hashes, targets, embeddings, dim)
+        return len(changed), len(removed)
+
+    def _write(self, ids, hashes, targets, embeddings, dim):
+        """Escribe todas las filas en un archivo temporal y lo reemplaza de una vez.
+
+        El archivo publicado nunca se modifica en su lugar: otros procesos (app,
+        batch_qa) pueden tenerlo mapeado. El .json va después, cuando las filas
+        que describe ya están en disco.
+        """
+        directory = os.path.dirname(self.vectors_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        old_rows = 0 if self.vectors is None else len(self.vectors)
+        fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(self.vectors_file) + ".", suffix=".tmp", dir=directory)
+        os.close(fd)
+        try:
+            vectors = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=self.dtype, shape=(len(ids), dim))
+            if old_rows and self.vectors.shape[1] == dim:
+                vectors[:old_rows] = self.vectors
+            if embeddings is not None:
+                vectors[np.array(targets)] = embeddings.astype(self.dtype)
+            vectors.flush()
+            del vectors
+            os.replace(tmp_file, self.vectors_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+        fd, tmp_meta = tempfile.mkstemp(prefix=os.path.basename(self.meta_file) + ".", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dtype": self.dtype.str, "ids": ids, "hashes": hashes}, f)
+        os.replace(tmp_meta, self.meta_file)
+
+        self.ids, self.hashes = ids, hashes
+        self.vectors = np.load(self.vectors_file, mmap_mode="r")
+        self._refresh_lookup()
+
+    # 📌 Consulta
+    def search(self, query, k=10, budget_ms=None):
+        """Top-k [(IRI, similitud)] para una pregunta.
+
+        Con `budget_ms` el recorrido por bloques se corta al agotar el presupuesto
+        y se devuelve lo mejor encontrado hasta ese momento.
+        """
+        if not len(self):
+            return []
+        deadline = None if budget_ms is None else time.perf_counter() + budget_ms / 1000
+        query_vector = np.asarray(self.encoder([query]), dtype=np.float32)[0]
+
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, len(self.vectors), SCAN_BLOCK):
+            block = np.asarray(self.vectors[start:start + SCAN_BLOCK], dtype=np.float32)
+            scores = block @ query_vector
+            scores[~self.valid[start:start + SCAN_BLOCK]] = -np.inf
+            rows = np.concatenate((best_rows, np.arange(start, start + len(block))))
+            scores = np.concatenate((best_scores, scores))
+            keep = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            best_rows, best_scores = rows[keep], scores[keep]
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+
+        order = np.argsort(-best_scores, kind="stable")
+        return [(self.ids[best_rows[i]], float(best_scores[i])) for i in order if np.isfinite(best_scores[i])]
+
+
+def open_vector_index(encoder=None):
+    """Mapea el índice guardado tal como está, sin sincronizarlo ni escribir; None si no hay.
+
+    Para procesos que sólo leen (los workers de batch_qa): el proceso principal ya lo puso al día.
+    """
+    index = VectorIndex(encoder=encoder)
+    return index if len(index) else None
+
+
+def load_vector_index(store, encoder=None):
+    """Abre el índice guardado y lo pone al día con el TripleStore."""
+    index = VectorIndex(encoder=encoder)
+    added, removed = index.sync(store)
+    if added or removed:
+        print(f"Índice vectorial actualizado: {added} registros codificados, {removed} eliminados")
+    return index
@@ -0,0 +1,106 @@
+"""Índice ordenado de años (dc:date) y extracción de rangos de años en lenguaje natural."""
+import re
+
+import numpy as np
+
+from text_utils import fold_text
+
+MIN_YEAR, MAX_YEAR = 1000, 2999
+
+_YEAR = r"(1[0-9]\d{2}|20\d{2})"
+_ROMAN = {"xv": 15, "xvi": 16, "xvii": 17, "xviii": 18, "xix": 19, "xx": 20, "xxi": 21}
+
+# Patrones en orden de prioridad; cada uno devuelve (inicio, fin) inclusivo, None = abierto
+_RANGE_PATTERNS = [
+    (re.compile(rf"\bentre\s+(?:los\s+anos\s+|el\s+ano\s+)?{_YEAR}\s+y\s+(?:el\s+)?{_YEAR}\b"),
+     lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b(?:de|desde)\s+(?:el\s+ano\s+)?{_YEAR}\s+(?:a|al|hasta)\s+(?:el\s+)?{_YEAR}\b"),
+     lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b{_YEAR}\s*(?:-|–|/)\s*{_YEAR}\b"),
+     lambda m: (int(m[1]), int(m[2]))),
+    (re.compile(rf"\b(?:decada\s+de(?:\s+los)?|anos)\s+(?:de\s+)?(1[0-9]\d0|20\d0)s?\b"),
+     lambda m: (int(m[1]), int(m[1]) + 9)),
+    (re.compile(r"\bsiglo\s+(xv|xvi|xvii|xviii|xix|xx|xxi)\b"),
+     lambda m: ((_ROMAN[m[1]] - 1) * 100, (_ROMAN[m[1]] - 1) * 100 + 99)),
+    (re.compile(rf"\b(?:antes\s+de(?:l)?|anteriores\s+a|previos\s+a)\s+(?:el\s+ano\s+)?{_YEAR}\b"),
+     lambda m: (None, int(m[1]) - 1)),
+    (re.compile(rf"\b(?:hasta|a\s+lo\s+sumo)\s+(?:el\s+ano\s+)?{_YEAR}\b"),
+     lambda m: (None, int(m[1]))),
+    (re.compile(rf"\b(?:despues\s+de(?:l)?|posteriores\s+a|tras)\s+(?:el\s+ano\s+)?{_YEAR}\b"),
+     lambda m: (int(m[1]) + 1, None)),
+    (re.compile(rf"\b(?:desde|a\s+partir\s+de(?:l)?)\s+(?:el\s+ano\s+)?{_YEAR}\b"),
+     lambda m: (int(m[1]), None)),
+    (re.compile(r"\b(1[89]\d{2}|20\d{2})\b"),
+     lambda m: (int(m[1]), int(m[1]))),
+]
+
+
+# 📌 Extraer rango de años de la pregunta
+def extract_year_range(question):
+    """Devuelve (inicio, fin) inclusivo o None; un extremo None significa abierto."""
+    text = fold_text(question or "")
+    for pattern, to_range in _RANGE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            start, end = to_range(match)
+            if start is not None and end is not None and start > end:
+                start, end = end, start
+            return start, end
+    return None
+
+
+def remove_year_expressions(question):
+    """La pregunta (plegada) sin la expresión de años que reconoce extract_year_range."""
+    text = fold_text(question or "")
+    for pattern, _ in _RANGE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return (text[:match.start()] + " " + text[match.end():]).strip()
+    return text
+
+
+def describe_year_range(year_range):
+    """Texto para los resúmenes: 'el año 1906', 'el periodo 1900-1910', etc."""
+    if year_range is None:
+        return "todos los años"
+    start, end = year_range
+    if start is None:
+        return f"los años anteriores a {end + 1}"
+    if end is None:
+        return f"los años posteriores a {start - 1}"
+    if start == end:
+        return f"el año {start}"
+    return f"el periodo {start}-{end}"
+
+
+class YearIndex:
+    """Años ordenados con sus postings (id de documento y id del literal dc:date)."""
+
+    def __init__(self, years, doc_ids, date_terms):
+        self.years = years
+        self.doc_ids = doc_ids
+        self.date_terms = date_terms
+
+    def _slice(self, start, end):
+        lo = 0 if start is None else np.searchsorted(self.years, start, side="left")
+        hi = len(self.years) if end is None else np.searchsorted(self.years, end, side="right")
+        return slice(lo, hi)
+
+    def documents(self, start=None, end=None):
+        """Ids de documento con algún dc:date en [inicio, fin] (búsqueda binaria)."""
+        return np.unique(self.doc_ids[self._slice(start, end)])
+
+    def date_term_ids(self, start=None, end=None):
+        """Ids de los literales dc:date dentro del rango, para filtrar la consulta en estrella."""
+        return np.unique(self.date_terms[self._slice(start, end)])
+
+
+def build_year_index(store):
+    """Construye el índice a partir de la columna dc:date del TripleStore."""
+    column = store.columns["date"]
+    doc_ids = np.repeat(np.arange(store.n_docs), column.counts)
+    lexical = store.lexical[column.values]
+    years = np.array([int(v[:4]) if v[:4].isdigit() else -1 for v in lexical], dtype=np.int32)
+    valid = (years >= MIN_YEAR) & (years <= MAX_YEAR)
+    order = np.argsort(years[valid], kind="stable")
+    return YearIndex(years[valid][order], doc_ids[valid][order], column.values[valid][order])